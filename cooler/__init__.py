@@ -13,7 +13,9 @@ A cool place to store your Hi-C.
 __version__ = '0.6.0-dev'
 __format_version__ = 2
 
-from .api import Cooler, get, info, chroms, bins, pixels, matrix, annotate
+from .api import (Cooler, MultiCooler, get, get_record_batch, info, chroms,
+                  bins, pixels, matrix, matrix_slices,
+                  matrix_lookup, matrix_band, annotate)
 from .util import read_chromsizes, binnify
 from .io import open_hdf5
 from . import util
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio interface
+~~~~~~~~~~~~~~~~~
+
+Coroutine wrappers around the query API for use in asyncio applications.
+Queries run on a thread pool so that they do not block the event loop.
+h5py serializes all HDF5 calls on a global lock, so reads from the pool do
+not run in parallel with each other; only the NumPy and pandas work around
+them can overlap. Requires Python 3.5+.
+
+"""
+from __future__ import division, print_function
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+
+import numpy as np
+import h5py
+
+from .api import Cooler, MultiCooler
+from .util import parse_region
+
+
+def _running_loop():
+    # get_running_loop is Python 3.7+; get_event_loop is deprecated inside
+    # coroutines on newer versions
+    get_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+    return get_loop()
+
+
+class AsyncCooler(object):
+    """
+    Asyncio facade for a cooler or multires cooler file.
+
+    The file is opened once. Queries are dispatched to an executor to keep
+    the event loop responsive, and identical queries that are in flight at
+    the same time are coalesced into a single read whose result is shared by
+    all callers, so results must be treated as read-only.
+
+    The executor does not make I/O concurrent: every HDF5 read takes the
+    global h5py lock, so reads are serialized whatever the number of
+    threads. ``max_reads`` bounds the number of queries queued on the
+    executor at a time. Queries larger than the bulk thresholds may use at
+    most ``max_bulk`` of those slots, so that large genome-wide queries
+    cannot hold up small interactive ones such as tile requests.
+
+    Parameters
+    ----------
+    fp : str
+        Path to a cooler or multires cooler file.
+    executor : concurrent.futures.Executor, optional
+        Executor to run queries on. By default, a thread pool of
+        ``max_reads`` threads owned by this object is used.
+    max_reads : int, optional
+        Maximum number of queries on the file dispatched to the executor at a
+        time.
+    max_bulk : int, optional
+        Maximum number of bulk queries on the file dispatched at a time. Must
+        be smaller than ``max_reads``.
+    bulk_pixels : int, optional
+        Matrix queries whose rectangle is estimated to span more than this
+        number of bin pairs are bulk queries.
+    bulk_rows : int, optional
+        Table queries for more than this number of rows are bulk queries.
+
+    Examples
+    --------
+    >>> async with AsyncCooler('test.mcool') as ac:  # doctest: +SKIP
+    ...     tiles = await ac.tiles(2, [(0, 0), (0, 1)])
+    ...     mat = await ac.matrix('chr1', resolution=10000)
+
+    """
+    def __init__(self, fp, executor=None, max_reads=4, max_bulk=1,
+                 bulk_pixels=2**22, bulk_rows=2**22):
+        if max_bulk >= max_reads:
+            raise ValueError("max_bulk must be smaller than max_reads")
+        self.fp = fp
+        self._h5 = h5py.File(fp, 'r')
+        self.is_multires = 'max-zoom' in self._h5.attrs
+        if self.is_multires:
+            self._mc = MultiCooler(self._h5)
+        else:
+            self._cooler = Cooler(self._h5)
+
+        self._own_executor = executor is None
+        if executor is None:
+            executor = ThreadPoolExecutor(max_reads)
+        self._executor = executor
+        self.max_reads = max_reads
+        self.max_bulk = max_bulk
+        self.bulk_pixels = bulk_pixels
+        self.bulk_rows = bulk_rows
+
+        # semaphores are created lazily, inside the running event loop
+        self._read_sem = None
+        self._bulk_sem = None
+        self._inflight = {}
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown(wait=True)
+        self._h5.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def _get_cooler(self, zoom=None, resolution=None):
+        if not self.is_multires:
+            if zoom is not None or resolution is not None:
+                raise ValueError("Not a multires file.")
+            return self._cooler
+        if zoom is None and resolution is None:
+            zoom = self._mc.max_zoom
+        return self._mc.level(zoom, resolution)
+
+    def _is_bulk_region(self, c, region, region2):
+        # estimate the number of bins spanned from the genomic extent
+        chromsizes = c._chromsizes
+        bins_per_bp = c._info['nbins'] / chromsizes.sum()
+        n = []
+        for r in (region, region2 if region2 is not None else region):
+            chrom, start, end = parse_region(r, chromsizes)
+            n.append((end - start) * bins_per_bp)
+        return n[0] * n[1] > self.bulk_pixels
+
+    async def _run(self, bulk, func):
+        if self._read_sem is None:
+            self._read_sem = asyncio.Semaphore(self.max_reads)
+            self._bulk_sem = asyncio.Semaphore(self.max_bulk)
+        loop = _running_loop()
+        if bulk:
+            async with self._bulk_sem:
+                async with self._read_sem:
+                    return await loop.run_in_executor(self._executor, func)
+        async with self._read_sem:
+            return await loop.run_in_executor(self._executor, func)
+
+    async def _submit(self, key, bulk, func):
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._run(bulk, func))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # a cancelled caller must not cancel the shared read
+        return await asyncio.shield(fut)
+
+    async def info(self, zoom=None, resolution=None):
+        """ File information and metadata """
+        c = self._get_cooler(zoom, resolution)
+        key = ('info', zoom, resolution)
+        return await self._submit(key, False, lambda: c.info)
+
+    async def chroms(self):
+        """ Chromosome table """
+        c = self._get_cooler()
+        return await self._submit(('chroms',), False, lambda: c.chroms()[:])
+
+    async def bins(self, lo=0, hi=None, zoom=None, resolution=None):
+        """ Range of rows of the bin table """
+        c = self._get_cooler(zoom, resolution)
+        hi = c._info['nbins'] if hi is None else hi
+        key = ('bins', lo, hi, zoom, resolution)
+        bulk = (hi - lo) > self.bulk_rows
+        return await self._submit(key, bulk, lambda: c.bins()[lo:hi])
+
+    async def pixels(self, lo=0, hi=None, join=False, zoom=None,
+                     resolution=None):
+        """ Range of rows of the pixel table """
+        c = self._get_cooler(zoom, resolution)
+        hi = c._info['nnz'] if hi is None else hi
+        key = ('pixels', lo, hi, join, zoom, resolution)
+        bulk = (hi - lo) > self.bulk_rows
+        return await self._submit(key, bulk, lambda: c.pixels(join)[lo:hi])
+
+    async def matrix(self, region, region2=None, balance=False,
+                     as_pixels=False, join=False, zoom=None,
+                     resolution=None):
+        """ Contact matrix of a genomic region or pair of regions
+
+        See :meth:`cooler.Cooler.matrix` for the options.
+
+        """
+        c = self._get_cooler(zoom, resolution)
+        key = ('matrix', region, region2, balance, as_pixels, join, zoom,
+               resolution)
+        bulk = self._is_bulk_region(c, region, region2)
+        sel = c.matrix(balance=balance, as_pixels=as_pixels, join=join)
+        return await self._submit(key, bulk, partial(sel.fetch, region, region2))
+
+    async def tiles(self, zoom, tile_ids, dtype=np.float16,
+                    mask_filtered=True):
+        """ Dense higlass tiles of a multires file as binary buffers
+
+        See :func:`cooler.contrib.higlass.get_tile_buffers`.
+
+        """
+        from .contrib.higlass import get_tile_buffers
+        if not self.is_multires:
+            raise ValueError("Tiles require a multires file.")
+        tile_ids = tuple(tuple(int(x) for x in t) for t in tile_ids)
+        key = ('tiles', int(zoom), tile_ids, np.dtype(dtype).str,
+               mask_filtered)
+        func = partial(get_tile_buffers, self._mc, zoom, tile_ids,
+                       dtype, mask_filtered)
+        return await self._submit(key, False, func)
@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
+from collections import OrderedDict
 import json
 import six
 
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, dia_matrix
 import numpy as np
 import pandas
 import h5py
 
-from .core import RangeSelector1D, RangeSelector2D, TriuReader, query_rect
+from .core import (RangeSelector1D, RangeSelector2D, TriuReader, RowBlockReader,
+                   query_rect)
 from .util import parse_region
 from .io import open_hdf5
 
@@ -91,6 +93,58 @@ def get(h5, lo=0, hi=None, fields=None, convert_enum=True, **kwargs):
             **kwargs)
 
 
+def get_record_batch(h5, lo=0, hi=None, fields=None):
+    """
+    Query a range of rows from a table as an Arrow record batch. Requires
+    pyarrow.
+
+    Parameters
+    ----------
+    h5 : ``h5py.Group`` or any dict-like of array-likes
+        Handle to an HDF5 group containing only 1D datasets or any similar
+        collection of 1D datasets or arrays
+    lo, hi : int, optional
+        Range of rows to select from the table.
+    fields : str or sequence of str, optional
+        Column or list of columns to query. Defaults to all available columns.
+
+    Returns
+    -------
+    pyarrow.RecordBatch
+
+    Notes
+    -----
+    HDF5 enum datasets are returned as dictionary-encoded columns and ASCII
+    datasets are converted to Unicode. Other columns are built from the
+    arrays read from disk without going through pandas.
+
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("Arrow export requires pyarrow.")
+
+    grp = h5
+    if fields is None:
+        fields = list(grp.keys())
+    elif isinstance(fields, six.string_types):
+        fields = [fields]
+
+    arrays = []
+    for field in fields:
+        dset = grp[field]
+        dt = h5py.check_dtype(enum=dset.dtype)
+        if dt is not None:
+            arrays.append(pyarrow.DictionaryArray.from_arrays(
+                dset[lo:hi], sorted(dt, key=dt.__getitem__), ordered=True))
+        elif dset.dtype.type == np.string_:
+            arrays.append(pyarrow.array(dset[lo:hi].astype('U')))
+        else:
+            arrays.append(pyarrow.array(dset[lo:hi]))
+
+    return pyarrow.RecordBatch.from_arrays(arrays, list(fields))
+
+
 def _region_to_extent(h5, chrom_ids, region, binsize):
     chrom, start, end = region
     cid = chrom_ids[chrom]
@@ -149,6 +203,14 @@ class Cooler(object):
             self._chromsizes = _ct.set_index('name')['length']
             self._chromids = dict(zip(_ct['name'], range(len(_ct))))
             self._info = info(h5)
+        self._abs_bin_starts = None
+        self._bin_columns = {}
+
+    def __getstate__(self):
+        # don't ship the cached bin table to worker processes
+        state = self.__dict__.copy()
+        state['_bin_columns'] = {}
+        return state
 
     def _get_index(self, name):
         with open_hdf5(self.fp, **self.kwargs) as h5:
@@ -200,6 +262,102 @@ class Cooler(object):
                 h5, self._chromids,
                 parse_region(region, self._chromsizes))
 
+    def abs_bin_starts(self):
+        """ Absolute genomic start coordinates of the bins
+
+        Absolute coordinates are measured from the start of the first
+        chromosome, with chromosomes laid end to end in file order. The array
+        is built on the first call and cached.
+
+        Returns
+        -------
+        1D array of length ``nbins + 1``
+            Start coordinates of the bins, followed by the total length of
+            the genome.
+
+        """
+        if self._abs_bin_starts is None:
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                chrom_ids = h5['bins']['chrom'][:]
+                starts = h5['bins']['start'][:]
+            cum_lengths = np.r_[0, np.cumsum(self._chromsizes.values)]
+            self._abs_bin_starts = np.r_[
+                cum_lengths[chrom_ids] + starts, cum_lengths[-1]]
+        return self._abs_bin_starts
+
+    def abs_coord_to_bin(self, abs_pos):
+        """ Bin IDs containing absolute genomic coordinates
+
+        Absolute coordinates are measured from the start of the first
+        chromosome, with chromosomes laid end to end in file order. The
+        lookup table of ``abs_bin_starts`` is built on the first call and
+        later calls do no file I/O.
+
+        Parameters
+        ----------
+        abs_pos : int or array-like of int
+            Absolute genomic coordinates.
+
+        Returns
+        -------
+        int or array of int
+            Bin IDs. Coordinates past the end of the genome map to ``nbins``
+            and negative coordinates map to 0.
+
+        """
+        bin_ids = np.searchsorted(self.abs_bin_starts(), abs_pos, 'right') - 1
+        return np.clip(bin_ids, 0, self._info['nbins'])
+
+    def bin_table(self, columns=None):
+        """ Cached bin table
+
+        Columns are read from the file on first use and then kept in memory,
+        so that joins and balancing of many selections don't decode the bin
+        table again. The chrom column is categorical and integer coordinate
+        columns are stored as int32 if their values fit.
+
+        Parameters
+        ----------
+        columns : sequence of str, optional
+            Columns to return. Defaults to chrom, start and end. Other
+            columns, e.g. balancing weights, are loaded when first requested.
+
+        Returns
+        -------
+        DataFrame indexed by bin ID
+
+        """
+        if columns is None:
+            columns = ['chrom', 'start', 'end']
+        missing = [name for name in columns if name not in self._bin_columns]
+        if missing:
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                for name in missing:
+                    col = get(h5['bins'], 0, None, name)
+                    if name in ('start', 'end') and \
+                            col.dtype.kind == 'i' and col.dtype.itemsize > 4 \
+                            and (not len(col) or
+                                 col.max() <= np.iinfo(np.int32).max):
+                        col = col.astype(np.int32)
+                    col.index = pandas.RangeIndex(len(col))
+                    self._bin_columns[name] = col
+        return pandas.DataFrame(
+            OrderedDict((name, self._bin_columns[name]) for name in columns),
+            columns=list(columns), copy=False)
+
+    def bin_table_memory_usage(self):
+        """ Memory used by the cached bin table columns
+
+        Returns
+        -------
+        Series of sizes in bytes, indexed by column name
+
+        """
+        return pandas.Series(
+            OrderedDict((name, col.memory_usage(index=False, deep=True))
+                        for name, col in self._bin_columns.items()),
+            dtype=np.int64)
+
     @property
     def info(self):
         """ File information and metadata
@@ -228,7 +386,12 @@ class Cooler(object):
             with open_hdf5(self.fp, **self.kwargs) as h5:
                 return chroms(h5, lo, hi, fields)
 
-        return RangeSelector1D(None, _slice, None, self._info['nchroms'])
+        def _slice_arrow(fields, lo, hi):
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                return chroms(h5, lo, hi, fields, as_arrow=True)
+
+        return RangeSelector1D(None, _slice, None, self._info['nchroms'],
+                               _slice_arrow)
 
     def bins(self):
         """ Bin table selector
@@ -243,12 +406,17 @@ class Cooler(object):
             with open_hdf5(self.fp, **self.kwargs) as h5:
                 return bins(h5, lo, hi, fields)
 
+        def _slice_arrow(fields, lo, hi):
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                return bins(h5, lo, hi, fields, as_arrow=True)
+
         def _fetch(region):
             with open_hdf5(self.fp, **self.kwargs) as h5:
                 return region_to_extent(h5, self._chromids,
                                         parse_region(region, self._chromsizes))
 
-        return RangeSelector1D(None, _slice, _fetch, self._info['nbins'])
+        return RangeSelector1D(None, _slice, _fetch, self._info['nbins'],
+                               _slice_arrow)
 
     def pixels(self, join=False):
         """ Pixel table selector
@@ -266,8 +434,13 @@ class Cooler(object):
         """
 
         def _slice(fields, lo, hi):
+            bins = self.bin_table() if join else None
             with open_hdf5(self.fp, **self.kwargs) as h5:
-                return pixels(h5, lo, hi, fields, join)
+                return pixels(h5, lo, hi, fields, join, bins=bins)
+
+        def _slice_arrow(fields, lo, hi):
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                return pixels(h5, lo, hi, fields, join, as_arrow=True)
 
         def _fetch(region):
             with open_hdf5(self.fp, **self.kwargs) as h5:
@@ -278,7 +451,12 @@ class Cooler(object):
                 hi = h5['indexes']['bin1_offset'][i1]
                 return lo, hi
 
-        return RangeSelector1D(None, _slice, _fetch, self._info['nnz'])
+        def _boundaries():
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                return h5['indexes']['bin1_offset'][:]
+
+        return RangeSelector1D(None, _slice, _fetch, self._info['nnz'],
+                               _slice_arrow, _boundaries)
 
     def matrix(self, field=None, balance=False, as_pixels=False, join=False,
                ignore_index=True, max_chunk=500000000):
@@ -311,8 +489,14 @@ class Cooler(object):
 
         def _slice(field, i0, i1, j0, j1):
             with open_hdf5(self.fp, **self.kwargs) as h5:
+                columns = []
+                if as_pixels and join:
+                    columns += ['chrom', 'start', 'end']
+                if balance and 'weight' in h5['bins']:
+                    columns += ['weight']
+                bins = self.bin_table(columns) if columns else None
                 return matrix(h5, i0, i1, j0, j1, field, balance, as_pixels,
-                    join, ignore_index, max_chunk)
+                    join, ignore_index, max_chunk, bins=bins)
 
         def _fetch(region, region2=None):
             with open_hdf5(self.fp, **self.kwargs) as h5:
@@ -324,7 +508,247 @@ class Cooler(object):
                 j0, j1 = region_to_extent(h5, self._chromids, region2)
                 return i0, i1, j0, j1
 
-        return RangeSelector2D(field, _slice, _fetch, (self._info['nbins'],) * 2)
+        def _slice_many(field, rects):
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                bins = None
+                if balance and 'weight' in h5['bins']:
+                    bins = self.bin_table(['weight'])
+                return matrix_slices(h5, rects, field, balance, max_chunk,
+                                     bins=bins)
+
+        def _fetch_many(regions, regions2):
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                rects = []
+                for region1, region2 in zip(regions, regions2):
+                    region1 = parse_region(region1, self._chromsizes)
+                    region2 = parse_region(region2, self._chromsizes)
+                    i0, i1 = region_to_extent(h5, self._chromids, region1)
+                    j0, j1 = region_to_extent(h5, self._chromids, region2)
+                    rects.append((i0, i1, j0, j1))
+                return rects
+
+        def _lookup(field, i, j, balance=balance):
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                bins = None
+                if balance and 'weight' in h5['bins']:
+                    bins = self.bin_table(['weight'])
+                return matrix_lookup(h5, i, j, field, balance, max_chunk,
+                                     bins=bins)
+
+        def _band(field, i0, i1, max_diag, dense):
+            with open_hdf5(self.fp, **self.kwargs) as h5:
+                bins = None
+                if balance and 'weight' in h5['bins']:
+                    bins = self.bin_table(['weight'])
+                return matrix_band(h5, i0, i1, max_diag, field, balance,
+                                   dense, max_chunk, bins=bins)
+
+        return RangeSelector2D(field, _slice, _fetch,
+                               (self._info['nbins'],) * 2,
+                               None if as_pixels else _slice_many,
+                               _fetch_many, _lookup,
+                               None if as_pixels else _band)
+
+
+class MultiCooler(object):
+    """
+    Interface to a multi-resolution cooler file.
+
+    The file is opened once for the lifetime of the object. Each zoom level is
+    exposed as a :class:`Cooler` which is created on first access and then
+    cached, along with the chromosome table, cumulative chromosome lengths and
+    the indexes of each level.
+
+    Parameters
+    ----------
+    fp : str or h5py.File
+        File path or open handle to a multires cooler file.
+
+    Attributes
+    ----------
+    filename : str
+        Path of the file on disk.
+
+    Notes
+    -----
+    Levels are stored in groups named by zoom level, from "0" for the
+    coarsest to ``max-zoom`` for the finest. The root attributes map each
+    zoom level to its bin size.
+
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        if isinstance(fp, six.string_types):
+            self._own_fh = True
+            self._h5 = h5py.File(fp, 'r')
+        else:
+            self._own_fh = False
+            self._h5 = fp
+        self.filename = self._h5.file.filename
+
+        max_zoom = self._h5.attrs.get('max-zoom')
+        if max_zoom is None:
+            raise ValueError('The `max-zoom` attribute is missing.')
+        self.max_zoom = int(max_zoom)
+        self._resolutions = {}
+        for zoom in range(self.max_zoom + 1):
+            if str(zoom) in self._h5.attrs:
+                binsize = self._h5.attrs[str(zoom)]
+            else:
+                binsize = self._h5[str(zoom)].attrs['bin-size']
+            self._resolutions[zoom] = int(binsize)
+        self._zooms = {v: k for k, v in six.iteritems(self._resolutions)}
+
+        # all levels share the same chromosome table
+        self._chromtable = chroms(self._h5[str(self.max_zoom)])
+        self._chromsizes = self._chromtable.set_index('name')['length']
+        self._chrom_cum_lengths = np.r_[0, np.cumsum(self._chromsizes.values)]
+
+        self._levels = {}
+        self._indexes = {}
+        self._bin_columns = {}
+
+    def close(self):
+        if self._own_fh:
+            self._h5.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def resolutions(self):
+        """ Mapping of zoom level to bin size """
+        return dict(self._resolutions)
+
+    @property
+    def chromnames(self):
+        return list(self._chromsizes.index)
+
+    @property
+    def chromsizes(self):
+        return self._chromsizes
+
+    @property
+    def chrom_cum_lengths(self):
+        """ Genomic offsets of the chromosomes, followed by the total length """
+        return self._chrom_cum_lengths
+
+    def chroms(self):
+        return self._chromtable
+
+    def _get_zoom(self, zoom=None, resolution=None):
+        if (zoom is None) == (resolution is None):
+            raise ValueError("Provide exactly one of zoom or resolution.")
+        if resolution is not None:
+            try:
+                return self._zooms[int(resolution)]
+            except KeyError:
+                raise ValueError(
+                    "No zoom level at resolution {}".format(resolution))
+        zoom = int(zoom)
+        if zoom not in self._resolutions:
+            raise ValueError("No zoom level {}".format(zoom))
+        return zoom
+
+    def zoom(self, resolution):
+        """ Zoom level at a given bin size """
+        return self._get_zoom(resolution=resolution)
+
+    def binsize(self, zoom):
+        """ Bin size of a given zoom level """
+        return self._resolutions[self._get_zoom(zoom=zoom)]
+
+    def level(self, zoom=None, resolution=None):
+        """ Cached :class:`Cooler` of a zoom level
+
+        Parameters
+        ----------
+        zoom : int, optional
+            Zoom level.
+        resolution : int, optional
+            Bin size of the zoom level, as an alternative to ``zoom``.
+
+        Returns
+        -------
+        Cooler
+
+        """
+        zoom = self._get_zoom(zoom, resolution)
+        if zoom not in self._levels:
+            self._levels[zoom] = Cooler(self._h5[str(zoom)])
+        return self._levels[zoom]
+
+    def index(self, name, zoom=None, resolution=None):
+        """ Cached index array of a zoom level
+
+        Parameters
+        ----------
+        name : str
+            Name of the index, e.g. 'chrom_offset' or 'bin1_offset'.
+        zoom : int, optional
+            Zoom level.
+        resolution : int, optional
+            Bin size of the zoom level, as an alternative to ``zoom``.
+
+        Returns
+        -------
+        1D array
+
+        """
+        zoom = self._get_zoom(zoom, resolution)
+        key = (zoom, name)
+        if key not in self._indexes:
+            self._indexes[key] = self._h5[str(zoom)]['indexes'][name][:]
+        return self._indexes[key]
+
+    def bin_column(self, name, zoom=None, resolution=None):
+        """ Cached column of the bin table of a zoom level
+
+        Parameters
+        ----------
+        name : str
+            Name of the column, e.g. 'weight'.
+        zoom : int, optional
+            Zoom level.
+        resolution : int, optional
+            Bin size of the zoom level, as an alternative to ``zoom``.
+
+        Returns
+        -------
+        1D array
+
+        """
+        zoom = self._get_zoom(zoom, resolution)
+        key = (zoom, name)
+        if key not in self._bin_columns:
+            self._bin_columns[key] = self._h5[str(zoom)]['bins'][name][:]
+        return self._bin_columns[key]
+
+    def pixel_span(self, lo, hi, fields, zoom=None, resolution=None):
+        """ Columns of a range of rows of the pixel table of a zoom level
+
+        Parameters
+        ----------
+        lo, hi : int
+            Range of rows to read.
+        fields : sequence of str
+            Columns to read.
+        zoom : int, optional
+            Zoom level.
+        resolution : int, optional
+            Bin size of the zoom level, as an alternative to ``zoom``.
+
+        Returns
+        -------
+        list of 1D arrays
+
+        """
+        zoom = self._get_zoom(zoom, resolution)
+        grp = self._h5[str(zoom)]['pixels']
+        return [grp[field][lo:hi] for field in fields]
 
 
 def info(h5):
@@ -352,7 +776,7 @@ def info(h5):
     return d
 
 
-def chroms(h5, lo=0, hi=None, fields=None):
+def chroms(h5, lo=0, hi=None, fields=None, as_arrow=False):
     """
     Table describing the chromosomes/scaffolds/contigs used.
     They appear in the same order they occur in the heatmap.
@@ -365,6 +789,8 @@ def chroms(h5, lo=0, hi=None, fields=None):
         Range of rows to select from the table.
     fields : sequence of str, optional
         Subset of columns to select from table.
+    as_arrow : bool, optional
+        Return a ``pyarrow.RecordBatch`` instead of a DataFrame.
 
     Returns
     -------
@@ -375,10 +801,12 @@ def chroms(h5, lo=0, hi=None, fields=None):
         fields = (pandas.Index(['name', 'length'])
                         .append(pandas.Index(h5['chroms'].keys()))
                         .drop_duplicates())
+    if as_arrow:
+        return get_record_batch(h5['chroms'], lo, hi, fields)
     return get(h5['chroms'], lo, hi, fields)
 
 
-def bins(h5, lo=0, hi=None, fields=None):
+def bins(h5, lo=0, hi=None, fields=None, as_arrow=False):
     """
     Table describing the genomic bins that make up the axes of the heatmap.
 
@@ -390,6 +818,9 @@ def bins(h5, lo=0, hi=None, fields=None):
         Range of rows to select from the table.
     fields : sequence of str, optional
         Subset of columns to select from table.
+    as_arrow : bool, optional
+        Return a ``pyarrow.RecordBatch`` with a dictionary-encoded chrom
+        column instead of a DataFrame.
 
     Returns
     -------
@@ -400,6 +831,8 @@ def bins(h5, lo=0, hi=None, fields=None):
         fields = (pandas.Index(['chrom', 'start', 'end'])
                         .append(pandas.Index(h5['bins'].keys()))
                         .drop_duplicates())
+    if as_arrow:
+        return get_record_batch(h5['bins'], lo, hi, fields)
     return get(h5['bins'], lo, hi, fields)
 
 
@@ -427,6 +860,88 @@ def annotate(pixels, bins, replace=True):
     DataFrame
 
     """
+    # bin IDs are row positions in the bin table: join them by taking rows
+    # of the bin columns, unless the merge would introduce missing values or
+    # resolve column name collisions
+    taken = []
+    for suffix, col in (('1', 'bin1_id'), ('2', 'bin2_id')):
+        if col not in pixels:
+            continue
+        ids = pixels[col].values
+        if isinstance(bins, pandas.DataFrame):
+            # positions are looked up from the index labels
+            right = bins
+        elif len(bins) > len(pixels):
+            lo = ids.min() if len(ids) else 0
+            hi = ids.max() + 1 if len(ids) else 0
+            lo = 0 if np.isnan(lo) else lo
+            hi = 0 if np.isnan(hi) else hi
+            right = bins[lo:hi]
+        else:
+            right = bins[:]
+        positions = _bin_positions(right.index, ids)
+        if positions is None or set(right.columns) & set(pixels.columns):
+            return _annotate_merge(pixels, bins, replace)
+        taken.append((suffix, right, positions))
+
+    if len(taken) == 2:
+        names = [(name, name + suffix)
+                 for suffix, right, _ in taken for name in right.columns]
+    else:
+        names = [(name, name) for _, right, _ in taken
+                 for name in right.columns]
+    new_names = [new for _, new in names]
+    if (len(set(new_names)) != len(new_names) or
+            set(new_names) & set(pixels.columns)):
+        return _annotate_merge(pixels, bins, replace)
+
+    data = OrderedDict()
+    i = 0
+    for _, right, positions in taken:
+        for name in right.columns:
+            data[names[i][1]] = _take_column(right[name], positions)
+            i += 1
+    keep = [col for col in pixels.columns
+            if not (replace and col in ('bin1_id', 'bin2_id'))]
+    for col in keep:
+        data[col] = pixels[col].values
+
+    if not data:
+        return pandas.DataFrame(index=pixels.index)
+    return pandas.DataFrame(data, index=pixels.index)
+
+
+def _bin_positions(index, ids):
+    # row positions of bin IDs in a table indexed by bin ID, or None if
+    # some are not found
+    if not len(ids):
+        return np.zeros(0, dtype=int)
+    if ids.dtype.kind not in 'iu':
+        return None
+    n = len(index)
+    if isinstance(index, pandas.RangeIndex) and index.step == 1:
+        positions = ids - index.start
+    elif n and index.is_monotonic_increasing and index.is_unique and \
+            index[n - 1] - index[0] == n - 1:
+        positions = ids - index[0]
+    elif index.is_unique:
+        positions = index.get_indexer(ids)
+    else:
+        return None
+    if (positions < 0).any() or (positions >= n).any():
+        return None
+    return positions
+
+
+def _take_column(column, positions):
+    if hasattr(column, 'cat'):
+        return pandas.Categorical.from_codes(
+            column.cat.codes.values.take(positions),
+            dtype=column.dtype)
+    return column.values.take(positions)
+
+
+def _annotate_merge(pixels, bins, replace=True):
     ncols = len(pixels.columns)
 
     if 'bin1_id' in pixels:
@@ -475,7 +990,38 @@ def annotate(pixels, bins, replace=True):
     return pixels
 
 
-def pixels(h5, lo=0, hi=None, fields=None, join=True):
+def _join_record_batch(h5, batch):
+    # same column layout as annotate: bin columns on the left, IDs dropped
+    import pyarrow
+    names, arrays = [], []
+    for suffix in ('1', '2'):
+        if 'bin' + suffix + '_id' not in batch.schema.names:
+            continue
+        ids = batch.column(batch.schema.get_field_index(
+            'bin' + suffix + '_id')).to_numpy()
+        if len(ids):
+            lo, hi = ids.min(), ids.max() + 1
+        else:
+            lo = hi = 0
+        bins = get_record_batch(h5['bins'], lo, hi, ['chrom', 'start', 'end'])
+        for name, column in zip(bins.schema.names, bins.columns):
+            names.append(name + suffix)
+            if isinstance(column, pyarrow.DictionaryArray):
+                column = pyarrow.DictionaryArray.from_arrays(
+                    column.indices.to_numpy()[ids - lo], column.dictionary,
+                    ordered=True)
+            else:
+                column = pyarrow.array(column.to_numpy()[ids - lo])
+            arrays.append(column)
+    for name, column in zip(batch.schema.names, batch.columns):
+        if name not in ('bin1_id', 'bin2_id'):
+            names.append(name)
+            arrays.append(column)
+    return pyarrow.RecordBatch.from_arrays(arrays, names)
+
+
+def pixels(h5, lo=0, hi=None, fields=None, join=True, as_arrow=False,
+           bins=None):
     """
     Table describing the nonzero upper triangular pixels of the Hi-C contact
     heatmap.
@@ -491,6 +1037,12 @@ def pixels(h5, lo=0, hi=None, fields=None, join=True):
     join : bool, optional
         Whether or not to expand bin ID columns to their full bin description
         (chrom, start, end). Default is True.
+    as_arrow : bool, optional
+        Return a ``pyarrow.RecordBatch`` instead of a DataFrame. Joined chrom
+        columns are dictionary encoded.
+    bins : DataFrame, optional
+        Bin table with chrom, start and end columns to join against instead
+        of reading it from the file, e.g. from ``Cooler.bin_table``.
 
     Returns
     -------
@@ -502,17 +1054,26 @@ def pixels(h5, lo=0, hi=None, fields=None, join=True):
                         .append(pandas.Index(h5['pixels'].keys()))
                         .drop_duplicates())
 
+    if as_arrow:
+        batch = get_record_batch(h5['pixels'], lo, hi, fields)
+        if join:
+            batch = _join_record_batch(h5, batch)
+        return batch
+
     df = get(h5['pixels'], lo, hi, fields)
 
     if join:
-        bins = get(h5['bins'], 0, None, ['chrom', 'start', 'end'])
+        if bins is None:
+            bins = get(h5['bins'], 0, None, ['chrom', 'start', 'end'])
+        else:
+            bins = bins[['chrom', 'start', 'end']]
         df = annotate(df, bins)
 
     return df
 
 
 def matrix(h5, i0, i1, j0, j1, field=None, balance=False, as_pixels=False, 
-           join=True, ignore_index=True, max_chunk=500000000):
+           join=True, ignore_index=True, max_chunk=500000000, bins=None):
     """
     Two-dimensional range query on the Hi-C contact heatmap.
     Returns either a rectangular sparse ``coo_matrix`` or a data frame of upper
@@ -542,6 +1103,10 @@ def matrix(h5, i0, i1, j0, j1, field=None, balance=False, as_pixels=False,
     ignore_index : bool, optional
         If requesting pixels, don't populate the index column with the pixel
         IDs to improve performance. Default is True.
+    bins : DataFrame, optional
+        Bin table to take balancing weights and joined bin columns from
+        instead of reading them from the file, e.g. from
+        ``Cooler.bin_table``.
 
     Returns
     -------
@@ -564,21 +1129,32 @@ def matrix(h5, i0, i1, j0, j1, field=None, balance=False, as_pixels=False,
             "calculate balancing weights.")
 
     if as_pixels:
-        index = None if ignore_index else triu_reader.index_col(i0, i1, j0, j1)
-        i, j, v = triu_reader.query(i0, i1, j0, j1)
+        if ignore_index:
+            i, j, v = triu_reader.query(i0, i1, j0, j1)
+            index = None
+        else:
+            i, j, v, index = triu_reader.query(i0, i1, j0, j1,
+                                               return_index=True)
 
         cols = ['bin1_id', 'bin2_id', field]
         df = pandas.DataFrame(dict(zip(cols, [i, j, v])),
                               columns=cols, index=index)
 
         if balance:
-            weights = get(h5['bins'], min(i0, j0), max(i1, j1), ['weight'])
+            if bins is None:
+                weights = get(h5['bins'], min(i0, j0), max(i1, j1), ['weight'])
+            else:
+                weights = bins[['weight']]
             df2 = annotate(df, weights)
             df['balanced'] = df2['weight1'] * df2['weight2'] * df2[field]
 
         if join:
-            bins = get(h5['bins'], min(i0, j0), max(i1, j1), ['chrom', 'start', 'end'])
-            df = annotate(df, bins)
+            if bins is None:
+                coords = get(h5['bins'], min(i0, j0), max(i1, j1),
+                             ['chrom', 'start', 'end'])
+            else:
+                coords = bins[['chrom', 'start', 'end']]
+            df = annotate(df, coords)
 
         return df
 
@@ -587,9 +1163,242 @@ def matrix(h5, i0, i1, j0, j1, field=None, balance=False, as_pixels=False,
         mat = coo_matrix((v, (i-i0, j-j0)), (i1-i0, j1-j0))
 
         if balance:
-            weights = h5['bins']['weight']
+            if bins is None:
+                weights = h5['bins']['weight']
+            else:
+                weights = bins['weight'].values
             bias1 = weights[i0:i1]
             bias2 = bias1 if (i0, i1) == (j0, j1) else weights[j0:j1]
             mat.data = bias1[mat.row] * bias2[mat.col] * mat.data
 
         return mat
+
+
+def _triu_rows(i0, i1, j0, j1):
+    # rows of the pixel table read by query_rect for a non-empty rectangle:
+    # the rows of whichever axis range starts first, up to the end of the
+    # other one if it is nested inside
+    return min(i0, j0), min(i1, j1)
+
+
+def _row_bands(spans, offsets, first, max_chunk):
+    # group the row spans of the rectangles, sorted by first row, into bands
+    # of overlapping or adjacent spans holding at most max_chunk pixels;
+    # offsets is the bin1_offset index starting at row first
+    bands = []
+    for k in sorted(spans, key=lambda k: spans[k]):
+        lo, hi = spans[k]
+        if bands:
+            band_lo, band_hi, members = bands[-1]
+            new_hi = max(band_hi, hi)
+            n = offsets[new_hi - first] - offsets[band_lo - first]
+            if lo <= band_hi and n <= max_chunk:
+                bands[-1] = (band_lo, new_hi, members + [k])
+                continue
+        bands.append((lo, hi, [k]))
+    return bands
+
+
+def matrix_slices(h5, rects, field=None, balance=False,
+                  max_chunk=500000000, bins=None):
+    """
+    Query many rectangles of the Hi-C contact heatmap at once.
+
+    Only the upper triangle rows that a rectangle needs are read: the rows of
+    whichever of its axis ranges comes first along the diagonal. Rectangles
+    whose row spans overlap or touch are grouped into bands of rows, and each
+    band of the pixel table is read from disk once and shared by the
+    rectangles in it.
+
+    Parameters
+    ----------
+    h5 : ``h5py.File`` or ``h5py.Group``
+        Open handle to cooler file.
+    rects : sequence of (i0, i1, j0, j1)
+        Bin ranges of the query rectangles.
+    field : str, optional
+        Which column of the pixel table to fill the matrices with. By default,
+        the 'count' column is used.
+    balance : bool, optional
+        Whether to apply pre-calculated matrix balancing weights to the
+        selections. Default is False.
+    max_chunk : int, optional
+        Maximum number of pixels in a band. Rectangles spanning more pixels
+        than this are queried on their own.
+    bins : DataFrame, optional
+        Bin table to take balancing weights from, e.g. from
+        ``Cooler.bin_table``.
+
+    Returns
+    -------
+    list of coo_matrix, in the order of ``rects``
+
+    """
+    if field is None:
+        field = 'count'
+    if balance and 'weight' not in h5['bins']:
+        raise ValueError(
+            "No column 'bins/weight' found. Use ``cooler.ice`` to "
+            "calculate balancing weights.")
+    if not len(rects):
+        return []
+
+    if balance:
+        if bins is None:
+            weights = h5['bins']['weight'][:]
+        else:
+            weights = bins['weight'].values
+
+    mats = [None] * len(rects)
+    spans = {}
+    for k, (i0, i1, j0, j1) in enumerate(rects):
+        if i1 > i0 and j1 > j0:
+            spans[k] = _triu_rows(i0, i1, j0, j1)
+        else:
+            mats[k] = coo_matrix((max(i1 - i0, 0), max(j1 - j0, 0)))
+    if not spans:
+        return mats
+
+    first = min(lo for lo, hi in spans.values())
+    last = max(hi for lo, hi in spans.values())
+    offsets = h5['indexes']['bin1_offset'][first:last + 1]
+
+    bin2_dset = h5['pixels']['bin2_id']
+    data_dset = h5['pixels'][field]
+    for lo, hi, members in _row_bands(spans, offsets, first, max_chunk):
+        edges = offsets[lo - first:hi - first + 1]
+        p0, p1 = edges[0], edges[-1]
+        if p1 - p0 > max_chunk:
+            query = TriuReader(h5, field, max_chunk).query
+        else:
+            query = RowBlockReader(lo, edges - p0,
+                                   bin2_dset[p0:p1], data_dset[p0:p1]).query
+        for k in members:
+            i0, i1, j0, j1 = rects[k]
+            i, j, v = query_rect(query, i0, i1, j0, j1)
+            mat = coo_matrix((v, (i - i0, j - j0)), (i1 - i0, j1 - j0))
+            if balance:
+                mat.data = weights[i0:i1][mat.row] * \
+                           weights[j0:j1][mat.col] * mat.data
+            mats[k] = mat
+    return mats
+
+
+def matrix_lookup(h5, i, j, field=None, balance=False, max_chunk=500000000,
+                  bins=None):
+    """
+    Values of the Hi-C contact heatmap at scattered pairs of bins.
+
+    Parameters
+    ----------
+    h5 : ``h5py.File`` or ``h5py.Group``
+        Open handle to cooler file.
+    i, j : array-like of int
+        Row and column bin IDs of the elements. Pairs in the lower triangle
+        are looked up in the upper triangle.
+    field : str, optional
+        Which column of the pixel table to look up. By default, the 'count'
+        column is used.
+    balance : bool, optional
+        Whether to apply pre-calculated matrix balancing weights. Default is
+        False.
+    max_chunk : int, optional
+        Maximum number of pixels read at once.
+    bins : DataFrame, optional
+        Bin table to take balancing weights from, e.g. from
+        ``Cooler.bin_table``.
+
+    Returns
+    -------
+    1D array of values, 0 where there is no pixel. If balanced, pixels of
+    filtered bins are NaN.
+
+    """
+    if field is None:
+        field = 'count'
+    if balance and 'weight' not in h5['bins']:
+        raise ValueError(
+            "No column 'bins/weight' found. Use ``cooler.ice`` to "
+            "calculate balancing weights.")
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    v, found = TriuReader(h5, field, max_chunk).lookup(
+        np.minimum(i, j), np.maximum(i, j), return_found=True)
+    if balance:
+        if bins is None:
+            weights = h5['bins']['weight'][:]
+        else:
+            weights = bins['weight'].values
+        # missing pixels stay 0, as in fetch and band
+        v = v.astype(float)
+        v[found] *= weights[i[found]] * weights[j[found]]
+    return v
+
+
+def matrix_band(h5, i0, i1, max_diag, field=None, balance=False, dense=False,
+                max_chunk=500000000, bins=None):
+    """
+    Diagonal band of a square block of the Hi-C contact heatmap: the elements
+    ``(i, j)`` with ``i0 <= i <= j < i1`` and ``j - i < max_diag``.
+
+    Parameters
+    ----------
+    h5 : ``h5py.File`` or ``h5py.Group``
+        Open handle to cooler file.
+    i0, i1 : int
+        Bin range of the block along both axes.
+    max_diag : int
+        Number of diagonals of the band, starting from the main diagonal.
+    field : str, optional
+        Which column of the pixel table to fill the band with. By default,
+        the 'count' column is used.
+    balance : bool, optional
+        Whether to apply pre-calculated matrix balancing weights. Default is
+        False.
+    dense : bool, optional
+        Return a dense array of shape ``(i1 - i0, max_diag)`` whose element
+        ``[r, d]`` is the matrix element ``(i0 + r, i0 + r + d)``. Elements
+        past the end of the block are NaN. Default is False.
+    max_chunk : int, optional
+        Maximum number of pixels read at once.
+    bins : DataFrame, optional
+        Bin table to take balancing weights from, e.g. from
+        ``Cooler.bin_table``.
+
+    Returns
+    -------
+    dia_matrix of shape ``(i1 - i0, i1 - i0)`` holding the upper band, or
+    2D array if ``dense``
+
+    Notes
+    -----
+    At most ``max_diag`` pixels are read from each row of the block, so the
+    cost scales with the size of the band rather than of the block.
+
+    """
+    if field is None:
+        field = 'count'
+    if balance and 'weight' not in h5['bins']:
+        raise ValueError(
+            "No column 'bins/weight' found. Use ``cooler.ice`` to "
+            "calculate balancing weights.")
+
+    i, j, v = TriuReader(h5, field, max_chunk).band(i0, i1, max_diag)
+    if balance:
+        if bins is None:
+            weights = h5['bins']['weight'][i0:i1]
+        else:
+            weights = bins['weight'].values[i0:i1]
+        v = weights[i - i0] * weights[j - i0] * v
+
+    n = i1 - i0
+    if dense:
+        arr = np.zeros((n, max_diag))
+        rows = np.arange(n)[:, None]
+        arr[rows + np.arange(max_diag)[None, :] >= n] = np.nan
+        arr[i - i0, j - i] = v
+        return arr
+    # DIA storage: data[d, c] holds the element (c - d, c)
+    data = np.zeros((max_diag, n), dtype=v.dtype)
+    data[j - i, j - i0] = v
+    return dia_matrix((data, np.arange(max_diag)), shape=(n, n))
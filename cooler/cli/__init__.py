@@ -28,5 +28,8 @@ from . import (
     balance,
     dump,
     show,
-    info
+    info,
+    zoomify,
+    tiles,
+    serve
 )
@@ -11,7 +11,8 @@ import h5py
 import click
 from . import cli
 from .. import util
-from ..io import create, TabixAggregator, HDF5Aggregator, PairixAggregator
+from ..io import (create, TabixAggregator, HDF5Aggregator, PairixAggregator,
+                  PairsAggregator)
 
 
 @cli.group()
@@ -179,3 +180,101 @@ def pairix(bins, pairs_path, cool_path, metadata, assembly):
 
     with h5py.File(cool_path, 'w') as h5:
         create(h5, chroms, lengths, bins, iterator, metadata, assembly)   
+
+
+@cload.command()
+@click.argument(
+    "bins",
+    type=str,
+    metavar="BINS")
+@click.argument(
+    "pairs_path",
+    type=click.Path(exists=True, allow_dash=True),
+    metavar="PAIRS_PATH")
+@click.argument(
+    "cool_path",
+    metavar="COOL_PATH")
+@click.option(
+    "--metadata",
+    help="Path to JSON file containing user metadata.")
+@click.option(
+    "--assembly",
+    help="Name of genome assembly (e.g. hg19, mm10)")
+@click.option(
+    "--chrom1", "-c1",
+    help="chrom1 field number in the input file (starting from 1)",
+    default=1)
+@click.option(
+    "--pos1", "-p1",
+    help="pos1 field number",
+    default=2)
+@click.option(
+    "--chrom2", "-c2",
+    help="chrom2 field number",
+    default=4)
+@click.option(
+    "--pos2", "-p2",
+    help="pos2 field number",
+    default=5)
+@click.option(
+    "--chunksize",
+    help="Number of input lines to parse at a time.",
+    type=int,
+    default=int(10e6),
+    show_default=True)
+@click.option(
+    "--unsorted",
+    help="Input is not grouped by chrom1, or has contacts in both "
+         "orientations. Binned contacts are aggregated out "
+         "of core by spilling sorted runs of pixels to temporary files.",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--max-pixels",
+    help="Number of pixels to hold in memory before spilling a sorted run to "
+         "disk. Only applies to --unsorted.",
+    type=int,
+    default=int(50e6),
+    show_default=True)
+@click.option(
+    "--tmpdir",
+    help="Directory for temporary files. Only applies to --unsorted.",
+    type=click.Path(exists=True, file_okay=False))
+@add_arg_help
+def pairs(bins, pairs_path, cool_path, metadata, assembly, chrom1, pos1,
+          chrom2, pos2, chunksize, unsorted, max_pixels, tmpdir):
+    """
+    Bin a contact list file by streaming it without an index.
+
+    {}
+
+    The contact list may be gzipped. Use '-' to read from stdin. Lines
+    starting with '#' are ignored. Contacts sharing the same chrom1 should
+    occupy contiguous lines, and each contact should have chrom2 no earlier
+    than chrom1 either in the order of the bin table or in the order of the
+    file (e.g. the output of 'cooler csort'). Otherwise use the --unsorted
+    option.
+
+    """
+    chromsizes, bins = _parse_bins(bins)
+    chroms, lengths = list(chromsizes.index), list(chromsizes.values)
+
+    if metadata is not None:
+        with open(metadata, 'r') as f:
+            metadata = json.load(f)
+
+    if pairs_path == '-':
+        pairs_path = sys.stdin
+
+    iterator = PairsAggregator(
+        pairs_path, chromsizes, bins, chunksize,
+        is_sorted=not unsorted,
+        chrom1_field=chrom1 - 1,
+        pos1_field=pos1 - 1,
+        chrom2_field=chrom2 - 1,
+        pos2_field=pos2 - 1,
+        max_pixels=max_pixels,
+        tmpdir=tmpdir)
+
+    with h5py.File(cool_path, 'w') as h5:
+        create(h5, chroms, lengths, bins, iterator, metadata, assembly)
@@ -1,14 +1,195 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
+from collections import OrderedDict
+import subprocess
 import gzip
 import sys
 
 import numpy as np
 import pandas as pd
+import h5py
 
 import click
 from . import cli
 from .. import api
+from ..util import cmd_exists, read_ahead
+
+
+ARROW_FORMATS = ('parquet', 'arrow', 'feather')
+
+
+def _preload_bins(bins):
+    """Bin table columns as arrays indexable by bin ID."""
+    columns = {}
+    for name in bins.columns:
+        col = bins[name]
+        if hasattr(col, 'cat'):
+            columns[name] = (col.cat.codes.values.astype(np.int32),
+                             [str(x) for x in col.cat.categories])
+        else:
+            columns[name] = col.values
+    return columns
+
+
+def _take(column, ids):
+    if isinstance(column, tuple):
+        codes, categories = column
+        return codes[ids], categories
+    return column[ids]
+
+
+def _read_pixels(cool_path, lo, hi):
+    with h5py.File(cool_path, 'r') as h5:
+        grp = h5['pixels']
+        fields = ['bin1_id', 'bin2_id', 'count']
+        fields += [name for name in grp.keys() if name not in fields]
+        return OrderedDict((name, grp[name][lo:hi]) for name in fields)
+
+
+def _join_chunk(sel, bins, join, balanced, annotate):
+    """
+    Join bin attributes onto a chunk of pixels by indexing the preloaded bin
+    columns with the bin IDs. The columns are laid out as ``api.annotate``
+    would lay them out.
+
+    Parameters
+    ----------
+    sel : OrderedDict
+        Pixel table columns.
+
+    Returns
+    -------
+    Lists of column names and columns. Categorical columns are given as pairs
+    of codes and categories. Names may repeat, e.g. when annotating with the
+    chrom column.
+
+    """
+    bin1 = sel['bin1_id']
+    bin2 = sel['bin2_id']
+    names, columns = [], []
+
+    if join:
+        for suffix, ids in (('1', bin1), ('2', bin2)):
+            for name in ('chrom', 'start', 'end'):
+                names.append(name + suffix)
+                columns.append(_take(bins[name], ids))
+        fields = [name for name in sel if name not in ('bin1_id', 'bin2_id')]
+    else:
+        fields = list(sel)
+    for name in fields:
+        names.append(name)
+        columns.append(sel[name])
+
+    if balanced:
+        names.append('balanced')
+        columns.append(bins['weight'][bin1] * bins['weight'][bin2] *
+                       sel['count'])
+
+    if annotate:
+        for suffix, ids in (('1', bin1), ('2', bin2)):
+            for name in annotate:
+                names.append(name + suffix)
+                columns.append(_take(bins[name], ids))
+
+    return names, columns
+
+
+def _to_text(names, columns):
+    columns = [pd.Categorical.from_codes(*col) if isinstance(col, tuple)
+               else col for col in columns]
+    df = pd.DataFrame(dict(enumerate(columns)),
+                      columns=np.arange(len(columns)))
+    df.columns = names
+    text = df.to_csv(None, sep='\t', index=False, header=False,
+                     float_format='%g')
+    return text.encode('utf-8')
+
+
+def _to_record_batch(names, columns):
+    import pyarrow
+    arrays = []
+    for col in columns:
+        if isinstance(col, tuple):
+            codes, categories = col
+            arrays.append(pyarrow.DictionaryArray.from_arrays(
+                codes, categories, ordered=True))
+        else:
+            arrays.append(pyarrow.array(col))
+    return pyarrow.RecordBatch.from_arrays(arrays, names)
+
+
+class _PixelFormatter(object):
+    """
+    Worker formatting chunks of pixels for output.
+
+    A task is a pair ``('span', (lo, hi))`` of a range of rows of the pixel
+    table to read from the file, or ``('data', columns)`` of pixel columns
+    that were already read.
+
+    Parameters
+    ----------
+    cool_path : str
+        Path to the cooler file.
+    bins : dict
+        Bin table columns as returned by ``_preload_bins``.
+    join, balanced : bool
+        Join the bin coordinates and append balanced values.
+    annotate : list of str
+        Bin columns to join onto the pixels.
+    fmt : str
+        Output format.
+
+    """
+    def __init__(self, cool_path, bins, join, balanced, annotate, fmt):
+        self.cool_path = cool_path
+        self.bins = bins
+        self.join = join
+        self.balanced = balanced
+        self.annotate = annotate
+        self.fmt = fmt
+
+    def __call__(self, task):
+        kind, payload = task
+        if kind == 'span':
+            lo, hi = payload
+            sel = _read_pixels(self.cool_path, lo, hi)
+        else:
+            sel = payload
+        names, columns = _join_chunk(sel, self.bins, self.join,
+                                     self.balanced, self.annotate)
+        if self.fmt in ARROW_FORMATS:
+            return _to_record_batch(names, columns)
+        return _to_text(names, columns)
+
+
+def _open_arrow_writer(f, fmt, schema):
+    import pyarrow
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(f, schema)
+    elif fmt == 'feather':
+        return pyarrow.ipc.new_file(f, schema)
+    return pyarrow.ipc.new_stream(f, schema)
+
+
+def _open_output(out, nproc):
+    """
+    Open the output as a binary stream. Gzipped output is piped through pigz
+    or bgzip if available.
+
+    """
+    if out is None or out == '-':
+        return getattr(sys.stdout, 'buffer', sys.stdout), None
+    if out.endswith('.gz'):
+        for cmd in (['pigz', '-c', '-p', str(nproc)],
+                    ['bgzip', '-c', '-@', str(nproc)]):
+            if cmd_exists(cmd[0]):
+                fh = open(out, 'wb')
+                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=fh)
+                fh.close()
+                return proc.stdin, proc
+        return gzip.open(out, 'wb'), None
+    return open(out, 'wb'), None
 
 
 @cli.command()
@@ -68,12 +249,27 @@ from .. import api
          "Provide a comma separated list of column names (no spaces). "
          "The merged columns will be suffixed by '1' and '2' accordingly.",
     default='')
+@click.option(
+    "--format", "-f", "fmt",
+    help="Output format. 'parquet', 'arrow' (IPC stream) and 'feather' "
+         "(IPC file) write typed columns with dictionary-encoded chromosome "
+         "names and require pyarrow.",
+    type=click.Choice(['tsv', 'parquet', 'arrow', 'feather']),
+    default='tsv',
+    show_default=True)
+@click.option(
+    "--nproc", "-p",
+    help="Number of processes used to join and format pixel chunks.",
+    type=int,
+    default=1,
+    show_default=True)
 @click.option(
     "--out", "-o",
-    help="Output text file If .gz extension is detected, file is written "
-         "using zlib. Default behavior is to stream to stdout.")
+    help="Output text file If .gz extension is detected, file is compressed "
+         "with pigz or bgzip if available, otherwise with zlib. Default "
+         "behavior is to stream to stdout.")
 def dump(cool_path, table, chunksize, range, range2, join,
-         annotate, balanced, header, out):
+         annotate, balanced, header, fmt, nproc, out):
     """
     Dump a contact matrix.
     Print the contents of a COOL file to tab-delimited text.
@@ -83,14 +279,6 @@ def dump(cool_path, table, chunksize, range, range2, join,
     """
     c = api.Cooler(cool_path)
 
-    # output stream
-    if out is None or out == '-':
-        f = sys.stdout
-    elif out.endswith('.gz'):
-        f = gzip.open(out, 'wt')
-    else:
-        f = open(out, 'wt')
-
     # choose the source
     if table == 'chroms':
         selector = c.chroms()
@@ -108,67 +296,106 @@ def dump(cool_path, table, chunksize, range, range2, join,
             selector = c.pixels()
             n = c.info['nnz']
 
-        # load all the bins
-        bins = c.bins()[:]
-        if balanced and 'weight' not in bins.columns:
+        # load the bin columns once; bin IDs are row positions
+        bin_columns = list(c.bins().columns)
+        if balanced and 'weight' not in bin_columns:
             print('Balancing weights not found', file=sys.stderr)
             sys.exit(1)
+        extra_fields = annotate.split(',') if annotate else []
+        missing = [name for name in extra_fields if name not in bin_columns]
+        if missing:
+            print('Column not found:\n {}'.format(missing))
+            sys.exit(1)
+        needed = ['chrom', 'start', 'end'] if join else []
+        needed += ['weight'] if balanced else []
+        needed += [name for name in extra_fields if name not in needed]
+        bins = c.bin_table(needed)
 
         if chunksize is None:
-            chunksize = len(bins)
+            chunksize = c.info['nbins']
+
+    if fmt in ARROW_FORMATS:
+        try:
+            import pyarrow
+        except ImportError:
+            print('The {} format requires pyarrow.'.format(fmt),
+                  file=sys.stderr)
+            sys.exit(1)
+
+    f, proc = _open_output(out, nproc)
 
     # write in chunks
     edges = np.arange(0, n+chunksize, chunksize)
     edges[-1] = n
+    spans = list(zip(edges[:-1], edges[1:]))
 
-    first = True
-
-    for lo, hi in zip(edges[:-1], edges[1:]):
-
-        sel = selector[lo:hi]
-
+    pool = None
+    if table == 'pixels':
+        formatter = _PixelFormatter(cool_path, _preload_bins(bins), join,
+                                    balanced, extra_fields, fmt)
         if range:
-            sel = sel.copy()  # suppress pandas warning
-
-        if table == 'pixels':
-
-            if annotate:
-                extra_fields = annotate.split(',')
-                try:
-                    extra_cols = bins[extra_fields]
-                except KeyError as e:
-                    print('Column not found:\n {}'.format(e))
-                    sys.exit(1)
-                extra = api.annotate(sel[['bin1_id', 'bin2_id']], extra_cols)
-
-            if balanced:
-                df = api.annotate(sel, bins[['weight']])
-                sel['balanced'] = df['weight1'] * df['weight2'] * sel['count']
-
-            if join:
-                sel = api.annotate(sel, bins[['chrom', 'start', 'end']])
-
-            if annotate:
-                sel = pd.concat([sel, extra], axis=1)
+            tasks = (('data', OrderedDict((name, selector[name].values[lo:hi])
+                                          for name in selector.columns))
+                     for lo, hi in spans)
+            empty = OrderedDict((name, selector[name].values[:0])
+                                for name in selector.columns)
+        else:
+            tasks = (('span', span) for span in spans)
+            empty = _read_pixels(cool_path, 0, 0)
+        if nproc > 1:
+            from multiprocess import Pool
+            pool = Pool(nproc)
+            # the formatter and its bin columns are sent with each batch of
+            # tasks, so send a few large batches
+            chunks = pool.imap(formatter, tasks,
+                               chunksize=max(1, len(spans) // (4 * nproc)))
+        else:
+            if not range:
+                # overlap reading the next spans with formatting and writing
+                tasks = (('data', sel) for sel in read_ahead(
+                    (_read_pixels(cool_path, lo, hi) for lo, hi in spans),
+                    depth=2))
+            chunks = map(formatter, tasks)
+        names, columns = _join_chunk(empty, formatter.bins, join, balanced,
+                                     extra_fields)
+    else:
+        if fmt in ARROW_FORMATS:
+            chunks = selector.iter_record_batches(size=chunksize)
+            schema = selector.to_arrow(0, 0).schema
+        else:
+            def _format_table(span):
+                lo, hi = span
+                return selector[lo:hi].to_csv(
+                    None, sep='\t', index=False, header=False,
+                    float_format='%g').encode('utf-8')
+            chunks = map(_format_table, spans)
+            names = list(selector[0:0].columns)
 
-        if first:
+    try:
+        if fmt in ARROW_FORMATS:
+            if table == 'pixels':
+                schema = _to_record_batch(names, columns).schema
+            writer = _open_arrow_writer(f, fmt, schema)
+            for batch in chunks:
+                writer.write_table(pyarrow.Table.from_batches([batch], schema))
+            writer.close()
+        else:
             if header:
-                sel[0:0].to_csv(
-                    f, sep='\t', index=False, header=True, float_format='%g')
-            first = False
-
+                f.write(('\t'.join(names) + '\n').encode('utf-8'))
+            for text in chunks:
+                f.write(text)
+    except (IOError, OSError) as e:
+        if e.errno != 32:  # broken pipe
+            raise
+    finally:
+        if pool is not None:
+            pool.terminate()
         try:
-            sel.to_csv(
-                f, sep='\t', index=False, header=False, float_format='%g')
-
-        except (IOError, OSError) as e:
-            if e.errno == 32:  # broken pipe
-                try:
-                    f.close()
-                except OSError:
-                    pass
-                break
+            if f is not getattr(sys.stdout, 'buffer', sys.stdout):
+                f.close()
             else:
-                raise
-    else:
-        f.close()
+                f.flush()
+        except (IOError, OSError):
+            pass
+        if proc is not None:
+            proc.wait()
@@ -37,8 +37,8 @@ def load(bins_path, pixels_path, out, metadata, assembly):
     BINS_PATH : BED-like file containing genomic bin segmentation
 
     PIXELS_PATH : Three-column, sorted sparse matrix text file in ijv-triple
-    format, a.k.a. COO format. May be gzipped. Must be lexically sorted by 
-    bin1_id and bin2_id.
+    format, a.k.a. COO format. May be gzipped or bgzipped. Must be lexically
+    sorted by bin1_id and bin2_id.
 
     COOL_PATH : Output COOL file path
 
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+import sys
+
+import click
+from . import cli
+from ..server import CoolerServer, file_names
+
+
+@cli.command()
+@click.argument(
+    "cool_paths",
+    metavar="COOL_PATH",
+    nargs=-1,
+    required=True)
+@click.option(
+    "--host",
+    help="Interface to listen on.",
+    default="127.0.0.1",
+    show_default=True)
+@click.option(
+    "--port", "-p",
+    help="Port to listen on.",
+    type=int,
+    default=8000,
+    show_default=True)
+@click.option(
+    "--max-pixels",
+    help="Largest number of pixels of a dense matrix returned by /matrix.",
+    type=int,
+    default=2**26,
+    show_default=True)
+@click.option(
+    "--quiet", "-q",
+    help="Do not log requests.",
+    is_flag=True,
+    default=False)
+def serve(cool_paths, host, port, max_pixels, quiet):
+    """
+    Serve cooler files over HTTP.
+
+    Exposes the /files, /info, /chroms, /bins, /matrix and /tiles endpoints.
+    Files are opened once and kept open. Each file is named by its file name
+    without the extension, or by NAME if given as NAME=COOL_PATH. Names must
+    be unique. See the ``cooler.server`` module for details.
+
+    COOL_PATH : Path to a COOL or multires COOL file.
+
+    """
+    try:
+        paths = file_names(cool_paths)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+
+    server = CoolerServer((host, port), paths, quiet=quiet,
+                          max_pixels=max_pixels)
+    print("Serving {} on http://{}:{}/".format(
+        ', '.join(sorted(paths)), host, server.server_port), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
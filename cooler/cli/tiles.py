@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+
+import click
+from . import cli
+from ..contrib.higlass import precompute_tiles, TILE_STORE_SUFFIX
+
+
+@cli.command()
+@click.argument(
+    "multires_path",
+    metavar="MULTIRES_PATH")
+@click.option(
+    "--max-zoom", "-z",
+    help="Precompute tiles for all zoom levels up to and including this one.",
+    type=int,
+    required=True)
+@click.option(
+    "--sidecar",
+    help="Write the tile store to a separate file named after MULTIRES_PATH "
+         "with the '{}' suffix instead of into the multires file itself."
+         .format(TILE_STORE_SUFFIX),
+    is_flag=True,
+    default=False)
+def tiles(multires_path, max_zoom, sidecar):
+    """
+    Precompute balanced tiles of a multires file.
+
+    Dense 256x256 tiles of the low zoom levels are rendered once and stored
+    as float16 blocks indexed by (zoom, x, y). The higlass helpers serve
+    tiles from the store when present.
+
+    MULTIRES_PATH : Path to a balanced multi-resolution COOL file.
+
+    """
+    precompute_tiles(
+        multires_path,
+        max_zoom,
+        multires_path + TILE_STORE_SUFFIX if sidecar else None)
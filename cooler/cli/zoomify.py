@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+from multiprocess import Pool
+import sys
+
+import numpy as np
+import h5py
+
+import click
+from . import cli
+from ..api import info as get_info, chroms as get_chroms
+from ..io import zoomify as _zoomify
+
+
+TILE_SIZE = 256
+
+
+def _default_resolutions(cool_path):
+    # 2X increments until the whole genome fits in a single tile
+    with h5py.File(cool_path, 'r') as h5:
+        binsize = get_info(h5)['bin-size']
+        total_length = get_chroms(h5)['length'].sum()
+    n_tiles = total_length / binsize / TILE_SIZE
+    n_zooms = max(int(np.ceil(np.log2(n_tiles))), 0)
+    return [binsize * 2**i for i in range(1, n_zooms + 1)]
+
+
+@cli.command()
+@click.argument(
+    "cool_path",
+    metavar="COOL_PATH")
+@click.option(
+    "--out", "-o",
+    help="Output multires file. Defaults to COOL_PATH with the extension "
+         "replaced by .multires.cool")
+@click.option(
+    "--resolutions", "-r",
+    help="Comma-separated list of bin sizes to generate, in base pairs. Each "
+         "must be a multiple of the base bin size. Defaults to 2X increments "
+         "until the genome fits in a single 256x256 tile.",
+    type=str)
+@click.option(
+    "--chunksize", "-c",
+    help="Number of base pixels to process at a time.",
+    type=int,
+    default=int(10e6),
+    show_default=True)
+@click.option(
+    "--balance",
+    help="Balance each zoom level after aggregation.",
+    is_flag=True,
+    default=False)
+@click.option(
+    "--nproc", "-p",
+    help="Number of processes to use for balancing.",
+    type=int,
+    default=1,
+    show_default=True)
+@click.option(
+    "--mad-max",
+    help="MAD-max filter used for balancing.",
+    type=int,
+    default=3,
+    show_default=True)
+@click.option(
+    "--min-nnz",
+    help="Minimum marginal number of nonzeros used for balancing.",
+    type=int,
+    default=10,
+    show_default=True)
+@click.option(
+    "--ignore-diags",
+    help="Number of diagonals to ignore when balancing.",
+    type=int,
+    default=2,
+    show_default=True)
+def zoomify(cool_path, out, resolutions, chunksize, balance, nproc, mad_max,
+            min_nnz, ignore_diags):
+    """
+    Generate a multi-resolution cooler file by coarsening.
+
+    All zoom levels are built in a single pass over the base-resolution
+    pixels.
+
+    COOL_PATH : Path to a single-resolution COOL file with uniform bins.
+
+    """
+    if out is None:
+        out = cool_path.rsplit('.', 1)[0] + '.multires.cool'
+
+    if resolutions is None:
+        resolutions = _default_resolutions(cool_path)
+    else:
+        resolutions = [int(r) for r in resolutions.split(',') if r]
+
+    balance_args = {
+        'mad_max': mad_max,
+        'min_nnz': min_nnz,
+        'ignore_diags': ignore_diags,
+    }
+
+    pool = None
+    try:
+        if balance and nproc > 1:
+            pool = Pool(nproc)
+        _zoomify(cool_path, out, resolutions,
+                 chunksize=chunksize,
+                 balance=balance,
+                 balance_args=balance_args,
+                 map=pool.map if pool is not None else map)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if pool is not None:
+            pool.close()
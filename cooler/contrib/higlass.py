@@ -5,83 +5,46 @@ import pandas as pd
 import cooler
 import h5py
 import logging
+import os
  
 logger = logging.getLogger(__name__)
  
 TILE_SIZE = 256
+TILE_STORE_DTYPE = np.float16
+TILE_STORE_SUFFIX = '.tiles'
 
+# open h5py file handle -> MultiCooler
+_multicoolers = {}
+
+# resolved multires path -> ((file mtime, sidecar mtime),
+#                            {zoom: sidecar path or None})
+_tile_stores = {}
 
-def annotate(pixels, bins, replace=True):
-    ncols = len(pixels.columns)
-
-    if 'bin1_id' in pixels:
-        if len(bins) > len(pixels):
-            bin1 = pixels['bin1_id']
-            lo = bin1.min()
-            hi = bin1.max() + 1
-            lo = 0 if np.isnan(lo) else lo
-            hi = 0 if np.isnan(hi) else hi
-            right = bins[lo:hi]
-        else:
-            right = bins[:]
-        right['chrom'] = right['chrom'].cat.codes
-
-        pixels = pixels.merge(
-            right,
-            how='left',
-            left_on='bin1_id',
-            right_index=True)
-
-    if 'bin2_id' in pixels:
-        if len(bins) > len(pixels):
-            bin2 = pixels['bin2_id']
-            lo = bin2.min()
-            hi = bin2.max() + 1
-            lo = 0 if np.isnan(lo) else lo
-            hi = 0 if np.isnan(hi) else hi
-            right = bins[lo:hi]
-        else:
-            right = bins[:]
-        right['chrom'] = right['chrom'].cat.codes
-
-        pixels = pixels.merge(
-            right,
-            how='left',
-            left_on='bin2_id',
-            right_index=True,
-            suffixes=('1', '2'))
-
-    # rearrange columns
-    pixels = pixels[list(pixels.columns[ncols:]) + list(pixels.columns[:ncols])]
-
-    # drop bin IDs
-    if replace:
-        cols_to_drop = [col for col in ('bin1_id', 'bin2_id') if col in pixels]
-        pixels = pixels.drop(cols_to_drop, axis=1)
 
+def annotate(pixels, bins, replace=True):
+    """Join bin annotations onto pixels with :func:`cooler.annotate`, with
+    the chromosome columns given as integer chromosome IDs.
+    """
+    pixels = cooler.annotate(pixels, bins, replace)
+    for col in ('chrom1', 'chrom2', 'chrom'):
+        if col in pixels and hasattr(pixels[col], 'cat'):
+            pixels[col] = pixels[col].cat.codes
     return pixels
 
 
-def abs_coord_2_bin(c, abs_pos, chroms, chrom_cum_lengths, chrom_sizes):
+def abs_coord_2_bin(c, abs_pos, chroms=None, chrom_cum_lengths=None,
+                    chrom_sizes=None):
     """Get bin ID from absolute coordinates.
  
     Args:
         c (Cooler): Cooler instance of a .cool file.
-        abs_pos (int): Absolute coordinate to be translated.
+        abs_pos (int or array): Absolute coordinate(s) to be translated.
  
     Returns:
-        int: Bin number.
+        int or array: Bin number(s).
     """
  
-    try:
-        chr_id = np.flatnonzero(chrom_cum_lengths > abs_pos)[0] - 1
-    except IndexError:
-        return c.info['nbins']
- 
-    chrom = chroms[chr_id]
-    rel_pos = abs_pos - chrom_cum_lengths[chr_id]
- 
-    return c.offset((chrom, rel_pos, chrom_sizes[chrom]))
+    return c.abs_coord_to_bin(abs_pos)
  
 def get_chromosome_names_cumul_lengths(c):
     '''
@@ -95,25 +58,37 @@ def get_chromosome_names_cumul_lengths(c):
  
     (names, sizes, lengths) -> (list(string), dict, np.array(int))
     '''
-    chrom_sizes = {}
-    chrom_cum_lengths = [0]
-    chroms = []
- 
-    for chrom in c.chroms():
-        (name, length) = chrom.as_matrix()[0]
- 
-        chroms += [name]
-        chrom_cum_lengths += [chrom_cum_lengths[-1] + length]
-        chrom_sizes[name] = length
+    chromtable = c.chroms()[:]
+    chroms = list(chromtable['name'])
+    lengths = chromtable['length'].values
+    chrom_sizes = dict(zip(chroms, lengths))
+    chrom_cum_lengths = np.r_[0, np.cumsum(lengths)]
  
-    return (chroms, chrom_sizes, np.array(chrom_cum_lengths))
+    return (chroms, chrom_sizes, chrom_cum_lengths)
  
  
+def _as_multicooler(f):
+    """The MultiCooler of a file handle, created once and cached while the
+    file is open, so that bin tables and indexes are not decoded again on
+    every request.
+    """
+    if isinstance(f, cooler.MultiCooler):
+        return f
+    for key in [key for key in _multicoolers if not key.id.valid]:
+        del _multicoolers[key]
+    mc = _multicoolers.get(f)
+    if mc is None:
+        mc = _multicoolers[f] = cooler.MultiCooler(f)
+    return mc
+
+
 def get_data(f, zoom_level, start_pos_1, end_pos_1, start_pos_2, end_pos_2):
     """Get balanced pixel data.
  
     Args:
-        f (File): File pointer to a .cool filer.
+        f (MultiCooler or File): Multires cooler, or file pointer to one.
+            A file pointer is mapped to a MultiCooler that is cached for as
+            long as the file stays open.
         zoom_level (int): Test.
         start_pos_1 (int): Test.
         end_pos_1 (int): Test.
@@ -124,21 +99,20 @@ def get_data(f, zoom_level, start_pos_1, end_pos_1, start_pos_2, end_pos_2):
         DataFrame: Annotated cooler pixels.
     """
  
-    c = cooler.Cooler(f[str(zoom_level)])
+    mc = _as_multicooler(f)
+    c = mc.level(zoom_level)
  
-    (chroms, chrom_sizes, chrom_cum_lengths) = get_chromosome_names_cumul_lengths(c)
+    chrom_cum_lengths = mc.chrom_cum_lengths
  
-    i0 = abs_coord_2_bin(c, start_pos_1, chroms, chrom_cum_lengths, chrom_sizes)
-    i1 = abs_coord_2_bin(c, end_pos_1, chroms, chrom_cum_lengths, chrom_sizes)
-    j0 = abs_coord_2_bin(c, start_pos_2, chroms, chrom_cum_lengths, chrom_sizes)
-    j1 = abs_coord_2_bin(c, end_pos_2, chroms, chrom_cum_lengths, chrom_sizes)
+    i0, i1, j0, j1 = c.abs_coord_to_bin(
+        [start_pos_1, end_pos_1, start_pos_2, end_pos_2])
  
     pixels = c.matrix(as_pixels=True, max_chunk=np.inf)[i0:i1, j0:j1]
  
     if not len(pixels):
         return pd.DataFrame(columns=['genome_start', 'genome_end', 'balanced'])
  
-    bins = c.bins()[['chrom', 'start', 'end', 'weight']]
+    bins = c.bin_table(['chrom', 'start', 'end', 'weight'])
     pixels = annotate(pixels, bins)
 
     pixels['genome_start'] = chrom_cum_lengths[pixels['chrom1']] + pixels['start1']
@@ -148,36 +122,293 @@ def get_data(f, zoom_level, start_pos_1, end_pos_1, start_pos_2, end_pos_2):
     )
  
     return pixels[['genome_start', 'genome_end', 'balanced']]
- 
+
+
+
+def _merge_ranges(starts, ends):
+    """Merge overlapping or adjacent half-open ranges.
+
+    Returns the merged ranges and, for each input range, the index of the
+    merged range that contains it.
+    """
+    order = np.argsort(starts, kind='mergesort')
+    starts, ends = starts[order], ends[order]
+    run_ends = np.maximum.accumulate(ends)
+    is_new = np.r_[True, starts[1:] > run_ends[:-1]]
+    group = np.cumsum(is_new) - 1
+    merged_starts = starts[is_new]
+    merged_ends = np.r_[run_ends[np.flatnonzero(is_new)[1:] - 1], run_ends[-1]]
+    membership = np.empty(len(order), dtype=int)
+    membership[order] = group
+    return merged_starts, merged_ends, membership
+
+
+def _filtered_cells(weight, abs_starts, lo, hi, origin, tile_width):
+    """Cell positions along one axis of a tile of bins with a NaN weight."""
+    bins = lo + np.flatnonzero(np.isnan(weight[lo:hi]))
+    return np.clip(np.floor(
+        (abs_starts[bins] - origin) * TILE_SIZE / tile_width
+    ).astype(int), 0, TILE_SIZE - 1)
+
+
+def get_tiles(f, zoom_level, tile_ids, dense=True, balance=True,
+              dtype=np.float32, mask_filtered=False):
+    """Get many tiles of a zoom level in one pass.
+
+    The row ranges of the requested tiles are merged into bands, each band
+    of the pixel table is read once and its pixels are routed to the tiles
+    that contain them. Like ``get_data``, only upper triangle pixels are
+    returned.
+
+    Args:
+        f (MultiCooler or File): Multires cooler, or file pointer to one.
+        zoom_level (int): Zoom level.
+        tile_ids (list): Sequence of (x, y) tile positions, where x indexes
+            the rows and y the columns of the genome-wide matrix.
+        dense (bool): Return 256x256 arrays. Otherwise, return (i, j, v)
+            triplets of cell positions within the tile and values.
+        balance (bool): Apply the balancing weights.
+        dtype (dtype): Data type of dense tiles, e.g. float32 or float16.
+            Tiles are accumulated in float32 and values beyond the range of
+            a smaller type are clipped to its largest finite value.
+        mask_filtered (bool): Set the rows and columns of dense tiles that
+            fall on bins with no balancing weight to NaN.
+
+    Returns:
+        dict: Tile data keyed by tile position.
+    """
+    mc = _as_multicooler(f)
+    zoom_level = int(zoom_level)
+    c = mc.level(zoom_level)
+    tile_ids = [tuple(int(x) for x in tile_id) for tile_id in tile_ids]
+    if not tile_ids:
+        return {}
+
+    tile_width = _tile_width(mc, zoom_level)
+    xy = np.array(tile_ids, dtype=np.int64).reshape(-1, 2)
+    x0, y0 = xy[:, 0] * tile_width, xy[:, 1] * tile_width
+    i0, i1, j0, j1 = c.abs_coord_to_bin(
+        np.array([x0, x0 + tile_width, y0, y0 + tile_width]))
+
+    bin1_offset = mc.index('bin1_offset', zoom_level)
+    abs_starts = c.abs_bin_starts()
+    if balance or mask_filtered:
+        weight = mc.bin_column('weight', zoom_level)
+
+    tiles = {}
+    band_lo, band_hi, band_of = _merge_ranges(i0, i1)
+    for b, (r0, r1) in enumerate(zip(band_lo, band_hi)):
+        p0, p1 = bin1_offset[r0], bin1_offset[r1]
+        bin2, values = mc.pixel_span(p0, p1, ['bin2_id', 'count'], zoom_level)
+        bin1 = np.repeat(np.arange(r0, r1), np.diff(bin1_offset[r0:r1 + 1]))
+        values = values.astype(np.float32)
+        if balance:
+            values *= weight[bin1] * weight[bin2]
+
+        for t in np.flatnonzero(band_of == b):
+            # rows of the tile are a contiguous slice of the band
+            lo = bin1_offset[i0[t]] - p0
+            hi = bin1_offset[i1[t]] - p0
+            mask = (bin2[lo:hi] >= j0[t]) & (bin2[lo:hi] < j1[t])
+            ti, tj, tv = bin1[lo:hi][mask], bin2[lo:hi][mask], values[lo:hi][mask]
+
+            rows = np.clip(np.floor(
+                (abs_starts[ti] - x0[t]) * TILE_SIZE / tile_width
+            ).astype(int), 0, TILE_SIZE - 1)
+            cols = np.clip(np.floor(
+                (abs_starts[tj] - y0[t]) * TILE_SIZE / tile_width
+            ).astype(int), 0, TILE_SIZE - 1)
+
+            if dense:
+                tile = np.zeros((TILE_SIZE, TILE_SIZE), dtype=np.float32)
+                np.add.at(tile, (rows, cols), tv)
+                if mask_filtered:
+                    tile[_filtered_cells(weight, abs_starts, i0[t], i1[t],
+                                         x0[t], tile_width), :] = np.nan
+                    tile[:, _filtered_cells(weight, abs_starts, j0[t], j1[t],
+                                            y0[t], tile_width)] = np.nan
+                if np.dtype(dtype) != tile.dtype:
+                    fmax = np.finfo(dtype).max
+                    tile = np.clip(tile, -fmax, fmax).astype(dtype)
+                tiles[tile_ids[t]] = tile
+            else:
+                tiles[tile_ids[t]] = (rows, cols, tv)
+
+    return tiles
+
+
+def _tile_width(mc, zoom_level):
+    # a tile spans TILE_SIZE bins of its zoom level, whatever the factor
+    # between successive levels
+    return mc.binsize(zoom_level) * TILE_SIZE
+
+
+def _n_tiles(mc, zoom_level):
+    return int(np.ceil(mc.chrom_cum_lengths[-1] / _tile_width(mc, zoom_level)))
+
+
+def _tile_store_index(mc):
+    """Zoom levels with precomputed tiles, mapped to the path of the sidecar
+    file holding them, or None for tiles stored in the multires file.
+
+    Tiles are looked up in the ``tiles`` group of the multires file, then in
+    a sidecar file named after it with the ``.tiles`` suffix. The index is
+    cached by resolved file path and rebuilt when either file changes.
+    """
+    path = os.path.realpath(mc.filename)
+    sidecar = path + TILE_STORE_SUFFIX
+    sidecar_mtime = (os.path.getmtime(sidecar) if os.path.exists(sidecar)
+                     else None)
+    mtimes = (os.path.getmtime(path), sidecar_mtime)
+    cached = _tile_stores.get(path)
+    if cached is None or cached[0] != mtimes:
+        stores = {}
+        if sidecar_mtime is not None:
+            with h5py.File(sidecar, 'r') as h5:
+                for key in h5.get('tiles', {}):
+                    stores[int(key)] = sidecar
+        if 'tiles' in mc._h5:
+            for key in mc._h5['tiles']:
+                stores[int(key)] = None
+        cached = _tile_stores[path] = (mtimes, stores)
+    return cached[1]
+
+
+def _read_stored_tiles(mc, zoom_level, tile_ids):
+    """Read tiles on or above the diagonal from the tile store of a zoom
+    level, if any. The sidecar file is only held open for the read.
+    """
+    stores = _tile_store_index(mc)
+    zoom_level = int(zoom_level)
+    if zoom_level not in stores:
+        return {}
+
+    def read(grp):
+        dset = grp['tiles'][str(zoom_level)]
+        n = dset.shape[0]
+        return {(x, y): dset[x, y] for x, y in tile_ids if x <= y < n}
+
+    sidecar = stores[zoom_level]
+    if sidecar is None:
+        return read(mc._h5)
+    with h5py.File(sidecar, 'r') as h5:
+        return read(h5)
+
+
+def precompute_tiles(file_path, max_zoom, sidecar=None, h5opts=None):
+    """Precompute balanced float16 tiles into a tile store.
+
+    Tiles of every zoom level up to ``max_zoom`` are rendered like
+    ``get_tile_buffers`` and stored in ``tiles/<zoom>`` datasets of shape
+    (n, n, 256, 256), chunked by tile. Only tiles on or above the diagonal
+    are rendered.
+
+    Args:
+        file_path (str): Path to a balanced multires cooler file.
+        max_zoom (int): Highest zoom level to precompute.
+        sidecar (str): Path to a separate file to hold the store. By default,
+            the store is written to the multires file itself.
+        h5opts (dict): HDF5 dataset filter options.
+    """
+    if h5opts is None:
+        h5opts = dict(compression='gzip', compression_opts=6, shuffle=True)
+
+    if sidecar is None:
+        h5 = h5py.File(file_path, 'r+')
+        out = h5
+    else:
+        h5 = h5py.File(file_path, 'r')
+        out = h5py.File(sidecar, 'w')
+
+    try:
+        mc = cooler.MultiCooler(h5)
+        grp = out.require_group('tiles')
+        for zoom in range(min(int(max_zoom), mc.max_zoom) + 1):
+            n = _n_tiles(mc, zoom)
+            if str(zoom) in grp:
+                del grp[str(zoom)]
+            dset = grp.create_dataset(
+                str(zoom),
+                shape=(n, n, TILE_SIZE, TILE_SIZE),
+                dtype=TILE_STORE_DTYPE,
+                chunks=(1, 1, TILE_SIZE, TILE_SIZE),
+                **h5opts)
+            dset.attrs['bin-size'] = mc.binsize(zoom)
+            for x in range(n):
+                tile_ids = [(x, y) for y in range(x, n)]
+                tiles = get_tiles(mc, zoom, tile_ids, dtype=TILE_STORE_DTYPE,
+                                  mask_filtered=True)
+                for (_, y), tile in tiles.items():
+                    dset[x, y] = tile
+    finally:
+        if out is not h5:
+            out.close()
+        h5.close()
+
+
+def get_tile_buffers(f, zoom_level, tile_ids, dtype=np.float16,
+                     mask_filtered=True):
+    """Get dense tiles as ready-to-send binary buffers.
+
+    Tiles are read from a precomputed tile store when one exists for the
+    zoom level and the default rendering options are used. Other tiles are
+    rendered from the pixel table.
+
+    Args:
+        f (MultiCooler or File): Multires cooler, or file pointer to one.
+        zoom_level (int): Zoom level.
+        tile_ids (list): Sequence of (x, y) tile positions.
+        dtype (dtype): Data type of the tiles, float16 by default.
+        mask_filtered (bool): Set the rows and columns of filtered bins to
+            NaN.
+
+    Returns:
+        dict: Zero-copy memoryviews of C-contiguous 256x256 tiles keyed by
+        tile position.
+    """
+    mc = _as_multicooler(f)
+    tile_ids = [tuple(int(x) for x in tile_id) for tile_id in tile_ids]
+
+    tiles = {}
+    if np.dtype(dtype) == TILE_STORE_DTYPE and mask_filtered:
+        tiles.update(_read_stored_tiles(mc, zoom_level, tile_ids))
+
+    missing = [tile_id for tile_id in tile_ids if tile_id not in tiles]
+    if missing:
+        tiles.update(get_tiles(mc, zoom_level, missing, dense=True,
+                               balance=True, dtype=dtype,
+                               mask_filtered=mask_filtered))
+    return {tile_id: memoryview(np.ascontiguousarray(tiles[tile_id]))
+            for tile_id in tile_ids} 
  
 def get_info(file_path):
     """Get information of a cooler file.
  
     Args:
-        file_path (str): Path to a cooler file.
+        file_path (str or MultiCooler): Path to a multires cooler file.
  
     Returns:
         dict: Dictionary containing basic information about the cooler file.
     """
  
-    with h5py.File(file_path, 'r') as f:
-        max_zoom = f.attrs.get('max-zoom')
- 
-        if max_zoom is None:
+    if isinstance(file_path, cooler.MultiCooler):
+        mc = file_path
+    else:
+        try:
+            mc = cooler.MultiCooler(file_path)
+        except ValueError:
             logger.info('no zoom found')
             raise ValueError(
                 'The `max_zoom` attribute is missing.'
             )
  
-        c = cooler.Cooler(f["0"])
- 
-        (chroms, chrom_sizes, chrom_cum_lengths) = get_chromosome_names_cumul_lengths(c)
- 
-        total_length = int(chrom_cum_lengths[-1])
-        max_zoom = f.attrs['max-zoom']
-        bin_size = int(f[str(max_zoom)].attrs['bin-size'])
+    try:
+        total_length = int(mc.chrom_cum_lengths[-1])
+        max_zoom = mc.max_zoom
+        bin_size = mc.binsize(max_zoom)
  
-        max_width = bin_size * TILE_SIZE * 2**max_zoom
+        # the width of the single tile of zoom level 0
+        max_width = _tile_width(mc, 0)
  
         info = {
             'min_pos': [0.0, 0.0],
@@ -186,5 +417,8 @@ def get_info(file_path):
             'max_width': max_width,
             'bins_per_dimension': TILE_SIZE,
         }
+    finally:
+        if mc is not file_path:
+            mc.close()
  
     return info
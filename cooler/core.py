@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
+import uuid
+
 import numpy as np
 
+from .util import read_ahead
+
 
 class TriuReader(object):
     """
@@ -26,64 +30,261 @@ class TriuReader(object):
 
     def index_col(self, i0, i1, j0, j1):
         """Retrieve pixel table row IDs corresponding to query rectangle."""
-        edges = self.h5['indexes']['bin1_offset'][i0:i1 + 1]
-        index = []
-        for lo1, hi1 in zip(edges[:-1], edges[1:]):
-            if hi1 - lo1 > 0:
-                bin2 = self.h5['pixels']['bin2_id'][lo1:hi1]
-                mask = (bin2 >= j0) & (bin2 < j1)
-                index.append(lo1 + np.flatnonzero(mask))
-        if not index:
-            return np.array([], dtype=int)
-        else:
-            return np.concatenate(index, axis=0)
-
-
-    def query(self, i0, i1, j0, j1):
-        """Retrieve sparse matrix data inside a query rectangle."""
+        return self.query(i0, i1, j0, j1, return_index=True)[3]
+
+    def _row_groups(self, edges):
+        # split the rows into runs spanning at most max_chunk pixels, except
+        # for single rows that are larger
+        if edges[-1] - edges[0] < self.max_chunk:
+            return [(0, len(edges) - 1)]
+        groups = []
+        start = 0
+        n_rows = len(edges) - 1
+        while start < n_rows:
+            stop = np.searchsorted(
+                edges, edges[start] + self.max_chunk, 'right') - 1
+            stop = min(max(stop, start + 1), n_rows)
+            groups.append((start, stop))
+            start = stop
+        return groups
+
+    def query(self, i0, i1, j0, j1, return_index=False):
+        """
+        Retrieve sparse matrix data inside a query rectangle.
+
+        The pixels of the rows are read in a single pass, in blocks of at
+        most ``max_chunk`` pixels, and filtered with vectorized masks.
+
+        Parameters
+        ----------
+        i0, i1, j0, j1 : int
+            Query rectangle.
+        return_index : bool, optional
+            Also return the pixel table row IDs of the selected pixels.
+
+        Returns
+        -------
+        i, j, v[, index] : 1D arrays
+
+        """
         h5 = self.h5
         field = self.field
 
-        i, j, v = [], [], []
+        i, j, v, index = [], [], [], []
         if (i1 - i0 > 0) or (j1 - j0 > 0):
             edges = h5['indexes']['bin1_offset'][i0:i1 + 1]
+            bin2_dset = h5['pixels']['bin2_id']
             data = h5['pixels'][field]
-            p0, p1 = edges[0], edges[-1]
-
-            if (p1 - p0) < self.max_chunk:
-                all_bin2 = h5['pixels']['bin2_id'][p0:p1]
-                all_data = data[p0:p1]
-                dtype = all_bin2.dtype
-                for row_id, lo, hi in zip(range(i0, i1), 
-                                          edges[:-1] - p0,
-                                          edges[1:]  - p0):
-                    bin2 = all_bin2[lo:hi]
-                    mask = (bin2 >= j0) & (bin2 < j1)
-                    cols = bin2[mask]
-
-                    i.append(np.full(len(cols), row_id, dtype=dtype))
-                    j.append(cols)
-                    v.append(all_data[lo:hi][mask])
-            else:
-                for row_id, lo, hi in zip(range(i0, i1), edges[:-1], edges[1:]):
-                    bin2 = h5['pixels']['bin2_id'][lo:hi]
-                    mask = (bin2 >= j0) & (bin2 < j1)
-                    cols = bin2[mask]
-                    dtype = bin2.dtype
-
-                    i.append(np.full(len(cols), row_id, dtype=dtype))
-                    j.append(cols)
-                    v.append(data[lo:hi][mask])
+            for r0, r1 in self._row_groups(edges):
+                p0, p1 = edges[r0], edges[r1]
+                rows, cols, vals, mask = _filter_rows(
+                    i0 + r0, edges[r0:r1 + 1] - p0, bin2_dset[p0:p1],
+                    data[p0:p1], j0, j1)
+                i.append(rows)
+                j.append(cols)
+                v.append(vals)
+                if return_index:
+                    index.append(p0 + np.flatnonzero(mask))
 
         if not i:
             i = np.array([], dtype=int)
             j = np.array([], dtype=int)
-            v = np.array([])
+            v = np.array([], dtype=h5['pixels'][field].dtype)
+            index = np.array([], dtype=int)
         else:
             i = np.concatenate(i, axis=0)
             j = np.concatenate(j, axis=0)
             v = np.concatenate(v, axis=0)
+            if return_index:
+                index = np.concatenate(index, axis=0)
+
+        if return_index:
+            return i, j, v, index
+        return i, j, v
+
+    def band(self, i0, i1, max_diag):
+        """
+        Retrieve the pixels of a square diagonal block that lie on its first
+        ``max_diag`` diagonals, i.e. with ``i0 <= i <= j < i1`` and
+        ``j - i < max_diag``.
+
+        The column IDs of a row are distinct and not below the row, so only
+        the first ``max_diag`` pixels of each row can be in the band. Only
+        those are read, with the reads of rows that lie within an HDF5 chunk
+        of each other merged into reads of at most ``max_chunk`` pixels.
+
+        Returns
+        -------
+        i, j, v : 1D arrays
+
+        """
+        bin2_dset = self.h5['pixels']['bin2_id']
+        data = self.h5['pixels'][self.field]
+        i, j, v = [], [], []
+        if i1 > i0 and max_diag > 0:
+            edges = self.h5['indexes']['bin1_offset'][i0:i1 + 1]
+            rows = np.arange(i0, i1)
+            lo = edges[:-1]
+            hi = np.minimum(edges[1:], lo + max_diag)
+            for b0, b1 in _coalesce(lo, hi, _read_gap(bin2_dset),
+                                    self.max_chunk):
+                p0, p1 = lo[b0], hi[b1 - 1]
+                lengths = hi[b0:b1] - lo[b0:b1]
+                idx = _run_positions(lo[b0:b1] - p0, lengths)
+                r = np.repeat(rows[b0:b1], lengths)
+                c = bin2_dset[p0:p1][idx]
+                mask = c < np.minimum(r + max_diag, i1)
+                i.append(r[mask])
+                j.append(c[mask])
+                v.append(data[p0:p1][idx][mask])
+        if not i:
+            return (np.array([], dtype=int), np.array([], dtype=int),
+                    np.array([], dtype=data.dtype))
+        return np.concatenate(i), np.concatenate(j), np.concatenate(v)
+
+    def lookup(self, i, j, return_found=False):
+        """
+        Retrieve the values of pixels at scattered upper triangle coordinates.
+
+        The queries are sorted by row and the ``bin1_offset`` index is read
+        once. Queries whose rows lie close together in the pixel table are
+        served from a single read of at most ``max_chunk`` pixels, in which
+        each column is found by a vectorized binary search of its row.
+
+        Parameters
+        ----------
+        i, j : 1D arrays
+            Row and column bin IDs, with ``i <= j``.
+        return_found : bool, optional
+            Also return a mask of the queries that matched a pixel.
+
+        Returns
+        -------
+        v : 1D array
+            Pixel values, 0 where there is no pixel.
+        found : 1D array of bool
+            Only if ``return_found`` is True.
+
+        """
+        bin2_dset = self.h5['pixels']['bin2_id']
+        data = self.h5['pixels'][self.field]
+        v = np.zeros(len(i), dtype=data.dtype)
+        mask = np.zeros(len(i), dtype=bool)
+        if not len(i):
+            return (v, mask) if return_found else v
+
+        order = np.argsort(i, kind='mergesort')
+        rows, cols = i[order], j[order]
+        r0 = rows[0]
+        offsets = self.h5['indexes']['bin1_offset'][r0:rows[-1] + 2]
+        lo = offsets[rows - r0]
+        hi = offsets[rows - r0 + 1]
+
+        # rows closer than an HDF5 chunk apart are read together
+        for start, stop in _coalesce(lo, hi, _read_gap(bin2_dset),
+                                     self.max_chunk):
+            p0, p1 = lo[start], hi[stop - 1]
+            bin2 = bin2_dset[p0:p1]
+            pos = _search_runs(bin2, lo[start:stop] - p0,
+                               hi[start:stop] - p0, cols[start:stop])
+            found = pos < hi[start:stop] - p0
+            found[found] = bin2[pos[found]] == cols[start:stop][found]
+            if found.any():
+                v[order[start:stop][found]] = data[p0:p1][pos[found]]
+                mask[order[start:stop][found]] = True
+        return (v, mask) if return_found else v
+
+
+def _read_gap(dset):
+    # ranges of a dataset closer than this are read together
+    chunks = getattr(dset, 'chunks', None)
+    return max(chunks[0] if chunks else 0, 1)
+
+
+def _coalesce(lo, hi, gap, max_chunk):
+    # group consecutive sorted pixel ranges [lo, hi) into reads bridging
+    # gaps of at most gap pixels and spanning at most max_chunk pixels;
+    # repeated ranges, e.g. of the same row, are never split
+    groups = []
+    bounds = np.r_[0, np.flatnonzero(lo[1:] - hi[:-1] > gap) + 1, len(lo)]
+    for b0, b1 in zip(bounds[:-1], bounds[1:]):
+        start = b0
+        while start < b1:
+            limit = max(lo[start] + max_chunk, hi[start])
+            stop = np.searchsorted(hi[start:b1], limit, 'right') + start
+            groups.append((start, stop))
+            start = stop
+    return groups
+
+
+def _run_positions(starts, lengths):
+    # positions of the concatenated runs [start, start + length)
+    return np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]],
+                     lengths) + np.arange(lengths.sum())
+
+
+def _search_runs(values, lo, hi, x):
+    # vectorized left-sided searchsorted of each x in the sorted run
+    # values[lo:hi] of its query
+    lo = lo.copy()
+    hi = hi.copy()
+    if not len(values):
+        return lo
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        right = active & (values[np.minimum(mid, len(values) - 1)] < x)
+        lo = np.where(right, mid + 1, lo)
+        hi = np.where(active & ~right, mid, hi)
+
+
+def _filter_rows(row0, edges, bin2, data, j0, j1):
+    # select the pixels of consecutive rows starting at row0 whose column is
+    # in [j0, j1), given the row edges into the bin2 and data arrays
+    mask = (bin2 >= j0) & (bin2 < j1)
+    rows = np.repeat(np.arange(row0, row0 + len(edges) - 1, dtype=bin2.dtype),
+                     np.diff(edges))
+    return rows[mask], bin2[mask], data[mask], mask
+
+
+class RowBlockReader(object):
+    """
+    Upper triangle reader serving queries from a band of rows of the pixel
+    table held in memory.
+
+    Parameters
+    ----------
+    row0 : int
+        First row of the band.
+    edges : 1D array
+        Offsets of the rows of the band into ``bin2`` and ``data``, i.e. the
+        ``bin1_offset`` index of the rows shifted to start at 0.
+    bin2, data : 1D arrays
+        Column IDs and values of the pixels of the band.
+
+    """
+    def __init__(self, row0, edges, bin2, data):
+        self.row0 = row0
+        self.row1 = row0 + len(edges) - 1
+        self.edges = edges
+        self.bin2 = bin2
+        self.data = data
 
+    def query(self, i0, i1, j0, j1):
+        """Retrieve sparse matrix data inside a query rectangle, whose rows
+        must be in the band."""
+        if i0 < self.row0 or i1 > self.row1:
+            raise IndexError('rows [{}, {}) are not in the block'.format(i0, i1))
+        if i1 <= i0:
+            return (np.array([], dtype=self.bin2.dtype),
+                    np.array([], dtype=self.bin2.dtype),
+                    np.array([], dtype=self.data.dtype))
+        e = self.edges[i0 - self.row0:i1 - self.row0 + 1]
+        p0, p1 = e[0], e[-1]
+        i, j, v, _ = _filter_rows(i0, e - p0, self.bin2[p0:p1],
+                                  self.data[p0:p1], j0, j1)
         return i, j, v
 
 
@@ -272,11 +473,32 @@ class RangeSelector1D(_IndexingMixin):
     >>> for chunk in sel.iterchunks(size=1000):  # doctest: +SKIP
     >>>     ...
 
+    Reading the next chunks can overlap with processing the current one.
+
+    >>> for chunk in sel.iterchunks(size=1000, prefetch=2):  # doctest: +SKIP
+    >>>     ...
+
+    Rows can also be exported as Arrow record batches (requires pyarrow). If
+    an Arrow slicer is provided, columns are read into Arrow arrays directly,
+    otherwise the DataFrames returned by the slicer are converted.
+
+    >>> table = sel.to_arrow()  # doctest: +SKIP
+    >>> for batch in sel.iter_record_batches(size=1000):  # doctest: +SKIP
+    >>>     ...
+
+    Or as a dask DataFrame (requires dask). Partitions only split the table at
+    the row offsets returned by the ``boundaries`` callable, if provided.
+
+    >>> ddf = sel.to_dask(chunksize=1000000)  # doctest: +SKIP
+
     """
-    def __init__(self, fields, slicer, fetcher, nmax):
+    def __init__(self, fields, slicer, fetcher, nmax, arrow_slicer=None,
+                 boundaries=None):
         self.fields = fields
         self._slice = slicer
         self._fetch = fetcher
+        self._arrow_slice = arrow_slicer
+        self._boundaries = boundaries
         self._shape = (nmax,)
 
     @property
@@ -300,7 +522,8 @@ class RangeSelector1D(_IndexingMixin):
         # requesting a subset of columns
         if isinstance(key, (list, str)):
             return self.__class__(
-                key, self._slice, self._fetch, self._shape[0])
+                key, self._slice, self._fetch, self._shape[0],
+                self._arrow_slice, self._boundaries)
 
         # requesting an interval of rows
         if isinstance(key, tuple):
@@ -311,12 +534,25 @@ class RangeSelector1D(_IndexingMixin):
         lo, hi = self._process_slice(key, self._shape[0])
         return self._slice(self.fields, lo, hi)
 
-    def iterchunks(self, lo=0, hi=None, size=None):
+    def iterchunks(self, lo=0, hi=None, size=None, prefetch=0):
+        """
+        Iterate over a range of rows in chunks of ``size`` rows.
+
+        With ``prefetch`` > 0, up to that many chunks are read ahead on a
+        background thread while the current one is being consumed. At most
+        ``prefetch + 2`` chunks are held in memory at a time. Chunks are
+        yielded in order either way.
+
+        """
         lo, hi = self._process_slice(slice(lo, hi), self._shape[0])
         if size is None:
             size = hi - lo
-        for i in range(lo, hi, size):
-            yield self._slice(self.fields, i, i+size)
+        chunks = (self._slice(self.fields, i, i+size)
+                  for i in range(lo, hi, size))
+        if prefetch > 0:
+            chunks = read_ahead(chunks, prefetch)
+        for chunk in chunks:
+            yield chunk
 
     def fetch(self, *args, **kwargs):
         if self._fetch is not None:
@@ -325,8 +561,80 @@ class RangeSelector1D(_IndexingMixin):
         else:
             raise NotImplementedError
 
-    # def to_dask(self):
-    #     pass
+    def _record_batch(self, lo, hi):
+        if self._arrow_slice is not None:
+            return self._arrow_slice(self.fields, lo, hi)
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("Arrow export requires pyarrow.")
+        df = self._slice(self.fields, lo, hi)
+        if not hasattr(df, 'columns'):
+            df = df.to_frame()
+        return pyarrow.RecordBatch.from_pandas(df, preserve_index=False)
+
+    def iter_record_batches(self, lo=0, hi=None, size=None):
+        """
+        Iterate over a range of rows as ``pyarrow.RecordBatch`` objects of
+        ``size`` rows. Enum columns, such as chromosome names, are dictionary
+        encoded.
+
+        """
+        lo, hi = self._process_slice(slice(lo, hi), self._shape[0])
+        if size is None:
+            size = max(hi - lo, 1)
+        for i in range(lo, hi, size):
+            yield self._record_batch(i, min(i + size, hi))
+
+    def to_arrow(self, lo=0, hi=None, size=None):
+        """
+        Range of rows as a ``pyarrow.Table`` made of record batches of
+        ``size`` rows.
+
+        """
+        import pyarrow
+        lo, hi = self._process_slice(slice(lo, hi), self._shape[0])
+        schema = self._record_batch(lo, lo).schema
+        return pyarrow.Table.from_batches(
+            list(self.iter_record_batches(lo, hi, size)), schema)
+
+    def _partition(self, chunksize):
+        n = self._shape[0]
+        if chunksize is None:
+            chunksize = max(n, 1)
+        edges = np.arange(0, n + chunksize, chunksize)
+        edges[-1] = n
+        if self._boundaries is not None:
+            # snap the edges down to the nearest allowed split point
+            bounds = np.asarray(self._boundaries())
+            edges = bounds[np.searchsorted(bounds, edges, side='right') - 1]
+            edges[-1] = n
+        return np.unique(edges)
+
+    def to_dask(self, chunksize=None):
+        """
+        Lazy dask DataFrame of the table, in partitions of about
+        ``chunksize`` rows whose index divisions are known.
+
+        Each partition is read by a separate task that invokes the slicer, so
+        the graph can run on the multiprocessing or distributed schedulers as
+        long as the slicer is picklable, e.g. when the cooler is opened from
+        a file path.
+
+        """
+        try:
+            import dask
+            import dask.dataframe as dd
+        except ImportError:
+            raise ImportError("Dask export requires dask[dataframe].")
+        meta = self._slice(self.fields, 0, 0)
+        edges = self._partition(chunksize)
+        if len(edges) < 2:
+            return dd.from_pandas(meta, npartitions=1)
+        parts = [dask.delayed(self._slice)(self.fields, lo, hi)
+                 for lo, hi in zip(edges[:-1], edges[1:])]
+        divisions = tuple(int(x) for x in edges[:-1]) + (int(edges[-1]) - 1,)
+        return dd.from_delayed(parts, meta=meta, divisions=divisions)
 
 
 class RangeSelector2D(_IndexingMixin):
@@ -334,11 +642,24 @@ class RangeSelector2D(_IndexingMixin):
     Selector for out-of-core sparse matrix data. Supports 2D scalar and slice
     subscript indexing.
 
+    Many rectangles can be queried at once with ``slices`` and
+    ``fetch_many``. If a batch slicer is provided, it is given all the
+    rectangles so that it can share disk reads between them.
+
+    >>> mats = sel.slices([(0, 10, 0, 10), (5, 15, 20, 30)])  # doctest: +SKIP
+    >>> arr = sel.fetch_many(['chr1:0-1000000', 'chr2:0-1000000'],
+    ...                      dense=True)  # doctest: +SKIP
+
     """
-    def __init__(self, field, slicer, fetcher, shape):
+    def __init__(self, field, slicer, fetcher, shape, many_slicer=None,
+                 many_fetcher=None, lookuper=None, band_slicer=None):
         self.field = field
         self._slice = slicer
         self._fetch = fetcher
+        self._slice_many = many_slicer
+        self._fetch_many = many_fetcher
+        self._lookup = lookuper
+        self._band = band_slicer
         self._shape = shape
 
     @property
@@ -360,3 +681,159 @@ class RangeSelector2D(_IndexingMixin):
             return self._slice(self.field, i0, i1, j0, j1)
         else:
             raise NotImplementedError
+
+    def slices(self, rects, dense=False):
+        """
+        Query many rectangles of the matrix at once.
+
+        Parameters
+        ----------
+        rects : sequence of (i0, i1, j0, j1)
+            Bin ranges of the rectangles.
+        dense : bool, optional
+            Return a single dense array of shape ``(len(rects), h, w)``
+            instead of a list of sparse matrices. All rectangles must then
+            have the same shape.
+
+        Returns
+        -------
+        list of sparse matrices or 3D array
+
+        """
+        checked = []
+        for i0, i1, j0, j1 in rects:
+            i0, i1 = self._process_slice(slice(i0, i1), self._shape[0])
+            j0, j1 = self._process_slice(slice(j0, j1), self._shape[1])
+            _check_bounds(i0, i1, self._shape[0])
+            _check_bounds(j0, j1, self._shape[1])
+            checked.append((i0, i1, j0, j1))
+        if dense and len(set((i1 - i0, j1 - j0)
+                             for i0, i1, j0, j1 in checked)) > 1:
+            raise ValueError("Rectangles must have the same shape to be "
+                             "stacked into a dense array.")
+
+        if self._slice_many is not None:
+            mats = self._slice_many(self.field, checked)
+        else:
+            mats = [self._slice(self.field, *rect) for rect in checked]
+
+        if dense:
+            if not checked:
+                return np.zeros((0, 0, 0))
+            return np.stack([mat.toarray() for mat in mats])
+        return mats
+
+    def fetch_many(self, regions, regions2=None, dense=False):
+        """
+        Query many pairs of regions at once. See ``slices``.
+
+        Parameters
+        ----------
+        regions : sequence
+            Regions along the rows, in any format accepted by ``fetch``.
+        regions2 : sequence, optional
+            Regions along the columns. Defaults to ``regions``.
+        dense : bool, optional
+            Return a dense 3D array instead of a list of sparse matrices.
+
+        """
+        if regions2 is None:
+            regions2 = regions
+        if len(regions2) != len(regions):
+            raise ValueError("regions and regions2 must have the same length")
+        if self._fetch_many is not None:
+            rects = self._fetch_many(regions, regions2)
+        elif self._fetch is not None:
+            rects = [self._fetch(r1, r2) for r1, r2 in zip(regions, regions2)]
+        else:
+            raise NotImplementedError
+        return self.slices(rects, dense=dense)
+
+    def lookup(self, i, j, **kwargs):
+        """
+        Values of the matrix at scattered pairs of bin IDs.
+
+        Parameters
+        ----------
+        i, j : array-like of int
+            Row and column bin IDs of the elements, in any order and on
+            either side of the diagonal.
+
+        Returns
+        -------
+        1D array of values, 0 where there is no pixel
+
+        """
+        if self._lookup is None:
+            raise NotImplementedError
+        i = np.asarray(i, dtype=np.int64).ravel()
+        j = np.asarray(j, dtype=np.int64).ravel()
+        if len(i) != len(j):
+            raise ValueError("i and j must have the same length")
+        for ids, n in ((i, self._shape[0]), (j, self._shape[1])):
+            if len(ids) and (ids.min() < 0 or ids.max() >= n):
+                raise IndexError("bin IDs out of range")
+        return self._lookup(self.field, i, j, **kwargs)
+
+    def band(self, region, max_diag, dense=False):
+        """
+        Query the diagonal band of a square region of the matrix.
+
+        Parameters
+        ----------
+        region : str or tuple
+            Genomic region, in any format accepted by ``fetch``.
+        max_diag : int
+            Number of diagonals of the band, starting from the main diagonal.
+        dense : bool, optional
+            Return a dense array of shape ``(n, max_diag)`` whose element
+            ``[r, d]`` is the matrix element ``(r, r + d)`` of the region,
+            NaN past the end of the region. Otherwise, return the upper band
+            as a ``scipy.sparse.dia_matrix`` of shape ``(n, n)``.
+
+        """
+        if self._band is None or self._fetch is None:
+            raise NotImplementedError
+        if max_diag < 0:
+            raise ValueError("max_diag must be non-negative")
+        i0, i1, _, _ = self._fetch(region)
+        return self._band(self.field, i0, i1, max_diag, dense)
+
+    def to_dask(self, chunksize=None):
+        """
+        Lazy block-sparse dask array of the matrix, in square blocks of
+        ``chunksize`` bins. Requires dask and sparse.
+
+        Each block is a ``sparse.COO`` array read by a separate task that
+        invokes the slicer, so the graph can run on the multiprocessing or
+        distributed schedulers as long as the slicer is picklable.
+
+        """
+        try:
+            import dask.array as da
+            import sparse
+        except ImportError:
+            raise ImportError("Dask export requires dask[array] and sparse.")
+        if chunksize is None:
+            chunksize = max(self._shape)
+        dtype = self._slice(self.field, 0, 0, 0, 0).dtype
+        edges = []
+        for n in self._shape:
+            e = np.arange(0, n + chunksize, chunksize)
+            e[-1] = n
+            edges.append(np.unique(e))
+        chunks = tuple(tuple(np.diff(e).tolist()) for e in edges)
+
+        name = 'cooler-matrix-{}'.format(uuid.uuid4().hex)
+        dsk = {}
+        for bi, (i0, i1) in enumerate(zip(edges[0][:-1], edges[0][1:])):
+            for bj, (j0, j1) in enumerate(zip(edges[1][:-1], edges[1][1:])):
+                dsk[name, bi, bj] = (_sparse_block, self._slice, self.field,
+                                     int(i0), int(i1), int(j0), int(j1))
+        meta = sparse.COO.from_numpy(np.empty((0, 0), dtype=dtype))
+        return da.Array(dsk, name, chunks, meta=meta)
+
+
+def _sparse_block(slicer, field, i0, i1, j0, j1):
+    import sparse
+    return sparse.COO.from_scipy_sparse(slicer(field, i0, i1, j0, j1))
@@ -193,6 +193,9 @@ def iterative_correction(h5, cooler_root='/', chunksize=None, map=map, tol=1e-5,
         Vector of bin bias weights to normalize the observed contact map.
         Dropped bins will be assigned the value NaN.
         N[i, j] = O[i, j] * bias[i] * bias[j]
+    stats : dict
+        Balancing parameters, the ``scale`` of the marginals and whether the
+        balancing ``converged`` before the iteration limit.
 
     """
     filepath = h5.file.filename
@@ -260,11 +263,13 @@ def iterative_correction(h5, cooler_root='/', chunksize=None, map=map, tol=1e-5,
         var = nzmarg.var()
         print("variance is", var)
         if var < tol:
-            factor = np.sqrt(nzmarg.mean())
-            bias[bias == 0] = np.nan
+            converged = True
             break
     else:
+        converged = False
         warnings.warn('Iteration limit reached without convergence.')
+    factor = np.sqrt(nzmarg.mean())
+    bias[bias == 0] = np.nan
 
     # TODO: fix cis_only
 
@@ -276,6 +281,7 @@ def iterative_correction(h5, cooler_root='/', chunksize=None, map=map, tol=1e-5,
         'cis_only': cis_only,
         'ignore_diags': ignore_diags,
         'scale': factor if not cis_only else np.nan,
+        'converged': converged,
     }
 
     if normalize_marginals:
@@ -9,9 +9,11 @@ import numpy as np
 import h5py
 
 from ._reader import (ContactReader, HDF5Aggregator, TabixAggregator,
-                      PairixAggregator, CoolerAggregator, SparseLoader, 
-                      DenseLoader)
+                      PairixAggregator, PairsAggregator,
+                      ExternalSortAggregator, CoolerAggregator, SparseLoader,
+                      SparseTileLoader, DenseLoader, DenseTileLoader)
 from ._writer import write_chroms, write_bins, write_pixels, write_indexes, write_info
+from ._multires import zoomify
 from ..util import get_binsize
 
 
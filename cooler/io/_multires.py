@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-resolution pyramids
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Build every zoom level of a multires cooler file in a single pass over the
+base-resolution pixels. Each level runs on its own thread: it aggregates the
+sorted pixel chunks produced by its parent level, writes them out, and hands
+its own chunks to the coarser levels through bounded in-memory queues.
+
+"""
+from __future__ import division, print_function
+from six.moves import queue
+import threading
+import warnings
+import sys
+
+import numpy as np
+import pandas
+import h5py
+import six
+
+from ._reader import ContactReader, _sum_pixels
+from ..util import binnify
+
+
+_DONE = object()
+
+# defaults of the cooler balance command
+BALANCE_ARGS = {
+    'mad_max': 3,
+    'min_nnz': 10,
+    'min_count': 0,
+    'ignore_diags': 2,
+    'tol': 1e-5,
+    'max_iters': 200,
+}
+
+
+class _Aborted(Exception):
+    pass
+
+
+def _put(q, item, stop):
+    while True:
+        if stop.is_set():
+            raise _Aborted
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+
+def _drain(q, stop):
+    while True:
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                raise _Aborted
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+
+def _bin_lookup(chromsizes, old_bins, new_bins):
+    # old bin ID -> new bin ID, using the old bin start as anchor
+    cumul_length = np.r_[0, np.cumsum(chromsizes.values)]
+    old_abs_starts = (cumul_length[chromsizes.index.get_indexer(old_bins['chrom'])]
+                      + old_bins['start'].values)
+    new_abs_starts = (cumul_length[chromsizes.index.get_indexer(new_bins['chrom'])]
+                      + new_bins['start'].values)
+    return np.searchsorted(new_abs_starts, old_abs_starts, side='right') - 1
+
+
+class _PixelReader(ContactReader):
+    """
+    Read the pixel table of a cooler in chunks of ``chunksize`` records.
+
+    """
+    def __init__(self, cooler_path, cooler_root, chunksize):
+        self.cooler_path = cooler_path
+        self.cooler_root = cooler_root
+        self.chunksize = chunksize
+
+    def size(self):
+        return None
+
+    def __iter__(self):
+        with h5py.File(self.cooler_path, 'r') as h5:
+            grp = h5[self.cooler_root]['pixels']
+            nnz = len(grp['bin1_id'])
+            for lo in range(0, nnz, self.chunksize):
+                hi = min(lo + self.chunksize, nnz)
+                yield {
+                    'bin1_id': grp['bin1_id'][lo:hi],
+                    'bin2_id': grp['bin2_id'][lo:hi],
+                    'count': grp['count'][lo:hi],
+                }
+
+
+class _StreamAggregator(ContactReader):
+    """
+    Aggregate a stream of sorted pixel chunks onto a coarser bin table.
+
+    Pixels of the last coarse row seen in a chunk are carried over to the
+    next one, so that every emitted chunk holds complete rows.
+
+    """
+    def __init__(self, chunks, lookup):
+        self.chunks = chunks
+        self.lookup = lookup
+
+    def size(self):
+        return None
+
+    def __iter__(self):
+        lookup = self.lookup
+        carry = None
+        for chunk in self.chunks:
+            bin1 = lookup[chunk['bin1_id']]
+            bin2 = lookup[chunk['bin2_id']]
+            count = chunk['count']
+            if carry is not None:
+                bin1 = np.r_[carry[0], bin1]
+                bin2 = np.r_[carry[1], bin2]
+                count = np.r_[carry[2], count]
+            if not len(bin1):
+                continue
+            split = np.searchsorted(bin1, bin1[-1], side='left')
+            carry = (bin1[split:], bin2[split:], count[split:])
+            if split > 0:
+                yield _sum_pixels(bin1[:split], bin2[:split], count[:split])
+        if carry is not None and len(carry[0]):
+            yield _sum_pixels(*carry)
+
+
+class _Tee(ContactReader):
+    """
+    Pass the chunks of a reader through while copying them to the input
+    queues of the coarser levels.
+
+    """
+    def __init__(self, reader, queues, stop):
+        self.reader = reader
+        self.queues = queues
+        self.stop = stop
+
+    def size(self):
+        return None
+
+    def __iter__(self):
+        for chunk in self.reader:
+            for q in self.queues:
+                _put(q, chunk, self.stop)
+            yield chunk
+        for q in self.queues:
+            _put(q, _DONE, self.stop)
+
+
+def zoomify(cool_path, out_path, resolutions, chunksize=int(10e6),
+            balance=False, balance_args=None, map=map, queue_size=4,
+            h5opts=None):
+    """
+    Build a multi-resolution cooler file from a single-resolution cooler.
+
+    The base pixels are read once. Each coarser level is aggregated from the
+    coarsest finer level whose bin size divides its own, and all levels are
+    written concurrently.
+
+    Parameters
+    ----------
+    cool_path : str
+        Path to the base-resolution cooler file. It must have uniform bins.
+    out_path : str
+        Path to the output file, which is overwritten.
+    resolutions : sequence of int
+        Bin sizes of the coarser levels. Each must be a multiple of the base
+        bin size. The base resolution is always included.
+    chunksize : int, optional
+        Number of base pixels to read at a time.
+    balance : bool, optional
+        Balance the aggregated levels after they are written. The base level
+        is balanced as well unless it already has a ``weight`` column.
+    balance_args : dict, optional
+        Keyword arguments for :func:`cooler.ice.iterative_correction`,
+        overriding the defaults of the ``cooler balance`` command. Levels
+        whose balancing does not converge are left without weights, with a
+        warning.
+    map : callable, optional
+        Map function used for balancing.
+    queue_size : int, optional
+        Maximum number of chunks queued between a level and each of its
+        coarser levels.
+    h5opts : dict, optional
+        HDF5 dataset filter options.
+
+    Notes
+    -----
+    Levels are stored in groups named by zoom level, from "0" for the
+    coarsest to ``max-zoom`` for the base resolution. The root attributes
+    map each zoom level to its bin size and record ``max-zoom``.
+
+    """
+    from ..api import info as get_info, chroms as get_chroms, bins as get_bins
+    from . import create
+
+    if h5opts is None:
+        h5opts = dict(compression='gzip', compression_opts=6)
+    with h5py.File(cool_path, 'r') as h5:
+        info = get_info(h5)
+        chromtable = get_chroms(h5)
+        base_bins = get_bins(h5, fields=['chrom', 'start', 'end'])
+    base_binsize = info['bin-size']
+    if not isinstance(base_binsize, (int, np.integer)):
+        raise ValueError("The base cooler must have uniform bins.")
+    base_binsize = int(base_binsize)
+    chroms = list(chromtable['name'])
+    lengths = list(chromtable['length'])
+    chromsizes = pandas.Series(lengths, index=chroms)
+
+    resolutions = sorted(set(int(r) for r in resolutions) | {base_binsize})
+    for res in resolutions:
+        if res % base_binsize != 0:
+            raise ValueError(
+                "Resolution {} is not a multiple of the base resolution "
+                "{}.".format(res, base_binsize))
+
+    n_levels = len(resolutions)
+    max_zoom = n_levels - 1
+    zooms = {res: max_zoom - i for i, res in enumerate(resolutions)}
+
+    # each level is fed by the coarsest finer level that divides it
+    parents = {}
+    for i, res in enumerate(resolutions[1:], 1):
+        parents[res] = [r for r in resolutions[:i] if res % r == 0][-1]
+    children = {res: [r for r in resolutions if parents.get(r) == res]
+                for res in resolutions}
+
+    bins = {res: binnify(chromsizes, res) for res in resolutions[1:]}
+    bins[base_binsize] = base_bins
+    queues = {res: queue.Queue(maxsize=queue_size) for res in resolutions[1:]}
+    metadata = info.get('metadata')
+    assembly = info.get('genome-assembly')
+
+    stop = threading.Event()
+    errors = []
+
+    def _run(h5, res):
+        try:
+            if res == base_binsize:
+                reader = _PixelReader(cool_path, '/', chunksize)
+            else:
+                lookup = _bin_lookup(chromsizes, bins[parents[res]], bins[res])
+                reader = _StreamAggregator(_drain(queues[res], stop), lookup)
+            reader = _Tee(reader, [queues[r] for r in children[res]], stop)
+            create(h5.create_group(str(zooms[res])), chroms, lengths,
+                   bins[res], reader, metadata, assembly, h5opts)
+        except _Aborted:
+            pass
+        except Exception:
+            errors.append(sys.exc_info())
+            stop.set()
+
+    with h5py.File(out_path, 'w') as h5:
+        threads = [threading.Thread(target=_run, args=(h5, res))
+                   for res in resolutions]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            six.reraise(*errors[0])
+
+        for res in resolutions:
+            h5.attrs[str(zooms[res])] = res
+        h5.attrs['max-zoom'] = max_zoom
+
+        # carry over extra base bin columns, e.g. balancing weights
+        with h5py.File(cool_path, 'r') as src:
+            src_bins = src['bins']
+            dest_bins = h5[str(max_zoom)]['bins']
+            for name in src_bins:
+                if name not in dest_bins:
+                    src_bins.copy(name, dest_bins)
+
+    if balance:
+        from .. import ice
+        kwargs = dict(BALANCE_ARGS)
+        kwargs.update(balance_args or {})
+        for res in resolutions:
+            zoom = str(zooms[res])
+            with h5py.File(out_path, 'r') as h5:
+                if 'weight' in h5[zoom]['bins']:
+                    continue
+                bias, stats = ice.iterative_correction(
+                    h5, zoom, chunksize=chunksize, map=map, **kwargs)
+            if not stats['converged']:
+                warnings.warn(
+                    "Balancing of zoom level {} ({} bp) did not converge; "
+                    "no weights were written.".format(zoom, res))
+                continue
+            with h5py.File(out_path, 'r+') as h5:
+                dset = h5[zoom]['bins'].create_dataset(
+                    'weight', data=bias, **h5opts)
+                dset.attrs.update(stats)
+
@@ -12,19 +12,20 @@ from collections import OrderedDict, Counter
 from contextlib import contextmanager
 from bisect import bisect_left
 from multiprocess import Pool
-import subprocess
 import itertools
+import tempfile
+import shutil
 import warnings
 import json
 import sys
+import os
 import six
 
-from pandas.algos import is_lexsorted
 import numpy as np
 import pandas
 import h5py
 
-from ..util import rlencode, get_binsize
+from ..util import rlencode, get_binsize, read_ahead
 
 
 class ContactReader(object):
@@ -362,10 +363,450 @@ class PairixAggregator(ContactReader):
             pool.close()
 
 
+def _reduce_pixels(keys, counts=None):
+    """
+    Sort pixel keys and sum the counts of duplicates. If ``counts`` is not
+    provided, every key counts as a single contact.
+
+    """
+    if counts is None:
+        return np.unique(keys, return_counts=True)
+    if not len(keys):
+        return keys, counts
+    order = np.argsort(keys, kind='mergesort')
+    keys, counts = keys[order], counts[order]
+    starts = np.r_[0, np.flatnonzero(keys[1:] != keys[:-1]) + 1]
+    return keys[starts], np.add.reduceat(counts, starts)
+
+
+def _sum_pixels(bin1, bin2, count):
+    """
+    Sum the counts of duplicate (bin1, bin2) pixels. Returns a pixel chunk
+    sorted by ``bin1_id`` then ``bin2_id``.
+
+    """
+    if not len(bin1):
+        return {'bin1_id': bin1, 'bin2_id': bin2, 'count': count}
+
+    # combine the bin IDs into keys local to the chunk
+    r0, c0 = bin1.min(), bin2.min()
+    n_cols = bin2.max() - c0 + 1
+    n_keys = (bin1.max() - r0 + 1) * n_cols
+    keys = (bin1 - r0) * n_cols + (bin2 - c0)
+
+    if n_keys <= 4 * len(keys):
+        # dense enough to sum without sorting
+        occupied = np.flatnonzero(np.bincount(keys, minlength=n_keys))
+        sums = np.bincount(keys, weights=count, minlength=n_keys)
+        keys, count = occupied, sums[occupied].astype(count.dtype)
+    else:
+        keys, count = _reduce_pixels(keys, count)
+
+    return {
+        'bin1_id': r0 + keys // n_cols,
+        'bin2_id': c0 + keys % n_cols,
+        'count': count,
+    }
+
+
+class _ContactBinner(object):
+    """
+    Assign contacts given as pairs of genomic coordinates to genomic bins.
+
+    Returns upper triangular pixel keys ``bin1_id * n_bins + bin2_id``, which
+    sort lexically by ``bin1_id`` then ``bin2_id``. Contacts on chromosomes
+    not listed in ``chromsizes`` are discarded.
+
+    """
+    def __init__(self, chromsizes, bins):
+        self.chroms = list(chromsizes.keys())
+        self.n_bins = len(bins)
+        self.binsize = get_binsize(bins)
+        idmap = pandas.Series(index=self.chroms, data=range(len(self.chroms)))
+        bin_chrom_ids = idmap[bins['chrom']].values
+        self.cumul_length = np.r_[0, np.cumsum(chromsizes)]
+        self.abs_start_coords = (self.cumul_length[bin_chrom_ids] +
+                                 bins['start'].values)
+        # chrom offset index: chrom_id -> offset in bins
+        chrom_nbins = np.bincount(bin_chrom_ids, minlength=len(self.chroms))
+        self.chrom_offset = np.r_[0, np.cumsum(chrom_nbins)]
+
+    def chrom_ids(self, names):
+        return pandas.Categorical(names, categories=self.chroms).codes
+
+    def __call__(self, chrom_id1, pos1, chrom_id2, pos2):
+        mask = (chrom_id1 >= 0) & (chrom_id2 >= 0)
+        chrom_id1, chrom_id2 = chrom_id1[mask], chrom_id2[mask]
+        pos1 = np.asarray(pos1)[mask].astype(np.int64)
+        pos2 = np.asarray(pos2)[mask].astype(np.int64)
+
+        if self.binsize is None:
+            bin1 = np.searchsorted(self.abs_start_coords,
+                                   self.cumul_length[chrom_id1] + pos1,
+                                   side='right') - 1
+            bin2 = np.searchsorted(self.abs_start_coords,
+                                   self.cumul_length[chrom_id2] + pos2,
+                                   side='right') - 1
+        else:
+            bin1 = self.chrom_offset[chrom_id1] + pos1 // self.binsize
+            bin2 = self.chrom_offset[chrom_id2] + pos2 // self.binsize
+
+        # flip contacts that map to the lower triangle
+        return (np.minimum(bin1, bin2).astype(np.int64) * self.n_bins +
+                np.maximum(bin1, bin2))
+
+    def split_by_chrom(self, keys, counts):
+        """Split sorted pixel keys by the chromosome of their first bin."""
+        edges = np.searchsorted(keys, self.chrom_offset * self.n_bins)
+        for cid, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+            if hi > lo:
+                yield cid, keys[lo:hi], counts[lo:hi]
+
+    def to_pixels(self, keys, counts):
+        return {
+            'bin1_id': keys // self.n_bins,
+            'bin2_id': keys % self.n_bins,
+            'count': counts,
+        }
+
+
+class ExternalSortAggregator(ContactReader):
+    """
+    Aggregate contacts supplied in any order using bounded memory.
+
+    Contacts are binned chunk by chunk and accumulated as aggregated pixels.
+    Whenever more than ``max_pixels`` pixels are buffered, the buffer is
+    sorted, reduced and spilled to disk as a run of (pixel key, count) NumPy
+    files. The sorted runs are then combined in a single k-way merge. Only
+    binned pixels are ever sorted, which is far less data than the original
+    text records.
+
+    Parameters
+    ----------
+    contacts : iterable
+        Chunks of contacts, each a DataFrame or dict of 1D arrays with keys
+        ``chrom1``, ``pos1``, ``chrom2`` and ``pos2``. Chromosomes may be given
+        as names or as integer IDs into ``chromsizes``.
+    chromsizes : pandas.Series
+        Chromosome lengths indexed by name, in the desired order.
+    bins : pandas.DataFrame
+        Genomic bin segmentation.
+    max_pixels : int, optional
+        Number of pixels to buffer in memory before spilling a sorted run to
+        disk. Also bounds the memory used while merging.
+    tmpdir : str, optional
+        Directory in which to create the temporary run files. Defaults to the
+        platform's temporary directory.
+
+    """
+    def __init__(self, contacts, chromsizes, bins, max_pixels=int(50e6),
+                 tmpdir=None):
+        self.contacts = contacts
+        self.max_pixels = max_pixels
+        self.tmpdir = tmpdir
+        self.binner = _ContactBinner(chromsizes, bins)
+
+    def size(self):
+        return None
+
+    def _chrom_ids(self, chroms):
+        chroms = np.asarray(chroms)
+        if chroms.dtype.kind in 'iu':
+            return chroms
+        return self.binner.chrom_ids(chroms)
+
+    def _spill(self, tmpdir, keys, counts):
+        prefix = os.path.join(tmpdir, 'run{}'.format(len(os.listdir(tmpdir))))
+        np.save(prefix + '.keys.npy', keys)
+        np.save(prefix + '.counts.npy', counts)
+        return prefix + '.keys.npy', prefix + '.counts.npy'
+
+    def _merge(self, runs):
+        if not runs:
+            return
+        runs = [(np.load(kpath, mmap_mode='r'), np.load(cpath, mmap_mode='r'))
+                for kpath, cpath in runs]
+        blocksize = max(self.max_pixels // len(runs), 1)
+        cursors = [0] * len(runs)
+        while True:
+            active = [r for r in range(len(runs))
+                        if cursors[r] < len(runs[r][0])]
+            if not active:
+                break
+
+            # All keys up to the smallest last key among the runs' current
+            # blocks are guaranteed to be in memory.
+            bound = None
+            for r in active:
+                hi = cursors[r] + blocksize
+                if hi < len(runs[r][0]):
+                    last = runs[r][0][hi - 1]
+                    bound = last if bound is None else min(bound, last)
+
+            keys, counts = [], []
+            for r in active:
+                lo = cursors[r]
+                block = np.asarray(runs[r][0][lo:lo + blocksize])
+                if bound is None:
+                    n = len(block)
+                else:
+                    n = int(np.searchsorted(block, bound, side='right'))
+                keys.append(block[:n])
+                counts.append(np.asarray(runs[r][1][lo:lo + n]))
+                cursors[r] = lo + n
+
+            keys, counts = _reduce_pixels(
+                np.concatenate(keys), np.concatenate(counts))
+            if len(keys):
+                yield self.binner.to_pixels(keys, counts)
+
+    def __iter__(self):
+        tmpdir = tempfile.mkdtemp(prefix='cooler-', dir=self.tmpdir)
+        try:
+            runs = []
+            buf, n_buf = [], 0
+            for chunk in self.contacts:
+                buf.append(_reduce_pixels(self.binner(
+                    self._chrom_ids(chunk['chrom1']), chunk['pos1'],
+                    self._chrom_ids(chunk['chrom2']), chunk['pos2'])))
+                n_buf += len(buf[-1][0])
+                if n_buf > self.max_pixels:
+                    keys, counts = _reduce_pixels(
+                        np.concatenate([b[0] for b in buf]),
+                        np.concatenate([b[1] for b in buf]))
+                    # spill unless reducing freed up most of the buffer
+                    if len(keys) > self.max_pixels // 2:
+                        runs.append(self._spill(tmpdir, keys, counts))
+                        buf, n_buf = [], 0
+                    else:
+                        buf, n_buf = [(keys, counts)], len(keys)
+
+            if buf:
+                keys, counts = _reduce_pixels(
+                    np.concatenate([b[0] for b in buf]),
+                    np.concatenate([b[1] for b in buf]))
+                del buf
+                if not runs:
+                    if len(keys):
+                        yield self.binner.to_pixels(keys, counts)
+                    return
+                runs.append(self._spill(tmpdir, keys, counts))
+
+            for chunk in self._merge(runs):
+                yield chunk
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class PairsAggregator(ContactReader):
+    """
+    Aggregate contacts from a plain or gzipped tab-delimited text file of read
+    pairs by streaming it sequentially in large chunks. No index is required.
+
+    Sorted input must satisfy two conditions:
+
+    * the contacts sharing the same ``chrom1`` occupy a contiguous block of
+      lines, in any chromosome order;
+    * each contact is upper triangular, i.e. its ``chrom2`` does not come
+      before its ``chrom1`` either in the order of ``chromsizes`` or in the
+      order of the chrom1 blocks in the file.
+
+    The output of ``cooler csort`` satisfies both. The pixels of a
+    chromosome's rows are emitted in ``chromsizes`` order, as soon as no later
+    line can contribute to them. While the chrom1 blocks follow the order of
+    ``chromsizes`` or of the chromosome names (as ``sort`` leaves them), a
+    chromosome whose block should already have come is taken to have none,
+    so blocks in other orders must not start out following either. A contact
+    whose rows were already emitted raises a ``ValueError``. For other input,
+    e.g. a file sorted by ``chrom1`` holding contacts in both orientations,
+    pass ``is_sorted=False`` and the contacts will be aggregated out of core
+    by an :class:`ExternalSortAggregator`.
+
+    Parameters
+    ----------
+    filepath_or_buffer : str or file-like
+        Path to the pairs file or an open text stream, e.g. ``sys.stdin``.
+        Paths ending in .gz are decompressed on the fly.
+    chromsizes : pandas.Series
+        Chromosome lengths indexed by name, in the desired order.
+    bins : pandas.DataFrame
+        Genomic bin segmentation.
+    chunksize : int
+        Number of lines to parse at a time.
+    is_sorted : bool, optional
+        Whether the input is grouped by ``chrom1`` and upper triangular, as
+        described above.
+    chrom1_field, pos1_field, chrom2_field, pos2_field : int, optional
+        Zero-based column numbers of the pair coordinates.
+    max_pixels, tmpdir : optional
+        Memory budget and scratch directory used for unsorted input. See
+        :class:`ExternalSortAggregator`.
+
+    """
+    def __init__(self, filepath_or_buffer, chromsizes, bins, chunksize,
+                 is_sorted=True, chrom1_field=0, pos1_field=1, chrom2_field=3,
+                 pos2_field=4, comment='#', max_pixels=int(50e6), tmpdir=None):
+        self.filepath_or_buffer = filepath_or_buffer
+        self.chromsizes = chromsizes
+        self.bins = bins
+        self.chunksize = chunksize
+        self.is_sorted = is_sorted
+        self.fields = (chrom1_field, pos1_field, chrom2_field, pos2_field)
+        self.comment = comment
+        self.max_pixels = max_pixels
+        self.tmpdir = tmpdir
+        self.binner = _ContactBinner(chromsizes, bins)
+
+    def size(self):
+        # unknown without a full pass over the input
+        return None
+
+    def _read_chunks(self):
+        C1, P1, C2, P2 = self.fields
+        kwargs = {}
+        if (isinstance(self.filepath_or_buffer, six.string_types) and
+                self.filepath_or_buffer.endswith('.gz')):
+            kwargs['compression'] = 'gzip'
+        reader = pandas.read_csv(
+            self.filepath_or_buffer,
+            sep='\t',
+            header=None,
+            usecols=[C1, P1, C2, P2],
+            dtype={C1: str, P1: np.int64, C2: str, P2: np.int64},
+            comment=self.comment,
+            chunksize=self.chunksize,
+            **kwargs)
+        for chunk in reader:
+            yield {
+                'chrom1': chunk[C1].values,
+                'pos1': chunk[P1].values,
+                'chrom2': chunk[C2].values,
+                'pos2': chunk[P2].values,
+            }
+
+    def _iter_binned(self):
+        for chunk in self._read_chunks():
+            chrom_id1 = self.binner.chrom_ids(chunk['chrom1'])
+            chrom_id2 = self.binner.chrom_ids(chunk['chrom2'])
+            keys, counts = _reduce_pixels(self.binner(
+                chrom_id1, chunk['pos1'], chrom_id2, chunk['pos2']))
+            # the chrom1 blocks in the order they occur, and the one that may
+            # continue into the next chunk
+            cids = chrom_id1[chrom_id1 >= 0]
+            blocks = cids[np.r_[True, cids[1:] != cids[:-1]]] if len(cids) \
+                else cids
+            last_cid = chrom_id1[-1] if len(chrom_id1) else -1
+            yield keys, counts, blocks, last_cid
+
+    def __iter__(self):
+        if not self.is_sorted:
+            reader = ExternalSortAggregator(
+                self._read_chunks(), self.chromsizes, self.bins,
+                self.max_pixels, self.tmpdir)
+            for chunk in reader:
+                yield chunk
+            return
+
+        binner = self.binner
+        n_chroms = len(binner.chroms)
+        pending = [[] for _ in range(n_chroms)]
+        closed = np.zeros(n_chroms, dtype=bool)
+        seen = np.zeros(n_chroms, dtype=bool)
+        next_cid = 0
+        # ranks of the chromosomes in the block orders the input may follow:
+        # chromsizes order and name order. Orders that the blocks seen so far
+        # contradict are dropped.
+        orders = [np.arange(n_chroms),
+                  np.argsort(np.argsort(np.asarray(binner.chroms, dtype=str),
+                                        kind='mergesort'))]
+        prev_cid = -1
+
+        for keys, counts, blocks, last_cid in self._iter_binned():
+            for cid, k, v in binner.split_by_chrom(keys, counts):
+                if cid < next_cid:
+                    raise ValueError(
+                        "Found contacts in the rows of chromosome '{}' after "
+                        "they were written. The input must be grouped by "
+                        "chrom1 and have chrom2 no earlier than chrom1, in "
+                        "chromosome order or in file order (e.g. the output "
+                        "of cooler csort). Use the unsorted mode "
+                        "instead.".format(binner.chroms[cid]))
+                pending[cid].append((k, v))
+                # consolidate to bound the number of partial aggregates
+                if len(pending[cid]) >= 16:
+                    pending[cid] = [_reduce_pixels(
+                        np.concatenate([p[0] for p in pending[cid]]),
+                        np.concatenate([p[1] for p in pending[cid]]))]
+
+            # a chrom1 block is complete once the input moves past it. Rows
+            # are keyed by the post-flip chromosome, so the rows of a
+            # chromosome are written once every block up to it in
+            # chromsizes order is complete.
+            seen[blocks] = True
+            closed[seen] = True
+            if last_cid >= 0:
+                closed[last_cid] = False
+
+            # a chromosome whose block should have come before the current
+            # one in every remaining order has no block, and no rows
+            if len(blocks):
+                seq = blocks if prev_cid < 0 else np.r_[prev_cid, blocks]
+                orders = [rank for rank in orders
+                          if np.all(np.diff(rank[seq]) >= 0)]
+                prev_cid = blocks[-1]
+                # a single block does not tell the order apart from others
+                if orders and seen.sum() > 1:
+                    skipped = ~seen
+                    for rank in orders:
+                        skipped &= rank < rank[prev_cid]
+                    closed[skipped] = True
+
+            while next_cid < n_chroms and closed[next_cid]:
+                chunk = self._flush(pending, next_cid)
+                if chunk is not None:
+                    yield chunk
+                next_cid += 1
+
+        while next_cid < n_chroms:
+            chunk = self._flush(pending, next_cid)
+            if chunk is not None:
+                yield chunk
+            next_cid += 1
+
+    def _flush(self, pending, cid):
+        parts, pending[cid] = pending[cid], None
+        if not parts:
+            return None
+        keys, counts = _reduce_pixels(
+            np.concatenate([p[0] for p in parts]),
+            np.concatenate([p[1] for p in parts]))
+        return self.binner.to_pixels(keys, counts)
+
+
 class CoolerAggregator(ContactReader):
     """
     Aggregate contacts from an existing Cooler file.
 
+    Each old bin is assigned to the new bin that contains its start
+    coordinate through a precomputed lookup array, so the new bin table may
+    be any segmentation of the same genome assembly, not just a uniform
+    coarsening. Pixels are read in spans of whole new-bin rows of about
+    ``chunksize`` pixels, mapped to new bin IDs and summed.
+
+    Parameters
+    ----------
+    cooler_path : str
+        Path to the input cooler file.
+    bins : pandas.DataFrame
+        New bin segmentation.
+    chunksize : int
+        Approximate number of input pixels to process at a time.
+    cooler_root : str, optional
+        HDF5 path to the input cooler tree.
+    map : callable, optional
+        Map function used to aggregate the spans, e.g. the ``imap`` method of
+        a process pool.
+
     """
     def __init__(self, cooler_path, bins, chunksize, cooler_root="/", map=map):
         self._map = map
@@ -377,24 +818,23 @@ class CoolerAggregator(ContactReader):
             self._size = grp.attrs['nnz']
             chroms = grp['chroms/name'][:].astype('U')
             lengths = grp['chroms/length'][:]
-            self.old_chrom_offset = grp['indexes/chrom_offset'][:]
+            old_chrom_ids = grp['bins/chrom'][:]
+            old_starts = grp['bins/start'][:]
             self.old_bin1_offset = grp['indexes/bin1_offset'][:]
-            self.old_binsize = grp.attrs['bin-size']
 
-        self.new_binsize = get_binsize(bins)
-        assert self.new_binsize % self.old_binsize == 0
-        self.factor = self.new_binsize // self.old_binsize
         self.chunksize = chunksize
-        #self.new_bins = bins
-        
         self.chroms = chroms
         self.idmap = pandas.Series(index=chroms, data=range(len(chroms)))
         bin_chrom_ids = self.idmap[bins['chrom']].values
         self.cumul_length = np.r_[0, np.cumsum(lengths)]
-        self.abs_start_coords = self.cumul_length[bin_chrom_ids] + bins['start']
+        self.abs_start_coords = (self.cumul_length[bin_chrom_ids] +
+                                 bins['start'].values)
 
-        # chrom offset index: chrom_id -> offset in bins
-        self.chrom_offset = np.r_[0, np.cumsum(bins.groupby('chrom', sort=False).size())]
+        # old bin ID -> new bin ID, using the old bin start as anchor
+        # XXX - alternatives: midpoint anchor, proportional re-binning
+        old_abs_starts = self.cumul_length[old_chrom_ids] + old_starts
+        self.lookup = np.searchsorted(
+            self.abs_start_coords, old_abs_starts, side='right') - 1
 
     def size(self):
         return self._size
@@ -405,133 +845,386 @@ class CoolerAggregator(ContactReader):
         return d
     
     def _aggregate(self, span):
-        from ..api import Cooler
         lo, hi = span
-        print(lo, hi)
 
         # XXX - if necessary, put locks here
         with h5py.File(self.cooler_path, 'r') as h5:
-            table = Cooler(h5[self.cooler_root]).pixels(join=True)
-            chunk = table[lo:hi]
-            chunk['chrom1'] = pandas.Categorical(chunk['chrom1'], categories=self.chroms)
-            chunk['chrom2'] = pandas.Categorical(chunk['chrom2'], categories=self.chroms)
-            #print(lo, hi)
-
-        # use the "start" point as anchor for re-binning
-        # XXX - alternatives: midpoint anchor, proportional re-binning
-        binsize = self.new_binsize
-        chrom_offset = self.chrom_offset
-        cumul_length = self.cumul_length
-        abs_start_coords = self.abs_start_coords
+            grp = h5[self.cooler_root]
+            bin1 = self.lookup[grp['pixels/bin1_id'][lo:hi]]
+            bin2 = self.lookup[grp['pixels/bin2_id'][lo:hi]]
+            count = grp['pixels/count'][lo:hi]
 
-        chrom_id1 = chunk['chrom1'].cat.codes.values
-        chrom_id2 = chunk['chrom2'].cat.codes.values
-        start1 = chunk['start1'].values
-        start2 = chunk['start2'].values
-        if binsize is None:
-            abs_start1 = cumul_length[chrom_id1] + start1
-            abs_start2 = cumul_length[chrom_id2] + start2
-            chunk['bin1_id'] = np.searchsorted(abs_start_coords, abs_start1, side='right') - 1
-            chunk['bin2_id'] = np.searchsorted(abs_start_coords, abs_start2, side='right') - 1
-        else:
-            rel_bin1 = np.floor(start1/binsize).astype(int)
-            rel_bin2 = np.floor(start2/binsize).astype(int)
-            chunk['bin1_id'] = chrom_offset[chrom_id1] + rel_bin1
-            chunk['bin2_id'] = chrom_offset[chrom_id2] + rel_bin2
-
-        grouped = chunk.groupby(['bin1_id', 'bin2_id'], sort=False)
-        return grouped['count'].sum().reset_index()
+        return _sum_pixels(bin1, bin2, count)
 
     def aggregate(self, spans):
         return self._map(self._aggregate, spans)
 
-    def __iter__(self):
-        from itertools import chain
-        old_chrom_offset = self.old_chrom_offset
-        old_bin1_offset = self.old_bin1_offset
-        chunksize = self.chunksize
-        factor = self.factor
-        
+    def _spans(self):
+        # A span must contain whole rows of the new matrix. Group old rows by
+        # new row, then greedily pack new rows into spans of ~chunksize pixels.
+        lookup = self.lookup
+        row_edges = np.r_[0, np.flatnonzero(np.diff(lookup)) + 1, len(lookup)]
+        offsets = self.old_bin1_offset[row_edges]
         spans = []
-        for chrom, i in self.idmap.items():
-            # it's important to extract some multiple of `factor` rows at a time
-            c0, c1 = old_chrom_offset[i], old_chrom_offset[i+1]
-            step = (chunksize // factor) * factor
-            edges = np.arange(old_bin1_offset[c0], old_bin1_offset[c1]+step, step)
-            edges[-1] = old_bin1_offset[c1]
-            spans.append(zip(edges[:-1], edges[1:]))
-        spans = list(chain.from_iterable(spans))
-        
-        for df in self._map(self._aggregate, spans):
-            yield {k: v.values for k, v in six.iteritems(df)}
+        i, n = 0, len(offsets) - 1
+        while i < n:
+            j = np.searchsorted(
+                offsets, offsets[i] + self.chunksize, side='right') - 1
+            j = min(max(j, i + 1), n)
+            if offsets[j] > offsets[i]:
+                spans.append((offsets[i], offsets[j]))
+            i = j
+        return spans
+
+    def __iter__(self):
+        for chunk in self.aggregate(self._spans()):
+            yield chunk
 
 
 class SparseLoader(ContactReader):
     """
     Load binned contacts from a single 3-column sparse matrix text file.
 
+    The file is parsed in chunks as it is read, without counting its records
+    beforehand. Plain, gzip and bgzip input are recognized from the leading
+    bytes of the file. If pyarrow is installed, its multithreaded CSV reader
+    is used. Otherwise, the pandas parser runs on a background thread so that
+    decompression and parsing overlap with writing. Every chunk is checked to
+    be lexically sorted by ``bin1_id`` then ``bin2_id``.
+
+    Parameters
+    ----------
+    filepath : str
+        Path to the tab-delimited text file with columns ``bin1_id``,
+        ``bin2_id`` and ``count``.
+    chunksize : int
+        Approximate number of records to parse at a time.
+    use_pyarrow : bool, optional
+        Whether to parse with pyarrow. Default is to use it if available.
+
     """
-    def __init__(self, filepath, chunksize):
-        # number of lines in file
-        p1 = subprocess.Popen(['unpigz',  '-p', '8',  '-c', filepath], stdout=subprocess.PIPE)
-        p2 = subprocess.Popen(['wc', '-l'], stdin=p1.stdout, stdout=subprocess.PIPE)
-        self.n_records = int(p2.communicate()[0])
-
-        # file iterator
-        self.reader = pandas.read_csv(filepath, sep='\t', iterator=True,
-            names=['bin1_id', 'bin2_id', 'count'])
+    columns = ['bin1_id', 'bin2_id', 'count']
+
+    def __init__(self, filepath, chunksize, use_pyarrow=None):
+        self.filepath = filepath
         self.chunksize = chunksize
+        with open(filepath, 'rb') as f:
+            magic = f.read(2)
+        self.compression = 'gzip' if magic == b'\x1f\x8b' else None
+        if use_pyarrow is None:
+            try:
+                import pyarrow.csv
+                use_pyarrow = True
+            except ImportError:
+                use_pyarrow = False
+        self.use_pyarrow = use_pyarrow
 
     def size(self):
-        return self.n_records
+        # unknown without a full pass over the input
+        return None
+
+    def _read_pandas(self):
+        reader = pandas.read_csv(
+            self.filepath,
+            sep='\t',
+            header=None,
+            names=self.columns,
+            dtype={'bin1_id': np.int64, 'bin2_id': np.int64},
+            compression=self.compression,
+            chunksize=self.chunksize)
+        for df in reader:
+            yield {k: df[k].values for k in self.columns}
+
+    def _read_pyarrow(self):
+        import pyarrow
+        from pyarrow import csv
+        # pyarrow chunks by bytes: assume ~16 bytes per record
+        block_size = int(min(max(self.chunksize * 16, 2**20), 2**30))
+        stream = pyarrow.input_stream(
+            self.filepath, compression=self.compression)
+        reader = csv.open_csv(
+            stream,
+            read_options=csv.ReadOptions(
+                column_names=self.columns,
+                block_size=block_size,
+                use_threads=True),
+            parse_options=csv.ParseOptions(delimiter='\t'),
+            convert_options=csv.ConvertOptions(
+                column_types={'bin1_id': pyarrow.int64(),
+                              'bin2_id': pyarrow.int64()}))
+        for batch in reader:
+            yield {k: batch.column(i).to_numpy(zero_copy_only=False)
+                    for i, k in enumerate(self.columns)}
 
     def __iter__(self):
-        while True:
-            try:
-                data = self.reader.read(self.chunksize)
-                yield {k: v.values for k,v in six.iteritems(data)}
-            except StopIteration:
-                break
+        if self.use_pyarrow:
+            chunks = self._read_pyarrow()
+        else:
+            chunks = read_ahead(self._read_pandas(), depth=1)
+
+        n_read = 0
+        last = None
+        for chunk in chunks:
+            bin1, bin2 = chunk['bin1_id'], chunk['bin2_id']
+            if not len(bin1):
+                continue
+            if last is not None:
+                bin1_ = np.r_[last[0], bin1]
+                bin2_ = np.r_[last[1], bin2]
+            else:
+                bin1_, bin2_ = bin1, bin2
+            d1, d2 = np.diff(bin1_), np.diff(bin2_)
+            bad = np.flatnonzero((d1 < 0) | ((d1 == 0) & (d2 <= 0)))
+            if len(bad):
+                raise ValueError(
+                    "Records are not lexically sorted by bin1_id then "
+                    "bin2_id, or contain duplicates (record {}).".format(
+                        n_read + bad[0] + (1 if last is None else 0) + 1))
+            n_read += len(bin1)
+            last = bin1[-1], bin2[-1]
+            yield chunk
+
+
+class _TileLoader(ContactReader):
+    """
+    Common logic for loaders of contig-contig contact matrix tiles.
+
+    Tiles are oriented to the upper triangle of the genome-wide matrix with
+    respect to the chromosome order of ``chromsizes`` and grouped into row
+    bands, one per chromosome. Only the tiles of the current row band are
+    loaded at any time.
 
+    """
+    def __init__(self, tiles, chromsizes, bins, map=map):
+        self._map = map
+        self.chroms = list(chromsizes.keys())
+        self.idmap = dict(zip(self.chroms, range(len(self.chroms))))
+        bin_chrom_ids = pandas.Series(self.idmap)[bins['chrom']].values
+        chrom_nbins = np.bincount(bin_chrom_ids, minlength=len(self.chroms))
+        self.chrom_nbins = chrom_nbins
+        self.chrom_offset = np.r_[0, np.cumsum(chrom_nbins)]
+
+        # row band (chrom1 ID) -> list of (chrom2 ID, tile, transpose)
+        self.bands = {}
+        seen = set()
+        for (chrom1, chrom2), tile in six.iteritems(tiles):
+            cid1, cid2 = self.idmap[chrom1], self.idmap[chrom2]
+            transpose = cid1 > cid2
+            if transpose:
+                cid1, cid2 = cid2, cid1
+            if (cid1, cid2) in seen:
+                raise ValueError(
+                    "Tiles for both ({0}, {1}) and ({1}, {0}) were "
+                    "provided.".format(chrom1, chrom2))
+            seen.add((cid1, cid2))
+            self.bands.setdefault(cid1, []).append((cid2, tile, transpose))
+        for band in self.bands.values():
+            band.sort(key=lambda x: x[0])
 
-class SparseTileLoader(ContactReader):
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d.pop('_map', None)
+        return d
+
+    def size(self):
+        # unknown without loading every tile
+        return None
+
+    @staticmethod
+    def _sort_rows(bin1, bin2, values):
+        # records of a tile file may come in any order
+        idx = np.lexsort((bin2, bin1))
+        return {'bin1_id': bin1[idx], 'bin2_id': bin2[idx], 'count': values[idx]}
+
+
+class SparseTileLoader(_TileLoader):
     """
     Load binned contacts from a collection of 3-column sparse matrix files
     representing contig-contig contact matrix tiles.
 
+    Each file holds tab-delimited ``(i, j, value)`` records, where ``i`` and
+    ``j`` are bin offsets relative to the first bin of the tile's first and
+    second chromosome, respectively. A tile may be given for either
+    orientation of a pair of chromosomes. Only the upper triangle of
+    intra-chromosomal tiles is used.
+
+    Parameters
+    ----------
+    tiles : dict
+        Mapping of (chrom1, chrom2) to tile file path. Missing tiles are
+        treated as empty.
+    chromsizes : pandas.Series
+        Chromosome lengths indexed by name, in the desired order.
+    bins : pandas.DataFrame
+        Genomic bin segmentation.
+    map : callable, optional
+        Map function used to load the tiles of a row band, e.g. the ``map``
+        method of a process pool.
+
     """
-    pass
+    def _load(self, args):
+        cid1, cid2, filepath, transpose = args
+        df = pandas.read_csv(
+            filepath, sep='\t', header=None, names=['i', 'j', 'v'],
+            dtype={'i': np.int64, 'j': np.int64})
+        i, j, v = df['i'].values, df['j'].values, df['v'].values
+        if transpose:
+            i, j = j, i
+        if cid1 == cid2:
+            mask = i <= j
+            i, j, v = i[mask], j[mask], v[mask]
+        n1, n2 = self.chrom_nbins[cid1], self.chrom_nbins[cid2]
+        if len(i) and (i.max() >= n1 or j.max() >= n2):
+            raise ValueError(
+                "Tile '{}' has records out of bounds.".format(filepath))
+        return (self.chrom_offset[cid1] + i, self.chrom_offset[cid2] + j, v)
+
+    def __iter__(self):
+        for cid1 in sorted(self.bands):
+            tasks = [(cid1, cid2, filepath, transpose)
+                        for cid2, filepath, transpose in self.bands[cid1]]
+            parts = list(self._map(self._load, tasks))
+            bin1 = np.concatenate([p[0] for p in parts])
+            if not len(bin1):
+                continue
+            yield self._sort_rows(
+                bin1,
+                np.concatenate([p[1] for p in parts]),
+                np.concatenate([p[2] for p in parts]))
 
 
 class DenseLoader(ContactReader):
     """
     Load a dense genome-wide numpy array contact matrix.
 
+    The matrix is processed in bands of ``chunksize`` rows and only the upper
+    triangle non-zero elements of each band are emitted, so memory use is
+    bounded by the band height rather than by the size of the matrix.
+
+    Parameters
+    ----------
+    heatmap : array-like or str
+        Square 2D matrix. Any object supporting 2D slicing is accepted, e.g.
+        a numpy array, a ``numpy.memmap`` or an ``h5py.Dataset``. A path to a
+        ``.npy`` file is memory-mapped. Any other path is memory-mapped as a
+        raw binary C-ordered square matrix of type ``dtype``.
+    chunksize : int, optional
+        Number of matrix rows to process at a time.
+    dtype : numpy dtype, optional
+        Element type of a raw binary matrix file.
+
     """
-    def __init__(self, heatmap):
-        # TRIU sparsify the matrix
-        i, j = np.nonzero(heatmap)
-        mask = i <= j
-        triu_i, triu_j = i[mask], j[mask]
-        self.data = {
-            'bin1_id': triu_i,
-            'bin2_id': triu_j,
-            'count': heatmap[triu_i, triu_j],
-        }
-        self.nnz = len(triu_i)
+    def __init__(self, heatmap, chunksize=1000, dtype=None):
+        if isinstance(heatmap, six.string_types):
+            if heatmap.endswith('.npy'):
+                heatmap = np.load(heatmap, mmap_mode='r')
+            else:
+                if dtype is None:
+                    raise ValueError(
+                        "A dtype is required to read a raw binary matrix.")
+                heatmap = np.memmap(heatmap, dtype=dtype, mode='r')
+                n = int(round(np.sqrt(len(heatmap))))
+                if n * n != len(heatmap):
+                    raise ValueError(
+                        "Raw binary matrix with {} elements is not "
+                        "square.".format(len(heatmap)))
+                heatmap = heatmap.reshape((n, n))
+        if len(heatmap.shape) != 2 or heatmap.shape[0] != heatmap.shape[1]:
+            raise ValueError(
+                "Expected a square matrix, got shape {}".format(heatmap.shape))
+        self.heatmap = heatmap
+        self.chunksize = chunksize
 
     def size(self):
-        return self.nnz
+        # unknown without scanning the whole matrix
+        return None
 
     def __iter__(self):
-        yield self.data
+        n = self.heatmap.shape[0]
+        for r0 in range(0, n, self.chunksize):
+            r1 = min(r0 + self.chunksize, n)
+            # TRIU sparsify the band
+            block = np.asarray(self.heatmap[r0:r1, r0:])
+            i, j = np.nonzero(block)
+            mask = i <= j
+            i, j = i[mask], j[mask]
+            if not len(i):
+                continue
+            yield {
+                'bin1_id': r0 + i,
+                'bin2_id': r0 + j,
+                'count': block[i, j],
+            }
 
 
-class DenseTileLoader(ContactReader):
+class DenseTileLoader(_TileLoader):
     """
     Load a contact matrix from a collection of dense numpy array contig-contig
     tiles.
 
+    Tiles provided as paths to ``.npy`` files are memory-mapped rather than
+    loaded, and each row band is read in blocks of ``chunksize`` rows, so
+    only one block of rows from each tile of the band is held in memory at a
+    time. A tile may be given for either orientation of a pair of
+    chromosomes. Only the upper triangle of intra-chromosomal tiles is used.
+
+    Parameters
+    ----------
+    tiles : dict
+        Mapping of (chrom1, chrom2) to a ``.npy`` file path or a 2D array-like
+        of shape ``(n_bins1, n_bins2)``. Missing tiles are treated as empty.
+    chromsizes : pandas.Series
+        Chromosome lengths indexed by name, in the desired order.
+    bins : pandas.DataFrame
+        Genomic bin segmentation.
+    chunksize : int, optional
+        Number of matrix rows to process at a time.
+    map : callable, optional
+        Map function used to read the blocks of a row band. Use the ``map``
+        method of a process pool only if all tiles are file paths.
+
     """
-    pass
+    def __init__(self, tiles, chromsizes, bins, chunksize=1000, map=map):
+        super(DenseTileLoader, self).__init__(tiles, chromsizes, bins, map)
+        self.chunksize = chunksize
 
+    def _load(self, args):
+        cid1, cid2, tile, transpose, r0, r1 = args
+        if isinstance(tile, six.string_types):
+            tile = np.load(tile, mmap_mode='r')
+        n1, n2 = self.chrom_nbins[cid1], self.chrom_nbins[cid2]
+        if tuple(tile.shape) != ((n2, n1) if transpose else (n1, n2)):
+            raise ValueError(
+                "Tile for chromosomes ({}, {}) has shape {}, expected {}"
+                .format(self.chroms[cid1], self.chroms[cid2], tile.shape,
+                        (n2, n1) if transpose else (n1, n2)))
+
+        # skip the lower triangle of cis tiles
+        c0 = r0 if cid1 == cid2 else 0
+        if transpose:
+            block = np.asarray(tile[c0:, r0:r1]).T
+        else:
+            block = np.asarray(tile[r0:r1, c0:])
+        i, j = np.nonzero(block)
+        if cid1 == cid2:
+            mask = j >= i
+            i, j = i[mask], j[mask]
+        return (self.chrom_offset[cid1] + r0 + i,
+                self.chrom_offset[cid2] + c0 + j,
+                block[i, j])
+
+    def __iter__(self):
+        for cid1 in sorted(self.bands):
+            n_rows = self.chrom_nbins[cid1]
+            for r0 in range(0, n_rows, self.chunksize):
+                r1 = min(r0 + self.chunksize, n_rows)
+                tasks = [(cid1, cid2, tile, transpose, r0, r1)
+                            for cid2, tile, transpose in self.bands[cid1]]
+                parts = list(self._map(self._load, tasks))
+                bin1 = np.concatenate([p[0] for p in parts])
+                if not len(bin1):
+                    continue
+                yield self._sort_rows(
+                    bin1,
+                    np.concatenate([p[1] for p in parts]),
+                    np.concatenate([p[2] for p in parts]))
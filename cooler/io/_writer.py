@@ -126,14 +126,21 @@ def write_pixels(grp, n_bins, reader, h5opts):
     reader : object
         Reader object that reads and/or aggregates contacts from
         the input file(s). A reader returns chunks of binned contacts (bin1_id,
-        bin2_id, count) sorted by ``bin1_id`` then ``bin2_id``.
+        bin2_id, count) sorted by ``bin1_id`` then ``bin2_id``. If the
+        reader's ``size()`` is None, the pixel datasets are made unlimited.
     h5opts : dict
         HDF5 filter options.
 
     """
     n_pairs = reader.size()
-    init_size = min(5 * n_bins, n_pairs)
-    max_size = min(n_pairs, n_bins * (n_bins - 1) // 2 + n_bins)
+    max_size = n_bins * (n_bins - 1) // 2 + n_bins
+    if n_pairs is None:
+        # streaming readers may not know the number of records in advance
+        init_size = min(5 * n_bins, max_size)
+        max_size = None
+    else:
+        init_size = min(5 * n_bins, n_pairs)
+        max_size = min(n_pairs, max_size)
 
     # Preallocate
     bin1 = grp.create_dataset('bin1_id',
@@ -164,6 +171,10 @@ def write_pixels(grp, n_bins, reader, h5opts):
         nnz += n
         grp.file.flush()
 
+    # drop preallocated rows that were never filled, e.g. for empty input
+    for dset in [bin1, bin2, count]:
+        dset.resize((nnz,))
+
     # Index the first axis (matrix row) offsets
     bin1_offset = np.zeros(n_bins + 1, dtype=BIN1OFFSET_DTYPE)
     curr_val = 0
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP server
+~~~~~~~~~~~
+
+A small threaded HTTP server exposing the query API of one or more cooler
+or multires cooler files. Files are opened once and kept open, so the
+per-level caches of :class:`cooler.MultiCooler` and :class:`cooler.Cooler`
+persist across requests.
+
+Endpoints
+---------
+All endpoints take a ``file`` parameter naming the file to query, which may
+be omitted when a single file is served. Multires files take a ``zoom`` or
+``resolution`` parameter, defaulting to the finest level.
+
+* ``/files``: names of the served files (JSON).
+* ``/info``: file metadata (JSON).
+* ``/chroms``: chromosome table.
+* ``/bins?region=`` or ``/bins?lo=&hi=``: rows of the bin table.
+* ``/matrix?region=&region2=&balance=&sparse=``: contact matrix. A dense
+  ``.npy`` array by default, or ``i, j, v`` arrays in an ``.npz`` archive if
+  ``sparse`` is set. Dense matrices larger than the ``max_pixels`` limit of
+  the server are refused with status 413.
+* ``/tiles?zoom=&tile=x.y&tile=...``: higlass tiles of a multires file, as
+  the concatenation of the binary tile buffers in request order. The dtype
+  and shape of each tile are given in the ``X-Tile-Dtype`` and
+  ``X-Tile-Shape`` response headers.
+
+Tables are returned as ``.npz`` archives of columns, or as an Arrow IPC
+stream with ``format=arrow`` if pyarrow is installed. ``format=json`` is
+accepted everywhere a table is returned.
+
+Unknown files and chromosomes give status 404 and malformed requests status
+400. Errors are returned as a JSON object with an ``error`` message.
+
+"""
+from __future__ import division, print_function
+from six.moves.BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import urlparse, parse_qs
+import traceback
+import json
+import io
+import os
+
+import numpy as np
+import h5py
+
+from .api import Cooler, MultiCooler
+from .util import parse_region_string
+
+
+class _RequestError(Exception):
+    # an error reported to the client with an HTTP status
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def file_names(paths):
+    """
+    Name the files to serve.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to files, each optionally given as ``NAME=PATH``. Other files
+        are named by file name without the extension.
+
+    Returns
+    -------
+    dict
+        Paths keyed by name.
+
+    Raises
+    ------
+    ValueError
+        If two files get the same name.
+
+    """
+    named = {}
+    for arg in paths:
+        if '=' in arg:
+            name, path = arg.split('=', 1)
+        else:
+            path = arg
+            name = os.path.splitext(os.path.basename(path))[0]
+        if name in named:
+            raise ValueError(
+                "Files '{}' and '{}' are both named '{}'. Name them "
+                "explicitly with NAME=PATH.".format(named[name], path, name))
+        named[name] = path
+    return named
+
+
+class _File(object):
+    """
+    An open cooler or multires cooler file.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.h5 = h5py.File(path, 'r')
+        if 'max-zoom' in self.h5.attrs:
+            self.mc = MultiCooler(self.h5)
+        else:
+            self.mc = None
+            self.cooler = Cooler(self.h5)
+
+    def get_cooler(self, params):
+        zoom = params.get('zoom')
+        resolution = params.get('resolution')
+        if self.mc is None:
+            if zoom is not None or resolution is not None:
+                raise ValueError("Not a multires file.")
+            return self.cooler
+        if zoom is None and resolution is None:
+            zoom = self.mc.max_zoom
+        return self.mc.level(zoom, resolution)
+
+    def close(self):
+        self.h5.close()
+
+
+def _require(params, name):
+    try:
+        return params[name]
+    except KeyError:
+        raise ValueError("Missing parameter '{}'".format(name))
+
+
+def _to_bool(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _extent(c, region):
+    # malformed regions are bad requests, unknown chromosomes are not found
+    chrom = parse_region_string(region)[0]
+    if chrom not in c._chromsizes.index:
+        raise _RequestError(404, "Unknown chromosome '{}'".format(chrom))
+    return c.extent(region)
+
+
+def _table_payload(df, fmt):
+    if fmt == 'json':
+        body = df.to_json(orient='split', index=False).encode('utf-8')
+        return body, 'application/json'
+    elif fmt == 'arrow':
+        try:
+            import pyarrow
+        except ImportError:
+            raise ValueError("The arrow format requires pyarrow.")
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        sink = pyarrow.BufferOutputStream()
+        writer = pyarrow.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+        return (sink.getvalue().to_pybytes(),
+                'application/vnd.apache.arrow.stream')
+    elif fmt == 'npz':
+        buf = io.BytesIO()
+        columns = {}
+        for col in df.columns:
+            values = df[col]
+            if hasattr(values, 'cat'):
+                values = values.astype(str)
+            values = values.values
+            if values.dtype == object:
+                values = values.astype('U')
+            columns[col] = values
+        np.savez(buf, **columns)
+        return buf.getvalue(), 'application/octet-stream'
+    else:
+        raise ValueError("Unknown format '{}'".format(fmt))
+
+
+class CoolerRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler for the cooler HTTP server. The served files are taken
+    from the ``files`` attribute of the server.
+
+    """
+    def log_message(self, format, *args):
+        if not getattr(self.server, 'quiet', False):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send(self, body, content_type, status=200, headers=None):
+        # body may be a list of buffers, written out without joining
+        parts = body if isinstance(body, list) else [body]
+        length = sum(memoryview(part).nbytes for part in parts)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        for part in parts:
+            self.wfile.write(part)
+
+    def _send_error(self, status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        self._send(body, 'application/json', status)
+
+    def _get_file(self, params):
+        files = self.server.files
+        name = params.get('file')
+        if name is None:
+            if len(files) != 1:
+                raise ValueError("Specify a file: {}".format(sorted(files)))
+            return next(iter(files.values()))
+        if name not in files:
+            raise _RequestError(404, "Unknown file '{}'".format(name))
+        return files[name]
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        params = {k: v[-1] for k, v in query.items()}
+        endpoint = url.path.strip('/')
+        handler = getattr(self, '_get_' + endpoint, None)
+        if handler is None:
+            self._send_error(404, "Unknown endpoint '{}'".format(url.path))
+            return
+        try:
+            handler(params, query)
+        except _RequestError as e:
+            self._send_error(e.status, str(e))
+        except (ValueError, TypeError, IndexError) as e:
+            self._send_error(400, str(e))
+        except Exception:
+            self.log_error('%s', traceback.format_exc())
+            self._send_error(500, "Internal server error")
+
+    def _get_files(self, params, query):
+        body = json.dumps(sorted(self.server.files)).encode('utf-8')
+        self._send(body, 'application/json')
+
+    def _get_info(self, params, query):
+        f = self._get_file(params)
+        if f.mc is not None and 'zoom' not in params and \
+                'resolution' not in params:
+            info = {'max-zoom': f.mc.max_zoom,
+                    'resolutions': {str(k): v for k, v in
+                                    f.mc.resolutions.items()}}
+        else:
+            info = f.get_cooler(params).info
+        body = json.dumps(info, default=lambda x: x.item()).encode('utf-8')
+        self._send(body, 'application/json')
+
+    def _get_chroms(self, params, query):
+        c = self._get_file(params).get_cooler(params)
+        df = c.chroms()[:]
+        self._send(*_table_payload(df, params.get('format', 'npz')))
+
+    def _get_bins(self, params, query):
+        c = self._get_file(params).get_cooler(params)
+        if 'region' in params:
+            _extent(c, params['region'])
+            df = c.bins().fetch(params['region'])
+        else:
+            lo = int(params.get('lo', 0))
+            hi = int(params.get('hi', c.info['nbins']))
+            df = c.bins()[lo:hi]
+        self._send(*_table_payload(df, params.get('format', 'npz')))
+
+    def _get_matrix(self, params, query):
+        c = self._get_file(params).get_cooler(params)
+        region = _require(params, 'region')
+        region2 = params.get('region2')
+        balance = _to_bool(params.get('balance', 'false'))
+        sparse = _to_bool(params.get('sparse', 'false'))
+        i0, i1 = _extent(c, region)
+        j0, j1 = _extent(c, region2) if region2 is not None else (i0, i1)
+        if not sparse and (i1 - i0) * (j1 - j0) > self.server.max_pixels:
+            raise _RequestError(
+                413, "A dense matrix of shape ({}, {}) exceeds the limit of {} "
+                "pixels. Request a smaller region or set sparse."
+                .format(i1 - i0, j1 - j0, self.server.max_pixels))
+        mat = c.matrix(balance=balance).fetch(region, region2)
+        buf = io.BytesIO()
+        if sparse:
+            np.savez(buf, i=mat.row, j=mat.col, v=mat.data,
+                     shape=np.array(mat.shape))
+        else:
+            np.save(buf, mat.toarray())
+        self._send(buf.getvalue(), 'application/octet-stream')
+
+    def _get_tiles(self, params, query):
+        from .contrib.higlass import get_tile_buffers, TILE_SIZE
+        f = self._get_file(params)
+        if f.mc is None:
+            raise ValueError("Tiles require a multires file.")
+        zoom = int(_require(params, 'zoom'))
+        tile_ids = [tuple(int(x) for x in t.split('.'))
+                    for t in query.get('tile', [])]
+        dtype = np.dtype(params.get('dtype', 'float16'))
+        buffers = get_tile_buffers(f.mc, zoom, tile_ids, dtype=dtype)
+        body = [np.frombuffer(buffers[tile_id], dtype=np.uint8)
+                for tile_id in tile_ids]
+        headers = {
+            'X-Tile-Dtype': dtype.str,
+            'X-Tile-Shape': '{0},{0}'.format(TILE_SIZE),
+        }
+        self._send(body, 'application/octet-stream', headers=headers)
+
+
+class CoolerServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server for cooler files.
+
+    Parameters
+    ----------
+    address : (str, int)
+        Host and port to listen on.
+    paths : dict or list of str
+        Files to serve, keyed by name. A list of paths is named with
+        :func:`file_names`.
+    quiet : bool, optional
+        Do not log requests.
+    max_pixels : int, optional
+        Largest number of pixels of a dense matrix returned by ``/matrix``.
+
+    """
+    daemon_threads = True
+
+    def __init__(self, address, paths, quiet=False, max_pixels=2**26):
+        if not isinstance(paths, dict):
+            paths = file_names(paths)
+        self.files = {name: _File(path) for name, path in paths.items()}
+        self.quiet = quiet
+        self.max_pixels = max_pixels
+        HTTPServer.__init__(self, address, CoolerRequestHandler)
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        for f in self.files.values():
+            f.close()
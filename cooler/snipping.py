@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Pileups
+~~~~~~~
+
+Aggregate analysis of the contact matrix around many features, e.g. the
+aggregate peak analysis (APA) of loops or on-diagonal pileups at binding
+sites. Windows around the features are grouped by chromosome and row, and
+each group is extracted with a single batched matrix query so that windows
+sharing rows of the pixel table share the disk reads.
+
+"""
+from __future__ import division, print_function
+import warnings
+
+import numpy as np
+
+from .api import Cooler
+
+
+class PileupWorker(object):
+    """
+    Worker extracting a group of square windows of the contact matrix.
+
+    A task is a sequence of ``(k, cid, lo1, lo2, i0, i1, j0, j1, w1, w2)``
+    tuples, where ``cid`` is the chromosome ID of the rows, ``lo1`` and
+    ``lo2`` are the first row and column of window ``k``, ``(i0, i1, j0,
+    j1)`` is the part of the window inside the chromosomes and ``w1`` and
+    ``w2`` are the balancing weights of its rows and columns, or None.
+    Positions outside the chromosomes, and rows and columns of filtered bins
+    when balancing, are NaN.
+
+    Parameters
+    ----------
+    clr : Cooler
+        Cooler to read from. It is copied to each worker process.
+    width : int
+        Width of the windows, in bins.
+    field : str, optional
+        Column of the pixel table to read.
+    expected : dict, optional
+        Expected values by diagonal, keyed by chromosome ID. Windows are
+        divided by the expected value of their diagonals.
+
+    """
+    def __init__(self, clr, width, field=None, expected=None):
+        self.clr = clr
+        self.width = width
+        self.field = field
+        self.expected = expected
+
+    def __call__(self, task):
+        ks = [t[0] for t in task]
+        rects = [t[4:8] for t in task]
+        # weights come with the task, so workers never load the bin table
+        mats = self.clr.matrix(field=self.field, balance=False).slices(rects)
+
+        out = np.full((len(task), self.width, self.width), np.nan)
+        for n, ((k, cid, lo1, lo2, i0, i1, j0, j1, w1, w2), mat) in enumerate(
+                zip(task, mats)):
+            snip = mat.toarray()
+            if w1 is not None:
+                snip = w1[:, None] * w2[None, :] * snip
+            out[n, i0 - lo1:i1 - lo1, j0 - lo2:j1 - lo2] = snip
+            if self.expected is not None:
+                exp = self.expected[cid]
+                rows = np.arange(lo1, lo1 + self.width)
+                cols = np.arange(lo2, lo2 + self.width)
+                diags = np.abs(cols[None, :] - rows[:, None])
+                ok = diags < len(exp)
+                divisor = np.full(diags.shape, np.nan)
+                divisor[ok] = exp[diags[ok]]
+                out[n] /= divisor
+        return ks, out
+
+
+def _feature_bins(clr, chroms, starts, ends):
+    # chromosome IDs and bins of the midpoints of features
+    chrom_ids = clr._chromsizes.index.get_indexer(chroms)
+    if np.any(chrom_ids < 0):
+        unknown = sorted(set(np.asarray(chroms)[chrom_ids < 0]))
+        raise ValueError("Unknown chromosomes: {}".format(unknown))
+    cum_lengths = np.r_[0, np.cumsum(clr._chromsizes.values)]
+    mids = (np.asarray(starts) + np.asarray(ends)) // 2
+    return chrom_ids, clr.abs_coord_to_bin(cum_lengths[chrom_ids] + mids)
+
+
+def _expected_arrays(clr, expected, value_col):
+    # expected values by diagonal for each chromosome ID
+    arrays = {}
+    chrom_ids = clr._chromsizes.index.get_indexer(expected['chrom'])
+    for cid, grp in expected.groupby(chrom_ids):
+        diags = grp['diag'].values.astype(int)
+        exp = np.full(diags.max() + 1, np.nan)
+        exp[diags] = grp[value_col].values
+        arrays[cid] = exp
+    for cid in range(len(clr._chromsizes)):
+        arrays.setdefault(cid, np.array([]))
+    return arrays
+
+
+def pileup(clr, features, flank, balance=True, expected=None,
+           expected_value_col='balanced.avg', field=None, map=map,
+           chunksize=1000):
+    """
+    Stack and average the windows of the contact matrix centered on features.
+
+    Parameters
+    ----------
+    clr : Cooler or str
+        Cooler with uniform bins, or path to one.
+    features : DataFrame
+        Features with columns ``chrom``, ``start`` and ``end`` for on-diagonal
+        windows, or ``chrom1``, ``start1``, ``end1``, ``chrom2``, ``start2``
+        and ``end2`` for windows centered on pairs of features, e.g. loops.
+        Windows are centered on the bins of the feature midpoints.
+    flank : int
+        Size of the window on each side of the center bin, in base pairs.
+        Rounded down to a whole number of bins.
+    balance : bool, optional
+        Apply balancing weights. Rows and columns of filtered bins are NaN.
+        Default is True.
+    expected : DataFrame, optional
+        Expected values with columns ``chrom``, ``diag`` and
+        ``expected_value_col``. If given, windows are divided by the expected
+        value of each diagonal (observed/expected). Only for windows within
+        a chromosome.
+    expected_value_col : str, optional
+        Column of ``expected`` holding the expected values.
+    field : str, optional
+        Column of the pixel table to read. Default is 'count'.
+    map : callable, optional
+        Map function used to extract the groups of windows. Default is the
+        builtin ``map``, but a parallel map such as ``Pool.map`` of a
+        ``multiprocess`` pool extracts groups in worker processes.
+    chunksize : int, optional
+        Maximum number of windows in a group.
+
+    Returns
+    -------
+    stack : 3D array
+        Windows of shape ``(len(features), w, w)`` in the order of
+        ``features``, where ``w = 2 * (flank // binsize) + 1``. Positions
+        outside the chromosomes are NaN.
+    mean : 2D array
+        NaN-aware mean of the windows.
+
+    """
+    if not isinstance(clr, Cooler):
+        clr = Cooler(clr)
+    binsize = clr.info['bin-size']
+    if not isinstance(binsize, (int, np.integer)):
+        raise ValueError("Pileups require a cooler with uniform bins.")
+    if balance and 'weight' not in clr.bins().columns:
+        raise ValueError(
+            "No column 'bins/weight' found. Use ``cooler.ice`` to "
+            "calculate balancing weights.")
+
+    if 'chrom' in features.columns:
+        cid1, bin1 = _feature_bins(clr, features['chrom'], features['start'],
+                                   features['end'])
+        cid2, bin2 = cid1, bin1
+    else:
+        cid1, bin1 = _feature_bins(clr, features['chrom1'],
+                                   features['start1'], features['end1'])
+        cid2, bin2 = _feature_bins(clr, features['chrom2'],
+                                   features['start2'], features['end2'])
+
+    if expected is not None:
+        if np.any(cid1 != cid2):
+            raise ValueError(
+                "Observed/expected pileups require features within a "
+                "chromosome.")
+        expected = _expected_arrays(clr, expected, expected_value_col)
+
+    f = int(flank // binsize)
+    width = 2 * f + 1
+    chrom_offset = clr._get_index('chrom_offset')
+    lo1, lo2 = bin1 - f, bin2 - f
+    i0 = np.maximum(lo1, chrom_offset[cid1])
+    i1 = np.minimum(lo1 + width, chrom_offset[cid1 + 1])
+    j0 = np.maximum(lo2, chrom_offset[cid2])
+    j1 = np.minimum(lo2 + width, chrom_offset[cid2 + 1])
+
+    if balance:
+        weights = clr.bin_table(['weight'])['weight'].values
+
+    # group the windows by the chromosome and first row of the upper
+    # triangle rows they read, so that the windows of a group share reads of
+    # the pixel table
+    row0 = np.minimum(i0, j0)
+    row_cid = np.where(i0 <= j0, cid1, cid2)
+    order = np.lexsort((row0, row_cid))
+    tasks = []
+    for cid in np.unique(row_cid):
+        members = order[row_cid[order] == cid]
+        for start in range(0, len(members), chunksize):
+            tasks.append([
+                (k, cid1[k], lo1[k], lo2[k], i0[k], i1[k], j0[k], j1[k],
+                 weights[i0[k]:i1[k]] if balance else None,
+                 weights[j0[k]:j1[k]] if balance else None)
+                for k in members[start:start + chunksize]])
+
+    worker = PileupWorker(clr, width, field, expected)
+    stack = np.full((len(features), width, width), np.nan)
+    for ks, snips in map(worker, tasks):
+        stack[ks] = snips
+
+    with warnings.catch_warnings():
+        # windows where every value is NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(stack, axis=0) if len(stack) else \
+            np.full((width, width), np.nan)
+    return stack, mean
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
 from collections import OrderedDict
+from six.moves import queue
+import threading
 import six
 import re
 import os
@@ -417,3 +419,66 @@ def cmd_exists(cmd):
     return any(os.access(os.path.join(path, cmd), os.X_OK)
                 for path in os.environ['PATH'].split(os.pathsep))
 
+
+def read_ahead(iterable, depth=1):
+    """
+    Iterate over ``iterable`` while a background thread fetches up to
+    ``depth`` items in advance, so that producing the next item overlaps with
+    consuming the current one.
+
+    Parameters
+    ----------
+    iterable : iterable
+        Source of items, e.g. a generator that reads and parses chunks of a
+        file. It is consumed entirely on the background thread.
+    depth : int, optional
+        Maximum number of items held in the read-ahead buffer.
+
+    Yields
+    ------
+    Items of ``iterable`` in their original order. Exceptions raised by the
+    source are re-raised in the consuming thread.
+
+    """
+    if depth < 1:
+        for item in iterable:
+            yield item
+        return
+
+    buf = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                buf.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except Exception as e:
+            _put((done, e))
+        else:
+            _put((done, None))
+
+    thread = threading.Thread(target=_produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc = buf.get()
+            if item is done:
+                if exc is not None:
+                    raise exc
+                break
+            yield item
+    finally:
+        stop.set()
+        thread.join()
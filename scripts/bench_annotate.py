@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Benchmark the bin annotation join of pixel chunks.
+
+Compares ``cooler.annotate``, which takes rows of the bin columns by bin ID,
+with the previous implementation based on two ``DataFrame.merge`` joins.
+
+Usage: bench_annotate.py [N_PIXELS] [N_BINS] [REPEATS]
+
+"""
+from __future__ import division, print_function
+import timeit
+import sys
+
+import numpy as np
+import pandas
+
+from cooler.api import annotate, _annotate_merge
+
+
+def make_data(n_pixels, n_bins, n_chroms=24, seed=0):
+    rng = np.random.RandomState(seed)
+    chroms = ['chr{}'.format(i) for i in range(1, n_chroms + 1)]
+    chrom_ids = np.sort(rng.randint(0, n_chroms, n_bins))
+    bins = pandas.DataFrame({
+        'chrom': pandas.Categorical.from_codes(chrom_ids, chroms,
+                                               ordered=True),
+        'start': np.arange(n_bins, dtype=np.int32) * 1000,
+        'end': np.arange(1, n_bins + 1, dtype=np.int32) * 1000,
+        'weight': rng.rand(n_bins),
+    }, columns=['chrom', 'start', 'end', 'weight'])
+    bin1 = np.sort(rng.randint(0, n_bins, n_pixels))
+    bin2 = np.minimum(bin1 + rng.geometric(1e-3, n_pixels), n_bins - 1)
+    pixels = pandas.DataFrame({
+        'bin1_id': bin1,
+        'bin2_id': bin2,
+        'count': rng.poisson(3, n_pixels).astype(np.int32),
+    }, columns=['bin1_id', 'bin2_id', 'count'])
+    return pixels, bins
+
+
+def main(n_pixels=10**7, n_bins=3 * 10**6, repeats=3):
+    pixels, bins = make_data(n_pixels, n_bins)
+    print('{} pixels, {} bins'.format(n_pixels, n_bins))
+    for name, func in [('merge', _annotate_merge), ('take', annotate)]:
+        times = timeit.repeat(lambda: func(pixels, bins), number=1,
+                              repeat=repeats)
+        print('{:>6}: {:.3f} s (best of {})'.format(name, min(times), repeats))
+    assert annotate(pixels, bins).equals(_annotate_merge(pixels, bins))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
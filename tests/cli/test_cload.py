@@ -14,7 +14,7 @@ import nose
 from nose.tools import with_setup, set_trace
 from click.testing import CliRunner
 
-from cooler.cli.cload import cload, tabix as cload_tabix
+from cooler.cli.cload import cload, tabix as cload_tabix, pairs as cload_pairs
 from cooler.cli.csort import csort
 
 
@@ -78,3 +78,27 @@ def test_cload():
         assert np.all(f1['pixels/count'][:] == f2['pixels/count'][:])
 
 
+@with_setup(teardown=partial(teardown_func, testcool_path))
+def test_cload_pairs():
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    runner = CliRunner()
+    for fname, extra_args in [
+            ('GM12878-MboI-contacts.subsample.sorted.txt.gz',
+             ['--chunksize', '777']),
+            ('GM12878-MboI-contacts.subsample.shuffled.txt.gz',
+             ['--chunksize', '777', '--unsorted', '--max-pixels', '5000'])]:
+        result = runner.invoke(
+            cload_pairs, [
+                op.join(testdir, 'data', 'hg19-bins.2000kb.bed.gz'),
+                op.join(testdir, 'data', fname),
+                testcool_path,
+                '-c1', '1', '-p1', '2', '-c2', '4', '-p2', '5',
+            ] + extra_args
+        )
+        assert result.exit_code == 0
+
+        with h5py.File(testcool_path, 'r') as f1, \
+             h5py.File(ref_path, 'r') as f2:
+            assert np.all(f1['pixels/bin1_id'][:] == f2['pixels/bin1_id'][:])
+            assert np.all(f1['pixels/bin2_id'][:] == f2['pixels/bin2_id'][:])
+            assert np.all(f1['pixels/count'][:] == f2['pixels/count'][:])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from io import StringIO
+import os.path as op
+import tempfile
+import os
+
+import pandas
+
+from click.testing import CliRunner
+
+from cooler.cli.dump import dump
+import cooler
+
+
+testdir = op.realpath(op.join(op.dirname(__file__), op.pardir))
+
+
+def test_dump():
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    c = cooler.Cooler(ref_path)
+    bins = c.bins()[:]
+    pixels = c.pixels()[:]
+    expected = cooler.annotate(pixels, bins[['chrom', 'start', 'end']])
+    extra = cooler.annotate(pixels[['bin1_id', 'bin2_id']], bins[['start']])
+
+    runner = CliRunner()
+    for nproc in ['1', '2']:
+        result = runner.invoke(
+            dump, [
+                ref_path, '--join', '--annotate', 'start', '--header',
+                '--chunksize', '5000', '--nproc', nproc,
+            ]
+        )
+        assert result.exit_code == 0, result.output
+        df = pandas.read_csv(StringIO(result.output), sep='\t')
+        assert list(df.columns) == [
+            'chrom1', 'start1', 'end1', 'chrom2', 'start2', 'end2', 'count',
+            'start1.1', 'start2.1']
+        assert len(df) == len(expected)
+        assert (df['chrom1'].values == expected['chrom1'].values).all()
+        assert (df['end2'].values == expected['end2'].values).all()
+        assert (df['count'].values == expected['count'].values).all()
+        assert (df['start2.1'].values == extra['start2'].values).all()
+
+
+def test_dump_arrow():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    out_path = op.join(tempfile.gettempdir(), 'test.dump.parquet')
+    c = cooler.Cooler(ref_path)
+    expected = c.matrix(as_pixels=True, join=True).fetch('chr2', 'chr3')
+
+    runner = CliRunner()
+    try:
+        result = runner.invoke(
+            dump, [
+                ref_path, '--join', '--range', 'chr2', '--range2', 'chr3',
+                '--format', 'parquet', '--chunksize', '50', '--out', out_path,
+            ]
+        )
+        assert result.exit_code == 0, result.output
+        table = pyarrow.parquet.read_table(out_path)
+        assert table.schema.names == list(expected.columns)
+        assert table.to_pandas().equals(expected.reset_index(drop=True))
+    finally:
+        os.remove(out_path)
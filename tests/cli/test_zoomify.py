@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from functools import partial
+import os.path as op
+import tempfile
+import warnings
+import os
+
+import numpy as np
+import pandas
+import h5py
+
+from nose.tools import with_setup
+from click.testing import CliRunner
+
+from cooler.cli.zoomify import zoomify
+import cooler.io
+import cooler
+
+
+testdir = op.realpath(op.join(op.dirname(__file__), op.pardir))
+tmp = tempfile.gettempdir()
+multires_path = op.join(tmp, 'test.multires.cool')
+
+
+def teardown_func(*filepaths):
+    for fp in filepaths:
+        try:
+            os.remove(fp)
+        except OSError:
+            pass
+
+
+@with_setup(teardown=partial(teardown_func, multires_path))
+def test_zoomify():
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    resolutions = [4000000, 6000000, 8000000, 12000000]
+    runner = CliRunner()
+    result = runner.invoke(
+        zoomify, [
+            ref_path,
+            '--out', multires_path,
+            '--resolutions', ','.join(map(str, resolutions)),
+            '--chunksize', '777',
+        ]
+    )
+    assert result.exit_code == 0, result.output
+
+    with h5py.File(ref_path, 'r') as h5:
+        chromtable = cooler.chroms(h5)
+        ref_pixels = cooler.pixels(h5, join=False)
+    chromsizes = pandas.Series(
+        chromtable['length'].values, index=chromtable['name'].values)
+
+    with h5py.File(multires_path, 'r') as h5:
+        assert h5.attrs['max-zoom'] == 4
+        assert h5.attrs['4'] == 2000000
+        assert np.all(
+            cooler.pixels(h5['4'], join=False).values == ref_pixels.values)
+
+        for zoom, binsize in zip([3, 2, 1, 0], resolutions):
+            grp = h5[str(zoom)]
+            assert h5.attrs[str(zoom)] == binsize
+            assert cooler.info(grp)['bin-size'] == binsize
+            reader = cooler.io.CoolerAggregator(
+                ref_path, cooler.binnify(chromsizes, binsize), 10**9)
+            expected = next(iter(reader))
+            result = cooler.pixels(grp, join=False)
+            for col in ['bin1_id', 'bin2_id', 'count']:
+                assert np.all(result[col].values == expected[col])
+
+
+@with_setup(teardown=partial(teardown_func, multires_path))
+def test_zoomify_balance():
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+
+    # the defaults of cooler balance converge on every level
+    cooler.io.zoomify(ref_path, multires_path, [4000000, 8000000],
+                      balance=True)
+    with h5py.File(multires_path, 'r') as h5:
+        for zoom in ['0', '1', '2']:
+            assert h5[zoom]['bins']['weight'].attrs['converged']
+
+    # levels that do not converge are left without weights
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter('always')
+        cooler.io.zoomify(ref_path, multires_path, [4000000], balance=True,
+                          balance_args={'max_iters': 2})
+    assert any('did not converge' in str(x.message) for x in w)
+    with h5py.File(multires_path, 'r') as h5:
+        assert 'weight' not in h5['0']['bins']
+        assert 'weight' not in h5['1']['bins']
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+import os.path as op
+import sys
+
+import numpy as np
+
+import nose
+from nose.tools import assert_raises
+
+if sys.version_info < (3, 5):
+    raise nose.SkipTest
+
+import asyncio
+import cooler
+from cooler.aio import AsyncCooler
+
+
+testdir = op.dirname(op.realpath(__file__))
+ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+
+
+def test_async_cooler():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        ac = AsyncCooler(ref_path, max_reads=2, max_bulk=1, bulk_pixels=1000)
+        c = cooler.Cooler(ref_path)
+
+        # identical in-flight queries are coalesced
+        m1, m2, m3, bins, pixels = loop.run_until_complete(asyncio.gather(
+            ac.matrix('chr1'), ac.matrix('chr1'), ac.matrix('chr2', 'chr3'),
+            ac.bins(0, 10), ac.pixels(0, 10)))
+        assert m1 is m2
+        assert not ac._inflight
+        assert (m1 != c.matrix().fetch('chr1')).nnz == 0
+        assert (m3 != c.matrix().fetch('chr2', 'chr3')).nnz == 0
+        assert np.all(bins == c.bins()[0:10])
+        assert np.all(pixels == c.pixels()[0:10])
+        assert ac._is_bulk_region(c, 'chr1', None)
+        assert not ac._is_bulk_region(c, 'chr1:0-10000000', None)
+
+        assert_raises(ValueError, loop.run_until_complete,
+                      ac.tiles(0, [(0, 0)]))
+        ac.close()
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
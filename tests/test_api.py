@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
 from scipy import sparse
+import tempfile
+import shutil
+import os.path as op
+import os
 import numpy as np
 import pandas
 import h5py
 
 from nose.tools import assert_raises
 import cooler.api
+import cooler.io
 import mock
 
 
@@ -109,6 +114,11 @@ def test_cooler():
     assert c.offset('chr1') == 0
     assert c.extent('chr1') == (0, 10)
 
+    # absolute genomic coordinates
+    abs_pos = [-1, 0, 99, 100, 999, 1000, 1999, 2000, 5000]
+    assert np.all(c.abs_coord_to_bin(abs_pos) ==
+                  [0, 0, 0, 1, 9, 10, 19, 20, 20])
+
     # 2D range queries as rectangular or triangular
     A1 = np.triu(c.matrix().fetch('chr2').toarray())
     df = c.matrix(as_pixels=True, join=False).fetch('chr2')
@@ -134,3 +144,244 @@ def test_annotate():
     df4 = cooler.annotate(df[0:0], c.bins()[:])
     assert np.all(df4.columns == df3.columns)
     assert len(df4) == 0
+
+    # same result as a merge on the bin IDs, also for bin tables that are
+    # not indexed by row position or lack some bins
+    bins = c.bins()[:]
+    for table in [bins, bins[::-1], bins[::2], bins[['E1']]]:
+        for replace in [True, False]:
+            expected = cooler.api._annotate_merge(df, table, replace)
+            result = cooler.annotate(df, table, replace)
+            pandas.testing.assert_frame_equal(result, expected)
+
+
+def test_multicooler():
+    testdir = op.dirname(op.realpath(__file__))
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    out_path = op.join(tempfile.gettempdir(), 'test.multires.cool')
+    cooler.io.zoomify(ref_path, out_path, [4000000, 8000000])
+    try:
+        with cooler.MultiCooler(out_path) as mc:
+            assert mc.max_zoom == 2
+            assert mc.filename == out_path
+            assert mc.resolutions == {0: 8000000, 1: 4000000, 2: 2000000}
+            assert mc.zoom(4000000) == 1
+            assert mc.level(1) is mc.level(resolution=4000000)
+            assert mc.level(2).info['nnz'] == cooler.Cooler(ref_path).info['nnz']
+            assert mc.chrom_cum_lengths[-1] == mc.chromsizes.sum()
+            assert np.all(mc.index('chrom_offset', 0) ==
+                          mc.level(0)._get_index('chrom_offset'))
+            assert_raises(ValueError, mc.level, resolution=3000000)
+            assert_raises(ValueError, mc.level)
+    finally:
+        os.remove(out_path)
+
+
+def test_to_arrow():
+    try:
+        import pyarrow
+    except ImportError:
+        return
+    testdir = op.dirname(op.realpath(__file__))
+    c = cooler.Cooler(op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool'))
+
+    # enum columns are dictionary encoded
+    table = c.bins().to_arrow(size=500)
+    assert table.column('chrom').num_chunks == 4
+    assert pyarrow.types.is_dictionary(table.schema.field('chrom').type)
+    assert table.to_pandas().equals(c.bins()[:].reset_index(drop=True))
+
+    # joined pixels have the layout of annotate
+    sel = c.pixels(join=True)
+    batches = list(sel.iter_record_batches(100, 1100, size=300))
+    assert [b.num_rows for b in batches] == [300, 300, 300, 100]
+    df = pyarrow.Table.from_batches(batches).to_pandas()
+    assert df.equals(sel[100:1100].reset_index(drop=True))
+
+    # column subsets and empty ranges
+    table = c.pixels()[['bin2_id', 'count']].to_arrow(0, 0)
+    assert table.schema.names == ['bin2_id', 'count']
+    assert table.num_rows == 0
+
+    # selectors without an arrow slicer convert their DataFrames
+    mc = cooler.Cooler(mock_cooler)
+    table = mc.bins()[['start', 'E1']].to_arrow()
+    assert np.all(table.column('start').to_numpy() ==
+                  mock_cooler['bins']['start'])
+
+
+def test_to_dask():
+    try:
+        import dask
+        import sparse
+    except ImportError:
+        return
+    testdir = op.dirname(op.realpath(__file__))
+    c = cooler.Cooler(op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool'))
+
+    # pixel partitions start on row boundaries and have known divisions
+    ddf = c.pixels().to_dask(chunksize=5000)
+    with h5py.File(c.fp, 'r') as h5:
+        bin1_offset = h5['indexes']['bin1_offset'][:]
+    assert ddf.known_divisions
+    assert np.all(np.in1d(ddf.divisions[:-1], bin1_offset))
+    assert ddf.divisions[-1] == c.info['nnz'] - 1
+    assert ddf.compute(scheduler='sync').equals(c.pixels()[:])
+
+    ddf = c.bins()['start'].to_dask(chunksize=100)
+    assert ddf.npartitions == 16
+    assert ddf.compute(scheduler='sync').equals(c.bins()['start'][:])
+
+    # block-sparse matrix
+    arr = c.matrix().to_dask(chunksize=300)
+    assert arr.chunks[0] == (300, 300, 300, 300, 300, 61)
+    assert arr.dtype == np.int32
+    block = arr[100:400, 200:700].compute(scheduler='sync')
+    assert np.all(block.todense() == c.matrix()[100:400, 200:700].toarray())
+
+
+def test_iterchunks_prefetch():
+    c = cooler.Cooler(mock_cooler)
+    sel = c.pixels()
+    expected = list(sel.iterchunks(size=7))
+    for prefetch in [1, 3]:
+        chunks = list(sel.iterchunks(size=7, prefetch=prefetch))
+        assert len(chunks) == len(expected)
+        for a, b in zip(chunks, expected):
+            assert a.equals(b)
+
+    # stopping early does not block
+    chunks = sel.iterchunks(3, 40, size=5, prefetch=2)
+    assert next(chunks).index[0] == 3
+    chunks.close()
+
+
+def test_bin_table():
+    testdir = op.dirname(op.realpath(__file__))
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    c = cooler.Cooler(ref_path)
+
+    bins = c.bin_table()
+    assert list(bins.columns) == ['chrom', 'start', 'end']
+    assert hasattr(bins['chrom'], 'cat')
+    assert bins['start'].dtype == np.int32
+    assert bins.equals(c.bins()[['chrom', 'start', 'end']][:])
+    usage = c.bin_table_memory_usage()
+    assert list(usage.index) == ['chrom', 'start', 'end']
+    assert usage['start'] == 4 * c.info['nbins']
+
+    # extra columns are loaded on demand
+    assert list(c.bin_table(['end', 'chrom']).columns) == ['end', 'chrom']
+
+    # joins of off-diagonal selections
+    df = c.matrix(as_pixels=True, join=True).fetch('chr2', 'chr4')
+    with h5py.File(ref_path, 'r') as h5:
+        i0, i1 = c.extent('chr2')
+        j0, j1 = c.extent('chr4')
+        df2 = cooler.api.matrix(h5, i0, i1, j0, j1, as_pixels=True)
+    assert np.all(df['chrom1'] == 'chr2')
+    assert np.all(df['chrom2'] == 'chr4')
+    assert df.equals(df2)
+
+
+def test_matrix_slices():
+    testdir = op.dirname(op.realpath(__file__))
+    c = cooler.Cooler(op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool'))
+    sel = c.matrix()
+    rects = [(30, 50, 40, 60), (0, 10, 100, 130), (45, 55, 45, 55),
+             (200, 210, 5, 15), (1000, 1000, 3, 8)]
+
+    # overlapping, distant and empty rectangles, with and without banding
+    for max_chunk in (500000000, 100):
+        mats = c.matrix(max_chunk=max_chunk).slices(rects)
+        for (i0, i1, j0, j1), mat in zip(rects, mats):
+            assert mat.shape == (i1 - i0, j1 - j0)
+            assert np.all(mat.toarray() == sel[i0:i1, j0:j1].toarray())
+
+    regions = ['chr1:0-20000000', 'chr2:10000000-30000000']
+    arr = sel.fetch_many(regions, dense=True)
+    assert arr.shape == (2, 10, 10)
+    assert np.all(arr[1] == sel.fetch(regions[1]).toarray())
+    mats = sel.fetch_many(regions, ['chr3', 'chr1:0-20000000'])
+    assert np.all(mats[0].toarray() ==
+                  sel.fetch(regions[0], 'chr3').toarray())
+    assert_raises(ValueError, sel.fetch_many, regions, ['chr3'])
+    assert_raises(ValueError, sel.slices, rects, dense=True)
+
+    # a distant off-diagonal rectangle and its transpose share one read of
+    # the rows of the first axis range
+    i0 = c.offset('chr1:100000000-100000001')
+    j0 = c.offset('chr10:50000000-50000001')
+    with h5py.File(op.join(testdir, 'data',
+                           'GM12878-MboI-matrix.2000kb.cool'), 'r') as h5:
+        offsets = h5['indexes']['bin1_offset'][:]
+    sizes = []
+    real = cooler.api.RowBlockReader
+
+    def _reader(row0, edges, bin2, data):
+        sizes.append(len(bin2))
+        return real(row0, edges, bin2, data)
+
+    with mock.patch('cooler.api.RowBlockReader', _reader):
+        mats = sel.slices([(i0, i0 + 5, j0, j0 + 5), (j0, j0 + 5, i0, i0 + 5)])
+    assert sum(sizes) == offsets[i0 + 5] - offsets[i0]
+    assert np.all(mats[0].toarray() == sel[i0:i0 + 5, j0:j0 + 5].toarray())
+    assert np.all(mats[1].toarray() == mats[0].toarray().T)
+
+
+def test_matrix_lookup():
+    testdir = op.dirname(op.realpath(__file__))
+    ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    c = cooler.Cooler(ref_path)
+    n = c.info['nbins']
+    rng = np.random.RandomState(0)
+    i = rng.randint(0, n, 1000)
+    j = rng.randint(0, n, 1000)
+    dense = c.matrix()[:, :].toarray()
+
+    # pairs on both sides of the diagonal, read in one or many batches
+    for max_chunk in (500000000, 1):
+        v = c.matrix(max_chunk=max_chunk).lookup(i, j)
+        assert np.all(v == dense[i, j])
+    assert len(c.matrix().lookup([], [])) == 0
+    assert_raises(IndexError, c.matrix().lookup, [n], [0])
+    assert_raises(ValueError, c.matrix().lookup, [0, 1], [0])
+
+    # balanced: missing pixels are 0 even on filtered bins, as in fetch
+    path = op.join(tempfile.gettempdir(), 'test.lookup.cool')
+    shutil.copyfile(ref_path, path)
+    try:
+        with h5py.File(path, 'r+') as h5:
+            weights = rng.uniform(0.5, 1.5, n)
+            weights[::7] = np.nan
+            h5['bins'].create_dataset('weight', data=weights)
+        c = cooler.Cooler(path)
+        sel = c.matrix(balance=True)
+        v = sel.lookup(i, j)
+        ref = sel[:, :].toarray()[i, j]
+        assert np.allclose(v, ref, equal_nan=True)
+        missing = dense[i, j] == 0
+        assert missing.any() and np.all(v[missing] == 0)
+        assert np.isnan(v).any()
+    finally:
+        os.remove(path)
+
+
+def test_matrix_band():
+    testdir = op.dirname(op.realpath(__file__))
+    c = cooler.Cooler(op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool'))
+    for max_chunk in (500000000, 10):
+        sel = c.matrix(max_chunk=max_chunk)
+        full = sel.fetch('chr2').toarray()
+        n = len(full)
+
+        # dense layout: [r, d] is element (r, r + d)
+        arr = sel.band('chr2', 5, dense=True)
+        assert arr.shape == (n, 5)
+        for d in range(5):
+            assert np.all(arr[:n - d, d] == np.diag(full, d))
+            assert np.all(np.isnan(arr[n - d:, d]))
+
+        mat = sel.band('chr2', 5)
+        assert np.all(mat.toarray() == np.triu(np.tril(full, 4)))
+    assert_raises(ValueError, c.matrix().band, 'chr2', -1)
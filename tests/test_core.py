@@ -136,9 +136,48 @@ def test_slice_matrix():
         i, j, v = triu_reader.query(i0, i1, j0, j1)
         assert len(index) == len(i)
 
+        # pixel IDs from the same scan
+        i2, j2, v2, index2 = triu_reader.query(i0, i1, j0, j1,
+                                               return_index=True)
+        assert np.all(index2 == index)
+        assert np.all(mock_cooler['pixels']['bin2_id'][index] == j)
+        assert np.all(mock_cooler['pixels']['count'][index] == v)
+        assert np.all(i2 == i) and np.all(j2 == j) and np.all(v2 == v)
+
         # rectangular query
         i, j, v = cooler.core.query_rect(triu_reader.query, i0, i1, j0, j1)
         mat = sparse.coo_matrix((v, (i-i0, j-j0)), (i1-i0, j1-j0)).toarray()
         assert np.allclose(r_full[i0:i1, j0:j1], mat)
 
 
+
+
+class _RecordingArray(object):
+    # array proxy recording the number of elements read by each slice
+    def __init__(self, arr):
+        self.arr = arr
+        self.reads = []
+
+    def __getitem__(self, key):
+        out = self.arr[key]
+        self.reads.append(len(out))
+        return out
+
+
+def test_triu_band():
+    h5 = MockCooler(mock_cooler)
+    h5['pixels'] = dict(mock_cooler['pixels'])
+    bin2 = h5['pixels']['bin2_id'] = _RecordingArray(r.indices)
+    reader = cooler.core.TriuReader(h5, 'count', 10000)
+    for i0, i1, k in [(0, 20, 3), (2, 15, 1), (5, 9, 10), (0, 20, 0)]:
+        i, j, v = reader.band(i0, i1, k)
+        m = sparse.coo_matrix((v, (i, j)), (n_bins, n_bins)).toarray()
+        ref = np.triu(np.tril(r.toarray(), k - 1))
+        ref[:i0] = ref[i1:] = 0
+        ref[:, :i0] = ref[:, i1:] = 0
+        assert np.all(m == ref)
+
+    # only the first k pixels of each row are read
+    bin2.reads = []
+    reader.band(0, 20, 3)
+    assert sum(bin2.reads) <= 20 * 3 < r.nnz
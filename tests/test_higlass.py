@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+import tempfile
+import os.path as op
+import os
+
+import numpy as np
+import h5py
+
+from nose.tools import with_setup
+import cooler.io
+import cooler
+from cooler.contrib import higlass
+
+
+testdir = op.dirname(op.realpath(__file__))
+ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+multires_path = op.join(tempfile.gettempdir(), 'test.multires.cool')
+
+
+def setup_func():
+    cooler.io.zoomify(
+        ref_path, multires_path, [4000000, 8000000], balance=True,
+        balance_args={'mad_max': 3, 'min_nnz': 10, 'ignore_diags': 2})
+
+
+def teardown_func():
+    try:
+        os.remove(multires_path)
+    except OSError:
+        pass
+
+
+@with_setup(setup_func, teardown_func)
+def test_get_tiles():
+    with cooler.MultiCooler(multires_path) as mc:
+        info = higlass.get_info(mc)
+        zoom = 1
+        tile_width = info['max_width'] / 2**zoom
+        tile_ids = [(0, 0), (0, 1), (1, 1), (1, 0), (0, 2)]
+        dense = higlass.get_tiles(mc, zoom, tile_ids)
+        sparse = higlass.get_tiles(mc, zoom, tile_ids, dense=False)
+
+        for x, y in tile_ids:
+            df = higlass.get_data(
+                mc, zoom, x * tile_width, (x + 1) * tile_width,
+                y * tile_width, (y + 1) * tile_width)
+            tile = dense[x, y]
+            assert tile.shape == (256, 256) and tile.dtype == np.float32
+            i, j, v = sparse[x, y]
+            assert len(v) == len(df)
+            assert np.isclose(np.nansum(v), np.nansum(df['balanced']),
+                              rtol=1e-5)
+            assert np.all(np.isnan(tile[i, j]) | (tile[i, j] != 0))
+
+
+@with_setup(setup_func, teardown_func)
+def test_get_tile_buffers():
+    with cooler.MultiCooler(multires_path) as mc:
+        tile_ids = [(0, 0), (0, 1)]
+        ref = higlass.get_tiles(mc, 1, tile_ids, mask_filtered=True)
+        bufs = higlass.get_tile_buffers(mc, 1, tile_ids)
+        for tile_id in tile_ids:
+            buf = bufs[tile_id]
+            assert buf.nbytes == 256 * 256 * 2
+            tile = np.frombuffer(buf, dtype=np.float16).reshape(256, 256)
+            assert np.all(np.isnan(tile) == np.isnan(ref[tile_id]))
+            assert np.allclose(tile, ref[tile_id], rtol=1e-3, equal_nan=True)
+
+        # filtered bins are masked along whole rows and columns
+        weight = mc.bin_column('weight', 1)
+        n_bad = np.isnan(weight[:256]).sum()
+        assert n_bad > 0
+        assert np.isnan(ref[0, 0]).all(axis=1).sum() == n_bad
+
+
+@with_setup(setup_func, teardown_func)
+def test_tile_store():
+    from click.testing import CliRunner
+    from cooler.cli.tiles import tiles
+
+    tile_ids = [(0, 0), (0, 1), (1, 1), (1, 0)]
+    with cooler.MultiCooler(multires_path) as mc:
+        live = higlass.get_tile_buffers(mc, 1, tile_ids)
+
+    result = CliRunner().invoke(tiles, [multires_path, '--max-zoom', '1'])
+    assert result.exit_code == 0, result.output
+
+    with cooler.MultiCooler(multires_path) as mc:
+        assert mc._h5['tiles/0'].shape == (2, 2, 256, 256)
+        assert mc._h5['tiles/1'].shape == (4, 4, 256, 256)
+        assert 'tiles/2' not in mc._h5
+        # the index cached before the tiles were written is refreshed
+        assert higlass._tile_store_index(mc) == {0: None, 1: None}
+        stored = higlass.get_tile_buffers(mc, 1, tile_ids)
+        for tile_id in tile_ids:
+            assert np.array_equal(np.asarray(stored[tile_id]).view(np.uint16),
+                                  np.asarray(live[tile_id]).view(np.uint16))
+
+
+def test_get_tiles_factor3():
+    # successive zoom levels differ by a factor of 3
+    path = op.join(tempfile.gettempdir(), 'test.multires3.cool')
+    cooler.io.zoomify(ref_path, path, [6000000, 18000000], balance=True)
+    try:
+        with cooler.MultiCooler(path) as mc:
+            info = higlass.get_info(mc)
+            assert info['max_width'] == 18000000 * 256
+            for zoom in range(mc.max_zoom + 1):
+                tile_width = mc.binsize(zoom) * 256
+                tiles = higlass.get_tiles(mc, zoom, [(0, 0), (0, 1)],
+                                          dense=False)
+                for (x, y), (i, j, v) in tiles.items():
+                    df = higlass.get_data(
+                        mc, zoom, x * tile_width, (x + 1) * tile_width,
+                        y * tile_width, (y + 1) * tile_width)
+                    assert len(v) == len(df)
+                    assert np.isclose(np.nansum(v), np.nansum(df['balanced']),
+                                      rtol=1e-5)
+    finally:
+        os.remove(path)
+
+
+@with_setup(setup_func, teardown_func)
+def test_tile_store_sidecar():
+    from click.testing import CliRunner
+    from cooler.cli.tiles import tiles
+
+    sidecar = multires_path + higlass.TILE_STORE_SUFFIX
+    result = CliRunner().invoke(
+        tiles, [multires_path, '--max-zoom', '0', '--sidecar'])
+    assert result.exit_code == 0, result.output
+    try:
+        for _ in range(2):
+            with cooler.MultiCooler(multires_path) as mc:
+                stored = higlass.get_tile_buffers(mc, 0, [(0, 0)])
+                live = higlass.get_tiles(mc, 0, [(0, 0)],
+                                         dtype=np.float16, mask_filtered=True)
+                assert np.array_equal(
+                    np.asarray(stored[0, 0]).view(np.uint16),
+                    live[0, 0].view(np.uint16))
+        # one cache entry per file, and the sidecar is closed after reads
+        assert list(higlass._tile_stores) == [op.realpath(multires_path)]
+        with h5py.File(sidecar, 'r+'):
+            pass
+    finally:
+        os.remove(sidecar)
+        higlass._tile_stores.clear()
+
+
+@with_setup(setup_func, teardown_func)
+def test_file_handle_cache():
+    with h5py.File(multires_path, 'r') as f:
+        tiles = higlass.get_tiles(f, 1, [(0, 0)])
+        mc = higlass._as_multicooler(f)
+        assert higlass._as_multicooler(f) is mc
+        # the level caches of the MultiCooler are reused by later calls
+        assert 1 in mc._levels
+        assert np.array_equal(higlass.get_tiles(f, 1, [(0, 0)])[0, 0],
+                              tiles[0, 0], equal_nan=True)
+    # entries of closed files are dropped
+    with h5py.File(multires_path, 'r') as f2:
+        assert higlass._as_multicooler(f2) is not mc
+        assert not any(key is f for key in higlass._multicoolers)
@@ -176,3 +176,318 @@ def test_from_readhdf5():
     yield should_not_depend_on_chunksize, bintable
     yield should_raise_if_input_not_sorted, bintable
     yield should_work_with_int32_cols, bintable
+
+
+@with_setup(teardown=teardown_func)
+def test_external_sort_aggregator():
+    chroms, lengths = zip(*iteritems(chromsizes))
+    bintable = cooler.binnify(chromsizes, 100)
+    with h5py.File(testfile_path, 'w') as h5:
+        reader = cooler.io.HDF5Aggregator(
+            mock_reads, chromsizes, bintable, chunksize=66)
+        cooler.io.create(h5, chroms, lengths, bintable, reader)
+        p1 = cooler.pixels(h5, join=False)
+
+    # shuffle the contacts and swap some of the sides
+    idx = np.random.permutation(n_records)
+    swap = np.random.randint(0, 2, n_records).astype(bool)
+    side1 = np.where(swap, mock_reads['chrms2'], mock_reads['chrms1'])[idx]
+    pos1 = np.where(swap, mock_reads['cuts2'], mock_reads['cuts1'])[idx]
+    side2 = np.where(swap, mock_reads['chrms1'], mock_reads['chrms2'])[idx]
+    pos2 = np.where(swap, mock_reads['cuts1'], mock_reads['cuts2'])[idx]
+    contacts = [
+        {'chrom1': np.array(chroms)[side1[lo:lo+100]], 'pos1': pos1[lo:lo+100],
+         'chrom2': np.array(chroms)[side2[lo:lo+100]], 'pos2': pos2[lo:lo+100]}
+        for lo in range(0, n_records, 100)
+    ]
+    with h5py.File(testfile_path, 'w') as h5:
+        reader = cooler.io.ExternalSortAggregator(
+            contacts, chromsizes, bintable, max_pixels=200)
+        cooler.io.create(h5, chroms, lengths, bintable, reader)
+        p2 = cooler.pixels(h5, join=False)
+
+    assert np.all(p1.values == p2.values)
+
+
+def test_pairs_aggregator_order():
+    ref_path = os.path.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    with h5py.File(ref_path, 'r') as h5:
+        ref = cooler.pixels(h5, join=False)
+    bins = pandas.read_csv(
+        os.path.join(testdir, 'data', 'hg19-bins.2000kb.bed.gz'),
+        sep='\t', names=['chrom', 'start', 'end'])
+    sizes = bins.groupby('chrom', sort=False)['end'].max()
+    df = pandas.read_csv(
+        os.path.join(testdir, 'data',
+                     'GM12878-MboI-contacts.subsample.sorted.txt.gz'),
+        sep='\t', header=None)
+
+    def aggregate(df, is_sorted=True):
+        path = os.path.join(tmp, 'test.pairs.txt')
+        try:
+            df.to_csv(path, sep='\t', header=False, index=False)
+            reader = cooler.io.PairsAggregator(
+                path, sizes, bins, 777, is_sorted=is_sorted,
+                chrom1_field=0, pos1_field=1, chrom2_field=3, pos2_field=4)
+            return pandas.concat([pandas.DataFrame(c) for c in reader])
+        finally:
+            os.remove(path)
+
+    # upper triangular in the lexicographic order of the file rather than
+    # in chromsizes order, with chrom1 blocks in either direction
+    flip = ((df[0] > df[3]) | ((df[0] == df[3]) & (df[1] > df[4]))).values
+    lex = df.copy()
+    lex.loc[flip, [0, 1, 2, 3, 4, 5]] = df.loc[flip, [3, 4, 5, 0, 1, 2]].values
+    for ascending in (True, False):
+        out = aggregate(lex.sort_values([0, 1], ascending=ascending))
+        for col in ['bin1_id', 'bin2_id', 'count']:
+            assert np.all(out[col].values == ref[col].values)
+
+    # grouped by chrom1 but in both orientations
+    mixed = lex.copy()
+    flip = np.random.RandomState(0).randint(0, 2, len(df)).astype(bool)
+    mixed.loc[flip, [0, 1, 2, 3, 4, 5]] = lex.loc[
+        flip, [3, 4, 5, 0, 1, 2]].values
+    mixed = mixed.sort_values(0, kind='mergesort')
+    assert_raises(ValueError, aggregate, mixed)
+    out = aggregate(mixed, is_sorted=False)
+    assert np.all(out['count'].values == ref['count'].values)
+
+
+def test_pairs_aggregator_missing_chrom1():
+    bins = pandas.read_csv(
+        os.path.join(testdir, 'data', 'hg19-bins.2000kb.bed.gz'),
+        sep='\t', names=['chrom', 'start', 'end'])
+    sizes = bins.groupby('chrom', sort=False)['end'].max()
+    df = pandas.read_csv(
+        os.path.join(testdir, 'data',
+                     'GM12878-MboI-contacts.subsample.sorted.txt.gz'),
+        sep='\t', header=None)
+
+    # upper triangular in chromsizes order, with no chrom1 block for chr5
+    cid1 = sizes.index.get_indexer(df[0])
+    cid2 = sizes.index.get_indexer(df[3])
+    flip = (cid1 > cid2) | ((cid1 == cid2) & (df[1] > df[4]).values)
+    df.loc[flip, [0, 1, 2, 3, 4, 5]] = df.loc[
+        flip, [3, 4, 5, 0, 1, 2]].values
+    df['cid'] = sizes.index.get_indexer(df[0])
+    df = df[df[0] != 'chr5'].sort_values(['cid', 1]).drop('cid', axis=1)
+
+    class CountingAggregator(cooler.io.PairsAggregator):
+        n_read = 0
+
+        def _read_chunks(self):
+            for chunk in super(CountingAggregator, self)._read_chunks():
+                self.n_read += 1
+                yield chunk
+
+    path = os.path.join(tmp, 'test.pairs.txt')
+    try:
+        df.to_csv(path, sep='\t', header=False, index=False)
+        kwargs = dict(chrom1_field=0, pos1_field=1, chrom2_field=3,
+                      pos2_field=4)
+        reader = CountingAggregator(path, sizes, bins, 777, **kwargs)
+        chunks, n_read = [], []
+        for chunk in reader:
+            chunks.append(chunk)
+            n_read.append(reader.n_read)
+        ref = cooler.io.PairsAggregator(
+            path, sizes, bins, 777, is_sorted=False, **kwargs)
+        ref = pandas.concat([pandas.DataFrame(c) for c in ref])
+    finally:
+        os.remove(path)
+
+    out = pandas.concat([pandas.DataFrame(c) for c in chunks])
+    for col in ['bin1_id', 'bin2_id', 'count']:
+        assert np.all(out[col].values == ref[col].values)
+    # the rows after chr5 are emitted while streaming, not at the end
+    chr6 = bins.index[bins['chrom'] == 'chr6'][0]
+    first = [k for k, c in enumerate(chunks) if c['bin1_id'][0] >= chr6][0]
+    assert n_read[first] < reader.n_read
+
+
+def test_sparse_loader():
+    pixels_path = os.path.join(
+        testdir, 'data', 'GM12878-MboI-matrix.2000kb.txt.gz')
+    ref_path = os.path.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    with h5py.File(ref_path, 'r') as h5:
+        ref = cooler.pixels(h5, join=False)
+
+    # the read_ahead thread over pandas, and pyarrow if available
+    modes = [False]
+    try:
+        import pyarrow.csv
+        modes.append(True)
+    except ImportError:
+        pass
+
+    for use_pyarrow in modes:
+        reader = cooler.io.SparseLoader(pixels_path, 1000,
+                                        use_pyarrow=use_pyarrow)
+        assert reader.use_pyarrow == use_pyarrow
+        assert reader.size() is None
+        chunks = list(reader)
+        # pyarrow reads blocks of at least 1 MB
+        assert len(chunks) > 1 or use_pyarrow
+        for col in ['bin1_id', 'bin2_id', 'count']:
+            assert np.all(np.concatenate([c[col] for c in chunks]) == ref[col])
+
+    # unsorted input, entirely or in a single place further along
+    bad_path = os.path.join(tmp, 'test.unsorted.txt')
+    swapped = ref.copy()
+    swapped.iloc[[3000, 3001]] = swapped.iloc[[3001, 3000]].values
+    try:
+        for bad in (ref.iloc[::-1], swapped):
+            bad.to_csv(bad_path, sep='\t', header=False, index=False)
+            messages = []
+            for use_pyarrow in modes:
+                reader = cooler.io.SparseLoader(bad_path, 1000,
+                                                use_pyarrow=use_pyarrow)
+                try:
+                    list(reader)
+                except ValueError as e:
+                    messages.append(str(e))
+            assert len(messages) == len(modes)
+            assert len(set(messages)) == 1
+        assert 'record 3002' in messages[0]
+    finally:
+        os.remove(bad_path)
+
+
+def test_tile_loaders():
+    ref_path = os.path.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    c = cooler.Cooler(ref_path)
+    chromtable = c.chroms()[:]
+    chromsizes = pandas.Series(
+        chromtable['length'].values, index=chromtable['name'].values)
+    bins = c.bins()[:]
+    ref = c.pixels()[:]
+    names = list(chromsizes.index[:3])
+    ids = list(range(3))
+    lo, hi = c.extent(names[0])[0], c.extent(names[-1])[1]
+    ref = ref[(ref['bin1_id'] < hi) & (ref['bin2_id'] < hi)]
+    ref = ref.reset_index(drop=True)
+
+    # provide some tiles in lower triangle orientation
+    tiles = {}
+    for i in ids:
+        for j in ids[i:]:
+            key = (names[j], names[i]) if (i + j) % 2 else (names[i], names[j])
+            tiles[key] = c.matrix(balance=False).fetch(*key).toarray()
+
+    reader = cooler.io.DenseTileLoader(
+        tiles, chromsizes, bins, chunksize=7)
+    chunks = list(reader)
+    for col in ['bin1_id', 'bin2_id', 'count']:
+        assert np.all(np.concatenate([x[col] for x in chunks]) == ref[col])
+
+    paths = []
+    try:
+        # records of the tile files are not in row-major order
+        rng = np.random.RandomState(0)
+        for key, arr in iteritems(tiles):
+            path = os.path.join(tmp, '{}_{}.txt'.format(*key))
+            i, j = np.nonzero(arr)
+            idx = rng.permutation(len(i))
+            i, j = i[idx], j[idx]
+            pandas.DataFrame({'i': i, 'j': j, 'v': arr[i, j]}).to_csv(
+                path, sep='\t', header=False, index=False)
+            tiles[key] = path
+            paths.append(path)
+        reader = cooler.io.SparseTileLoader(tiles, chromsizes, bins)
+        chunks = list(reader)
+        for col in ['bin1_id', 'bin2_id', 'count']:
+            assert np.all(np.concatenate([x[col] for x in chunks]) == ref[col])
+
+        # both orientations of the same tile
+        tiles[(names[1], names[0])] = tiles[(names[0], names[1])] = paths[0]
+        assert_raises(ValueError, cooler.io.SparseTileLoader,
+                      tiles, chromsizes, bins)
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+@with_setup(teardown=teardown_func)
+def test_dense_loader():
+    ref_path = os.path.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    c = cooler.Cooler(ref_path)
+    ref = c.pixels()[:]
+    heatmap = c.matrix(balance=False)[:].toarray()
+
+    def check(reader):
+        assert reader.size() is None
+        chunks = list(reader)
+        assert len(chunks) > 1
+        for col in ['bin1_id', 'bin2_id', 'count']:
+            assert np.all(np.concatenate([x[col] for x in chunks]) == ref[col])
+
+    check(cooler.io.DenseLoader(heatmap, chunksize=100))
+
+    npy_path = os.path.join(tmp, 'test.npy')
+    raw_path = os.path.join(tmp, 'test.bin')
+    try:
+        np.save(npy_path, heatmap)
+        check(cooler.io.DenseLoader(npy_path, chunksize=100))
+        heatmap.tofile(raw_path)
+        check(cooler.io.DenseLoader(raw_path, chunksize=100,
+                                    dtype=heatmap.dtype))
+        assert_raises(ValueError, cooler.io.DenseLoader, raw_path)
+        with h5py.File(testfile_path, 'w') as h5:
+            h5.create_dataset('heatmap', data=heatmap)
+            check(cooler.io.DenseLoader(h5['heatmap'], chunksize=100))
+    finally:
+        os.remove(npy_path)
+        os.remove(raw_path)
+
+
+@with_setup(teardown=teardown_func)
+def test_create_empty():
+    chroms, lengths = zip(*iteritems(chromsizes))
+    bintable = cooler.binnify(chromsizes, 100)
+    n_bins = len(bintable)
+    reader = cooler.io.DenseLoader(np.zeros((n_bins, n_bins)), chunksize=10)
+    assert reader.size() is None
+    with h5py.File(testfile_path, 'w') as h5:
+        cooler.io.create(h5, chroms, lengths, bintable, reader)
+    c = cooler.Cooler(testfile_path)
+    assert c.info['nnz'] == 0
+    with h5py.File(testfile_path, 'r') as h5:
+        for col in ['bin1_id', 'bin2_id', 'count']:
+            assert h5['pixels'][col].shape == (0,)
+        assert np.all(h5['indexes']['bin1_offset'][:] == 0)
+    assert c.matrix(balance=False)[:].nnz == 0
+
+
+def test_cooler_aggregator():
+    ref_path = os.path.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+    c = cooler.Cooler(ref_path)
+    chromtable = c.chroms()[:]
+    chromsizes = pandas.Series(
+        chromtable['length'].values, index=chromtable['name'].values)
+    pixels = c.pixels(join=True)[:]
+
+    # uniform and non-uniform coarsening
+    for new_bins in [cooler.binnify(chromsizes, 6000000),
+                     _alternating_bins(chromsizes, [4000000, 10000000])]:
+        offsets = np.r_[0, np.cumsum(chromsizes.values)]
+        abs_starts = (offsets[chromsizes.index.get_indexer(new_bins['chrom'])]
+                      + new_bins['start'].values)
+        idx1 = chromsizes.index.get_indexer(pixels['chrom1'])
+        idx2 = chromsizes.index.get_indexer(pixels['chrom2'])
+        expected = pandas.DataFrame({
+            'bin1_id': np.searchsorted(
+                abs_starts, offsets[idx1] + pixels['start1'].values,
+                side='right') - 1,
+            'bin2_id': np.searchsorted(
+                abs_starts, offsets[idx2] + pixels['start2'].values,
+                side='right') - 1,
+            'count': pixels['count'].values,
+        }).groupby(['bin1_id', 'bin2_id'])['count'].sum().reset_index()
+
+        reader = cooler.io.CoolerAggregator(ref_path, new_bins, 1000)
+        chunks = list(reader)
+        assert len(chunks) > 1
+        for col in ['bin1_id', 'bin2_id', 'count']:
+            result = np.concatenate([x[col] for x in chunks])
+            assert np.all(result == expected[col].values)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+from six.moves.urllib.request import urlopen
+from six.moves.urllib.error import HTTPError
+import threading
+import os.path as op
+import json
+import io
+
+import numpy as np
+
+from nose.tools import assert_raises
+import cooler
+from cooler.server import CoolerServer, file_names
+
+
+testdir = op.dirname(op.realpath(__file__))
+ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+
+
+def test_server():
+    server = CoolerServer(('127.0.0.1', 0), {'gm': ref_path}, quiet=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    base = 'http://127.0.0.1:{}'.format(server.server_port)
+    c = cooler.Cooler(ref_path)
+
+    def get(path):
+        return urlopen(base + path).read()
+
+    try:
+        assert json.loads(get('/files').decode('utf-8')) == ['gm']
+        info = json.loads(get('/info').decode('utf-8'))
+        assert info['nbins'] == c.info['nbins']
+
+        chroms = np.load(io.BytesIO(get('/chroms?file=gm')))
+        assert list(chroms['name']) == list(c.chroms()[:]['name'])
+
+        bins = np.load(io.BytesIO(get('/bins?region=chr2')))
+        assert np.all(bins['start'] == c.bins().fetch('chr2')['start'])
+
+        mat = np.load(io.BytesIO(get('/matrix?region=chr1&region2=chr2')))
+        assert np.all(mat == c.matrix().fetch('chr1', 'chr2').toarray())
+
+        sp = np.load(io.BytesIO(get('/matrix?region=chr3&sparse=1')))
+        ref = c.matrix().fetch('chr3')
+        assert len(sp['v']) == ref.nnz
+
+        def status(path):
+            try:
+                get(path)
+            except HTTPError as e:
+                return e.code
+            return 200
+
+        assert status('/matrix') == 400
+        assert status('/info?file=missing') == 404
+        assert status('/matrix?region=chrZ') == 404
+        assert status('/matrix?region=chr1:abc') == 400
+        assert status('/bins?region=chrZ') == 404
+        assert status('/tiles?zoom=0&tile=0.0') == 400
+
+        # dense matrices are limited in size, sparse ones are not
+        server.max_pixels = c.extent('chr1')[1] ** 2
+        assert status('/matrix?region=chr1') == 200
+        assert status('/matrix?region=chr1&region2=chr2') == 200
+        assert status('/matrix?region=chr2:0-200000000') == 200
+        server.max_pixels = 100
+        assert status('/matrix?region=chr1') == 413
+        assert status('/matrix?region=chr1&sparse=1') == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_file_names():
+    assert file_names(['a/x.cool', 'y=b/x.cool']) == {
+        'x': 'a/x.cool', 'y': 'b/x.cool'}
+    assert_raises(ValueError, file_names, ['a/x.cool', 'b/x.cool'])
+    assert_raises(ValueError, CoolerServer, ('127.0.0.1', 0),
+                  [ref_path, ref_path])
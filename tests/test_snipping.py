@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+import tempfile
+import shutil
+import os.path as op
+import os
+
+import numpy as np
+import pandas
+import h5py
+
+from nose.tools import assert_raises
+import cooler
+from cooler.snipping import pileup
+
+
+testdir = op.dirname(op.realpath(__file__))
+ref_path = op.join(testdir, 'data', 'GM12878-MboI-matrix.2000kb.cool')
+
+
+def test_pileup():
+    c = cooler.Cooler(ref_path)
+    features = pandas.DataFrame({
+        'chrom': ['chr1', 'chr2', 'chr1', 'chr3'],
+        'start': [50000000, 100000000, 1000000, 20000000],
+        'end': [50010000, 100010000, 1010000, 20010000],
+    })
+    stack, mean = pileup(c, features, 6000000, balance=False, chunksize=2)
+    assert stack.shape == (4, 7, 7)
+    sel = c.matrix()
+    lo = c.offset('chr2:100000000-100000001') - 3
+    assert np.all(stack[1] == sel[lo:lo + 7, lo:lo + 7].toarray())
+
+    # window clipped at the start of chr1 is padded with NaN
+    assert np.all(np.isnan(stack[2][:3])) and np.all(np.isnan(stack[2][:, :3]))
+    assert np.all(stack[2][3:, 3:] == sel[0:4, 0:4].toarray())
+    assert np.allclose(mean, np.nanmean(stack, axis=0))
+
+    # pairs of features and observed/expected
+    pairs = pandas.DataFrame({
+        'chrom1': ['chr1'], 'start1': [50000000], 'end1': [50000000],
+        'chrom2': ['chr1'], 'start2': [70000000], 'end2': [70000000],
+    })
+    stack, mean = pileup(c, pairs, 6000000, balance=False)
+    i0, j0 = c.offset('chr1:50000000-50000001') - 3, \
+        c.offset('chr1:70000000-70000001') - 3
+    assert np.all(stack[0] == sel[i0:i0 + 7, j0:j0 + 7].toarray())
+    expected = pandas.DataFrame({'chrom': 'chr1', 'diag': np.arange(100),
+                                 'balanced.avg': 2.0})
+    stack2, mean2 = pileup(c, pairs, 6000000, balance=False,
+                           expected=expected)
+    assert np.allclose(stack2, stack / 2)
+
+    assert_raises(ValueError, pileup, c, features, 6000000, balance=True)
+
+
+def test_pileup_balanced():
+    path = op.join(tempfile.gettempdir(), 'test.snipping.cool')
+    shutil.copyfile(ref_path, path)
+    try:
+        with h5py.File(path, 'r+') as h5:
+            n = h5['bins']['chrom'].shape[0]
+            weights = np.random.RandomState(0).uniform(0.5, 1.5, n)
+            weights[::7] = np.nan
+            h5['bins'].create_dataset('weight', data=weights)
+        c = cooler.Cooler(path)
+        sel = c.matrix(balance=True)
+
+        # trans pairs, in both orders with respect to the genome
+        pairs = pandas.DataFrame({
+            'chrom1': ['chr1', 'chr10'], 'start1': [100000000, 50000000],
+            'end1': [100000000, 50000000],
+            'chrom2': ['chr10', 'chr1'], 'start2': [50000000, 100000000],
+            'end2': [50000000, 100000000],
+        })
+        stack, mean = pileup(c, pairs, 4000000, balance=True)
+        i0 = c.offset('chr1:100000000-100000001') - 2
+        j0 = c.offset('chr10:50000000-50000001') - 2
+        snip = sel[i0:i0 + 5, j0:j0 + 5].toarray()
+        snip[np.isnan(weights[i0:i0 + 5]), :] = np.nan
+        snip[:, np.isnan(weights[j0:j0 + 5])] = np.nan
+        assert np.allclose(stack[0], snip, equal_nan=True)
+        assert np.allclose(stack[1], snip.T, equal_nan=True)
+    finally:
+        os.remove(path)